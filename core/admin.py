@@ -1,4 +1,11 @@
 from django.contrib import admin
-from .models import Area
+from .models import Area, Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'progress', 'total', 'user', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+
 
 admin.site.register(Area)
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,42 @@
+"""
+Comprobaciones de sistema de la configuración de base de datos.
+
+Se ejecutan con `migrate` y con `python manage.py check --database default`
+(los checks de base de datos no se ejecutan con runserver). Al arrancar,
+la primera conexión ya avisa en el log de los PRAGMAs que no se aplicaron
+(ver db.verify_pragmas).
+"""
+from django.core.checks import Info, Tags, Warning, register
+from django.db import connections
+
+from . import db
+
+
+@register(Tags.database)
+def check_sqlite_pragmas(app_configs, databases=None, **kwargs):
+    """Informa de los PRAGMAs en vigor y avisa de los que no se aplicaron."""
+    messages = []
+    for alias in databases or ():
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            continue
+        connection.ensure_connection()
+        pragmas = db.applicable_pragmas(connection)
+        effective = db.read_pragmas(connection, pragmas)
+
+        for name, (expected, actual) in db.find_mismatches(connection).items():
+            messages.append(Warning(
+                f'La base de datos "{alias}" tiene PRAGMA {name}={actual} '
+                f'en lugar de {expected}.',
+                hint='Compruebe que el fichero admite ese modo (p. ej. WAL en un disco local).',
+                obj=alias,
+                id='core.W001',
+            ))
+
+        summary = ', '.join(f'{name}={value}' for name, value in effective.items())
+        messages.append(Info(
+            f'PRAGMAs en vigor en "{alias}": {summary or "ninguno configurado"}',
+            obj=alias,
+            id='core.I001',
+        ))
+    return messages
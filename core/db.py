@@ -0,0 +1,130 @@
+"""
+Ajustes de las conexiones SQLite.
+
+Cada conexión nueva recibe el perfil de PRAGMAs de `SQLITE_PRAGMAS`
+(modo WAL, espera ante bloqueos, caché, mmap...), al que cada alias de
+DATABASES puede añadir o anular valores con su propia clave 'PRAGMAS'.
+Un valor None omite ese PRAGMA. Con conexiones persistentes
+(CONN_MAX_AGE) el coste se paga una vez por conexión, no por petición.
+
+La primera conexión de cada base de datos en el proceso los lee de vuelta:
+si SQLite no acepta alguno (p. ej. WAL en un sistema de ficheros que no lo
+admite) se avisa en el log. Así se ve al arrancar (runserver abre una
+conexión para comprobar las migraciones, y los workers en su primera
+petición) sin repetir la lectura en cada conexión. La comprobación de
+sistema de checks.py (`check --database default`) informa además de los
+valores en vigor.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+# Valores simbólicos que SQLite devuelve como número al consultarlos
+SYMBOLIC_VALUES = {
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+    'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+}
+BOOLEAN_VALUES = {'ON': 1, 'TRUE': 1, 'YES': 1, 'OFF': 0, 'FALSE': 0, 'NO': 0}
+
+# PRAGMAs que no tienen sentido en una base de datos en memoria (tests)
+FILE_ONLY_PRAGMAS = {'journal_mode', 'mmap_size'}
+
+# (alias, fichero) ya verificados en este proceso
+_verified = set()
+
+_NAME_RE = re.compile(r'^[a-z_]+$')
+_VALUE_RE = re.compile(r'^-?[\w]+$')
+
+
+def get_pragmas(settings_dict):
+    """Perfil efectivo de un alias: el global más los valores propios del alias."""
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    pragmas.update(settings_dict.get('PRAGMAS') or {})
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def normalize(name, value):
+    """Valor tal como lo devuelve `PRAGMA name` al consultarlo."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    if name in SYMBOLIC_VALUES and text.upper() in SYMBOLIC_VALUES[name]:
+        return SYMBOLIC_VALUES[name][text.upper()]
+    if text.upper() in BOOLEAN_VALUES:
+        return BOOLEAN_VALUES[text.upper()]
+    try:
+        return int(text)
+    except ValueError:
+        return text.lower()
+
+
+def applicable_pragmas(connection):
+    pragmas = get_pragmas(connection.settings_dict)
+    if connection.is_in_memory_db():
+        pragmas = {name: value for name, value in pragmas.items() if name not in FILE_ONLY_PRAGMAS}
+    for name, value in pragmas.items():
+        if not _NAME_RE.match(name) or not _VALUE_RE.match(str(value)):
+            raise ValueError(f'PRAGMA no válido en SQLITE_PRAGMAS: {name}={value!r}')
+    return pragmas
+
+
+def read_pragmas(connection, names):
+    """Valores en vigor de los PRAGMAs indicados, leídos de la conexión."""
+    values = {}
+    cursor = connection.connection.cursor()
+    try:
+        for name in names:
+            row = cursor.execute(f'PRAGMA {name}').fetchone()
+            values[name] = normalize(name, row[0]) if row else None
+    finally:
+        cursor.close()
+    return values
+
+
+def find_mismatches(connection):
+    """{nombre: (configurado, en vigor)} de los PRAGMAs que no se aplicaron."""
+    pragmas = applicable_pragmas(connection)
+    effective = read_pragmas(connection, pragmas)
+    return {
+        name: (value, effective[name])
+        for name, value in pragmas.items()
+        if normalize(name, value) != effective[name]
+    }
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    """Aplica el perfil de PRAGMAs a cada conexión SQLite nueva."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = applicable_pragmas(connection)
+    cursor = connection.connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+    key = (connection.alias, str(connection.settings_dict['NAME']))
+    if key not in _verified:
+        _verified.add(key)
+        verify_pragmas(connection)
+
+
+def verify_pragmas(connection):
+    """Avisa en el log de los PRAGMAs que SQLite no aplicó y los devuelve."""
+    mismatches = find_mismatches(connection)
+    for name, (expected, actual) in mismatches.items():
+        logger.warning(
+            'SQLite (%s) no aplicó PRAGMA %s=%s; valor en vigor: %s',
+            connection.alias, name, expected, actual,
+        )
+    return mismatches
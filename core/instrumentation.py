@@ -0,0 +1,168 @@
+"""
+Medición por petición: consultas SQL, tiempo de SQL, de plantillas y de vista.
+
+La middleware RequestInstrumentationMiddleware (core/middleware.py) crea
+un RequestMetrics por petición y lo deja en una variable de contexto; las
+consultas se registran con un execute_wrapper en cada conexión y el
+renderizado de plantillas con un envoltorio de Template.render que solo
+se instala si la instrumentación está activada.
+
+Los percentiles por nombre de URL se guardan en memoria en cada proceso
+(RequestStats), con una ventana de las últimas peticiones.
+"""
+import re
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from django.template.base import Template
+
+
+_current = ContextVar('request_metrics', default=None)
+
+# Literales y listas de parámetros que no cambian la forma de la consulta
+_IN_LIST_RE = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Forma de la consulta sin valores, para detectar consultas repetidas."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """Consultas y tiempos de una petición."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.view_ms = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: mide cada consulta de las conexiones."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.sql_ms += elapsed
+            self.queries.append((sql, elapsed, context['connection'].alias))
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def slowest(self, count):
+        """Las `count` consultas más lentas como (ms, alias, sql)."""
+        ordered = sorted(self.queries, key=lambda query: query[1], reverse=True)
+        return [(elapsed, alias, sql) for sql, elapsed, alias in ordered[:count]]
+
+    def duplicates(self):
+        """{huella: veces} de las consultas que se repiten en la petición."""
+        counts = Counter(fingerprint(sql) for sql, _, _ in self.queries)
+        return {sql: count for sql, count in counts.most_common() if count > 1}
+
+    def server_timing(self, streaming=False):
+        """
+        Valor de la cabecera Server-Timing. Con `streaming` las cifras son
+        parciales (sin el cuerpo, que se genera después) y se indica con la
+        métrica "stream".
+        """
+        parts = [
+            f'db;desc="SQL ({len(self.queries)} consultas)";dur={self.sql_ms:.1f}',
+            f'tpl;desc="Plantillas";dur={self.template_ms:.1f}',
+            f'view;desc="Vista";dur={self.view_ms:.1f}',
+            f'total;desc="Total";dur={self.total_ms:.1f}',
+        ]
+        if streaming:
+            parts.append('stream;desc="Cuerpo en streaming: medición parcial"')
+        return ', '.join(parts)
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+_original_render = Template.render
+
+
+def _timed_render(self, context):
+    """Template.render que suma el tiempo de la plantilla más externa."""
+    metrics = _current.get()
+    if metrics is None:
+        return _original_render(self, context)
+    metrics._template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        metrics._template_depth -= 1
+        # Las plantillas incluidas ya cuentan dentro de la que las incluye
+        if not metrics._template_depth:
+            metrics.template_ms += (time.perf_counter() - started) * 1000
+
+
+def install_template_timing():
+    """Envuelve Template.render; solo se llama con la instrumentación activa."""
+    Template.render = _timed_render
+
+
+class RequestStats:
+    """
+    Duraciones y número de consultas de las últimas `window` peticiones de
+    cada nombre de URL, para calcular percentiles. Solo ve las peticiones
+    de este proceso.
+    """
+
+    PERCENTILES = (50, 90, 95, 99)
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, name, total_ms, query_count):
+        with self._lock:
+            self._samples[name].append((total_ms, query_count))
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        """Una fila por nombre de URL, de la más lenta (p95) a la más rápida."""
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+        rows = []
+        for name, values in samples.items():
+            durations = sorted(duration for duration, _ in values)
+            if len(durations) > 1:
+                cuts = statistics.quantiles(durations, n=100, method='inclusive')
+                percentiles = {f'p{p}': round(cuts[p - 1], 1) for p in self.PERCENTILES}
+            else:
+                percentiles = {f'p{p}': round(durations[0], 1) for p in self.PERCENTILES}
+            rows.append({
+                'name': name,
+                'requests': len(values),
+                **percentiles,
+                'max': round(durations[-1], 1),
+                'queries': round(statistics.fmean(count for _, count in values), 1),
+            })
+        return sorted(rows, key=lambda row: row['p95'], reverse=True)
+
+
+stats = RequestStats()
@@ -0,0 +1,204 @@
+"""
+Cola de trabajos en segundo plano sobre la propia base de datos.
+
+Las tareas se registran con @task('nombre') y se encolan con enqueue();
+el comando run_jobs las ejecuta en un grupo de procesos. No hace falta
+ningún broker: la cola es la tabla core_job, así que funciona en cualquier
+sitio donde funcione SQLite.
+
+Un proceso reserva un trabajo con claim(): pasa a 'running' y
+`available_at` marca el fin de la reserva (JOBS_VISIBILITY_TIMEOUT
+segundos). Cada report_progress() la renueva; si el proceso muere o deja
+de dar noticias, al vencer la reserva otro proceso retoma el trabajo como
+un intento más. Todas las escrituras de un proceso comprueban que la
+reserva sigue siendo suya (mismo número de intento): si otro la ha
+retomado, lanzan LeaseLost y su resultado se descarta.
+
+Un error vuelve a encolar el trabajo con una espera que se duplica en cada
+intento (JOBS_RETRY_DELAY) hasta agotar max_attempts; entonces queda
+'failed' con el error. Las tareas deben poder repetirse sin efectos
+duplicados: sus ficheros de resultado se escriben con result_file(), que
+solo los coloca en su sitio al terminar.
+"""
+import os
+import shutil
+import socket
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+# Nombre -> función que recibe el Job y devuelve el fichero de resultado (o '')
+TASKS = {}
+
+
+class LeaseLost(Exception):
+    """Otro proceso ha retomado el trabajo: este debe abandonarlo."""
+
+
+def task(name):
+    """Registra una tarea: @jobs.task('nonconformities.export')."""
+    def decorator(function):
+        TASKS[name] = function
+        return function
+    return decorator
+
+
+def enqueue(name, params=None, user=None, max_attempts=None):
+    if name not in TASKS:
+        raise LookupError(f'Tarea no registrada: {name}')
+    return Job.objects.create(
+        name=name,
+        params=params or {},
+        user=user,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _lease(job):
+    """Trabajos en los que este intento sigue teniendo la reserva."""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts)
+
+
+def claim(worker=None):
+    """
+    Reserva el siguiente trabajo disponible: pendiente y con su espera
+    cumplida, o en curso con la reserva vencida. Devuelve el Job o None.
+    """
+    now = timezone.now()
+    available = Job.objects.filter(status__in=[Job.PENDING, Job.RUNNING], available_at__lte=now)
+    # Con transaction_mode IMMEDIATE la transacción toma el bloqueo de
+    # escritura al empezar; la condición del UPDATE cubre otros motores
+    with transaction.atomic():
+        for job in available.order_by('available_at', 'id')[:10]:
+            if job.attempts >= job.max_attempts:
+                # Su último intento se ha quedado sin reserva
+                Job.objects.filter(pk=job.pk, attempts=job.attempts, status=Job.RUNNING).update(
+                    status=Job.FAILED, error='El proceso dejó de responder', finished_at=now,
+                )
+                continue
+            claimed = available.filter(pk=job.pk, attempts=job.attempts).update(
+                status=Job.RUNNING,
+                attempts=F('attempts') + 1,
+                worker=worker or worker_name(),
+                available_at=now + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+    return None
+
+
+def report_progress(job, done, total=None):
+    """Guarda el avance y renueva la reserva. Lanza LeaseLost si ya no es suya."""
+    job.progress = done
+    if total is not None:
+        job.total = total
+    renewed = _lease(job).update(
+        progress=job.progress,
+        total=job.total,
+        available_at=timezone.now() + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+    )
+    if not renewed:
+        raise LeaseLost(job.pk)
+
+
+def result_directory(job):
+    return os.path.join(settings.JOBS_RESULT_DIR, str(job.pk))
+
+
+def result_path(job):
+    """Ruta del fichero de resultado de un trabajo terminado, o None."""
+    if job.status != Job.DONE or not job.result:
+        return None
+    path = os.path.join(settings.JOBS_RESULT_DIR, job.result)
+    return path if os.path.isfile(path) else None
+
+
+@contextmanager
+def result_file(job, filename, **open_kwargs):
+    """
+    Abre el fichero de resultado `filename` para escribir. Se escribe con
+    otro nombre y se renombra al cerrar sin errores: un intento fallido no
+    deja un fichero a medias.
+    """
+    directory = result_directory(job)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    partial = f'{path}.{job.attempts}.part'
+    try:
+        with open(partial, 'w', **open_kwargs) as output:
+            yield output
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def _finish(job, result):
+    finished = _lease(job).update(
+        status=Job.DONE,
+        result=f'{job.pk}/{result}' if result else '',
+        progress=F('total') if job.total is not None else job.progress,
+        error='',
+        finished_at=timezone.now(),
+    )
+    if not finished:
+        raise LeaseLost(job.pk)
+
+
+def _fail(job, error):
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        # Reintento con espera exponencial
+        delay = settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+        _lease(job).update(status=Job.PENDING, available_at=now + timedelta(seconds=delay), error=error)
+    else:
+        _lease(job).update(status=Job.FAILED, error=error, finished_at=now)
+
+
+def execute(job_id, attempt):
+    """
+    Ejecuta el intento `attempt` de un trabajo ya reservado. Se llama en
+    los procesos del grupo de run_jobs (o en el propio proceso con
+    --processes 0).
+    """
+    close_old_connections()
+    try:
+        job = Job.objects.filter(pk=job_id, status=Job.RUNNING, attempts=attempt).first()
+        if job is None:
+            return
+        try:
+            function = TASKS.get(job.name)
+            if function is None:
+                raise LookupError(f'Tarea no registrada: {job.name}')
+            result = function(job)
+            _finish(job, result)
+        except LeaseLost:
+            pass
+        except Exception:
+            _fail(job, traceback.format_exc())
+    finally:
+        close_old_connections()
+
+
+def prune(now=None):
+    """Borra los trabajos acabados hace más de JOBS_KEEP_DAYS días y sus ficheros."""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.JOBS_KEEP_DAYS)
+    old = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff)
+    pks = list(old.values_list('pk', flat=True))
+    for pk in pks:
+        shutil.rmtree(os.path.join(settings.JOBS_RESULT_DIR, str(pk)), ignore_errors=True)
+    Job.objects.filter(pk__in=pks).delete()
+    return len(pks)
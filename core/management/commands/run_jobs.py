@@ -0,0 +1,90 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import jobs, worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta los trabajos en segundo plano de la tabla core_job (core/jobs.py) '
+        'en un grupo de procesos. Sigue esperando trabajos nuevos hasta que se '
+        'interrumpe, salvo con --once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.JOBS_PROCESSES,
+            help='Procesos que ejecutan trabajos a la vez (0: en este mismo proceso).',
+        )
+        parser.add_argument('--once', action='store_true', help='Terminar cuando no queden trabajos disponibles.')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help=f'Borrar antes los trabajos acabados hace más de {settings.JOBS_KEEP_DAYS} días.',
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] < 0:
+            raise CommandError('--processes no puede ser negativo')
+        if options['prune']:
+            self.stdout.write(f'{jobs.prune()} trabajos antiguos borrados')
+
+        try:
+            if options['processes'] == 0:
+                count = self.run_inline(options['once'])
+            else:
+                count = self.run_pool(options['processes'], options['once'])
+        except KeyboardInterrupt:
+            # run_pool ya ha esperado a los trabajos en curso
+            count = None
+        if count is not None:
+            self.stdout.write(self.style.SUCCESS(f'✓ {count} trabajos ejecutados'))
+
+    def run_inline(self, once):
+        count = 0
+        while True:
+            job = jobs.claim()
+            if job is None:
+                if once:
+                    return count
+                time.sleep(settings.JOBS_POLL_INTERVAL)
+                continue
+            jobs.execute(job.pk, job.attempts)
+            count += 1
+
+    def run_pool(self, processes, once):
+        """
+        Este proceso reserva los trabajos y los reparte; cada proceso del
+        grupo los ejecuta y guarda su resultado. Los procesos se arrancan
+        con 'spawn' para que no hereden conexiones abiertas a la base de
+        datos.
+        """
+        count = 0
+        running = set()
+        context = multiprocessing.get_context('spawn')
+        connections.close_all()
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=worker.setup) as pool:
+            try:
+                while True:
+                    while len(running) < processes:
+                        job = jobs.claim()
+                        if job is None:
+                            break
+                        running.add(pool.submit(worker.execute, job.pk, job.attempts))
+                        count += 1
+                    if once and not running:
+                        return count
+                    if running:
+                        finished, running = wait(running, settings.JOBS_POLL_INTERVAL, FIRST_COMPLETED)
+                        for future in finished:
+                            future.result()
+                    else:
+                        time.sleep(settings.JOBS_POLL_INTERVAL)
+            except KeyboardInterrupt:
+                self.stderr.write('Interrumpido: esperando a los trabajos en curso...')
+                wait(running)
+                raise
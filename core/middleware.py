@@ -0,0 +1,177 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import instrumentation, profiling
+
+
+logger = logging.getLogger('core.instrumentation')
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Mide cada petición (consultas, tiempo de SQL, de plantillas y de vista)
+    y lo devuelve en la cabecera Server-Timing, que también llega a las
+    peticiones fetch() de scripts.js. Las peticiones más lentas que
+    REQUEST_INSTRUMENTATION_SLOW_MS se registran en el log con sus
+    consultas más lentas y las repetidas.
+
+    En las respuestas en streaming (exportación CSV, flujo de cambios,
+    eventos) el cuerpo se genera después de enviar las cabeceras: su
+    Server-Timing solo cubre hasta que la vista devuelve la respuesta y lo
+    indica con la métrica "stream". La medición sigue mientras se consume
+    el cuerpo y la petición se registra (percentiles y log de lentas) con
+    las cifras completas al terminar el flujo.
+
+    Solo se activa con REQUEST_INSTRUMENTATION = True; si no, Django la
+    descarta al arrancar y no añade ningún coste. Debe ser la última de
+    MIDDLEWARE para que el tiempo de vista no incluya otras middlewares.
+    Funciona igual con WSGI y con ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django ejecutaría un process_view síncrono en otro hilo
+            self.process_view = self.aprocess_view
+        self.slow_ms = settings.REQUEST_INSTRUMENTATION_SLOW_MS
+        self.top_queries = settings.REQUEST_INSTRUMENTATION_TOP_QUERIES
+        instrumentation.stats.window = settings.REQUEST_INSTRUMENTATION_WINDOW
+        instrumentation.install_template_timing()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with self.measure(request) as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with self.measure(request) as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    @contextmanager
+    def measure(self, request):
+        metrics = instrumentation.RequestMetrics()
+        with self.collect(metrics):
+            yield metrics
+            if hasattr(request, '_instrumentation_view_started'):
+                metrics.view_ms = (time.perf_counter() - request._instrumentation_view_started) * 1000
+
+    @contextmanager
+    def collect(self, metrics):
+        """Suma a `metrics` las consultas y plantillas que se ejecuten dentro."""
+        token = instrumentation.activate(metrics)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                yield
+        finally:
+            instrumentation.deactivate(token)
+
+    def finish(self, request, response, metrics):
+        if response.streaming:
+            response['Server-Timing'] = metrics.server_timing(streaming=True)
+            response.streaming_content = self.measure_stream(request, response, metrics)
+            return response
+        response['Server-Timing'] = metrics.server_timing()
+        self.record(request, metrics)
+        return response
+
+    def measure_stream(self, request, response, metrics):
+        """
+        Cuerpo de la respuesta en streaming medido mientras se consume; la
+        petición se registra al terminar o cerrarse el flujo.
+        """
+        if response.is_async:
+            async def content(chunks=response.streaming_content):
+                try:
+                    with self.collect(metrics):
+                        async for chunk in chunks:
+                            yield chunk
+                finally:
+                    self.record(request, metrics)
+        else:
+            def content(chunks=response.streaming_content):
+                try:
+                    with self.collect(metrics):
+                        yield from chunks
+                finally:
+                    self.record(request, metrics)
+        return content()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumentation_view_started = time.perf_counter()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumentation_view_started = time.perf_counter()
+
+    def record(self, request, metrics):
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else 'sin resolver'
+        total_ms = metrics.total_ms
+        instrumentation.stats.record(name, total_ms, len(metrics.queries))
+
+        if total_ms < self.slow_ms:
+            return
+        lines = [
+            f'{request.method} {request.get_full_path()} ({name}): {total_ms:.0f} ms, '
+            f'{len(metrics.queries)} consultas en {metrics.sql_ms:.0f} ms, '
+            f'plantillas {metrics.template_ms:.0f} ms'
+        ]
+        for elapsed, alias, sql in metrics.slowest(self.top_queries):
+            lines.append(f'  {elapsed:8.1f} ms [{alias}] {sql}')
+        for sql, count in metrics.duplicates().items():
+            lines.append(f'  repetida {count} veces: {sql}')
+        logger.warning('Petición lenta: %s', '\n'.join(lines))
+
+
+class RequestProfilingMiddleware:
+    """
+    Perfila la petición cuando un usuario staff lo pide con ?_profile=1 o
+    la cabecera X-Profile (ver core/profiling.py). Para el resto de
+    peticiones solo comprueba que no llevan ese parámetro ni esa cabecera.
+    Debe ir detrás de AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profiler_name = profiling.requested_profiler(request)
+        if profiler_name is None:
+            return self.get_response(request)
+        return profiling.profile_request(request, self.get_response, profiler_name)
+
+    async def __acall__(self, request):
+        value = profiling.requested_value(request)
+        if not value or not hasattr(request, 'auser'):
+            return await self.get_response(request)
+        profiler_name = profiling.profiler_for_user(value, await request.auser())
+        if profiler_name is None:
+            return await self.get_response(request)
+        return await profiling.aprofile_request(request, self.get_response, profiler_name)
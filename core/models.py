@@ -1,4 +1,6 @@
+from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 class Area(models.Model):
     description = models.CharField(max_length=50)
@@ -6,3 +8,47 @@ class Area(models.Model):
 
     def __str__(self):
         return self.description
+
+
+class Job(models.Model):
+    """
+    Trabajo en segundo plano de la cola de core/jobs.py. Mientras está en
+    curso, `available_at` es el fin de la reserva del proceso que lo
+    ejecuta: si llega sin noticias de él, otro proceso lo retoma.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (RUNNING, 'En curso'),
+        (DONE, 'Terminado'),
+        (FAILED, 'Fallido'),
+    ]
+
+    # Nombre de la tarea registrada con @jobs.task
+    name = models.CharField(max_length=100)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    worker = models.CharField(max_length=100, blank=True)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    # Fichero generado, relativo a JOBS_RESULT_DIR
+    result = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Búsqueda del siguiente trabajo disponible
+            models.Index(fields=['status', 'available_at'], name='job_available_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.get_status_display()})'
@@ -0,0 +1,244 @@
+"""
+Perfilado bajo demanda de peticiones de usuarios staff.
+
+Un usuario staff añade ?_profile=1 (o la cabecera X-Profile: 1) a una URL
+y la petición se ejecuta bajo un perfilador. El resultado se guarda como
+fichero .prof (formato de pstats, que también leen snakeviz o gprof2dot)
+en REQUEST_PROFILING_DIR, que funciona como un anillo: se conservan los
+REQUEST_PROFILING_MAX_FILES más recientes.
+
+Hay dos perfiladores, elegibles con el valor del parámetro
+(REQUEST_PROFILING_PROFILERS):
+- cprofile: cProfile de la librería estándar, exacto pero con más
+  sobrecoste en vistas con muchas llamadas.
+- sample: muestreo estadístico de la pila cada pocos milisegundos desde un
+  hilo aparte; casi no altera los tiempos de la petición.
+"""
+import cProfile
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+PROFILE_SUFFIX = '.prof'
+_FILENAME_RE = re.compile(r'^(?P<date>\d{8}T\d{12})--(?P<name>[\w.-]+)--(?P<profiler>\w+)\.prof$')
+
+
+class CProfileProfiler:
+    """Perfilador determinista de la librería estándar."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+
+class SamplingProfiler:
+    """
+    Perfilador estadístico: un hilo toma la pila del hilo de la petición
+    cada `interval` segundos. Cada muestra cuenta como `interval` segundos
+    de tiempo propio de la función en curso y de tiempo acumulado de todas
+    las de la pila, y se guarda en el mismo formato que cProfile (el número
+    de llamadas es el número de muestras).
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.REQUEST_PROFILING_SAMPLE_INTERVAL
+        self.stacks = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, args=(threading.get_ident(),), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                # De la función más externa a la que se estaba ejecutando
+                self.stacks.append(tuple(reversed(stack)))
+
+    def stats(self):
+        """Diccionario en el formato de pstats a partir de las muestras."""
+        stats = {}
+        for stack in self.stacks:
+            seen = set()
+            for depth, function in enumerate(stack):
+                calls, _, own, total, callers = stats.setdefault(function, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(stack) - 1
+                if function not in seen:
+                    seen.add(function)
+                    total += self.interval
+                stats[function] = [calls + 1, calls + 1, own + (self.interval if leaf else 0.0), total, callers]
+                if depth:
+                    caller = stack[depth - 1]
+                    count = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (count[0] + 1, count[1] + 1, count[2], count[3] + self.interval)
+        return {function: tuple(values) for function, values in stats.items()}
+
+    def save(self, path):
+        with open(path, 'wb') as stream:
+            marshal.dump(self.stats(), stream)
+
+
+def get_profiler(name):
+    """Instancia del perfilador `name`, o None si no está configurado."""
+    path = settings.REQUEST_PROFILING_PROFILERS.get(name)
+    return import_string(path)() if path else None
+
+
+def requested_profiler(request):
+    """
+    Nombre del perfilador pedido por la petición, o None. Solo los usuarios
+    staff pueden pedirlo; para el resto el parámetro se ignora.
+    """
+    value = requested_value(request)
+    if not value:
+        return None
+    return profiler_for_user(value, getattr(request, 'user', None))
+
+
+def requested_value(request):
+    """Valor de ?_profile o de la cabecera X-Profile, sin mirar el usuario."""
+    return request.GET.get('_profile') or request.headers.get('X-Profile')
+
+
+def profiler_for_user(value, user):
+    if user is None or not user.is_active or not user.is_staff:
+        return None
+    return 'cprofile' if value in ('1', 'true') else value
+
+
+def profile_directory():
+    return os.fspath(settings.REQUEST_PROFILING_DIR)
+
+
+def save_profile(profiler, url_name, profiler_name):
+    """Guarda el perfil en el anillo y devuelve el nombre del fichero."""
+    directory = profile_directory()
+    os.makedirs(directory, exist_ok=True)
+    name = re.sub(r'[^\w.-]', '.', url_name or 'sin-resolver')
+    filename = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}--{name}--{profiler_name}{PROFILE_SUFFIX}"
+    profiler.save(os.path.join(directory, filename))
+    prune(settings.REQUEST_PROFILING_MAX_FILES)
+    return filename
+
+
+def list_profiles():
+    """Perfiles guardados, del más reciente al más antiguo."""
+    try:
+        filenames = os.listdir(profile_directory())
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for filename in filenames:
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        path = os.path.join(profile_directory(), filename)
+        profiles.append({
+            'filename': filename,
+            'date': datetime.strptime(match['date'], '%Y%m%dT%H%M%S%f'),
+            'url_name': match['name'],
+            'profiler': match['profiler'],
+            'size': os.path.getsize(path),
+        })
+    return sorted(profiles, key=lambda profile: profile['filename'], reverse=True)
+
+
+def profile_path(filename):
+    """Ruta de un perfil guardado, o None si el nombre no es uno de ellos."""
+    if not _FILENAME_RE.match(filename):
+        return None
+    path = os.path.join(profile_directory(), filename)
+    return path if os.path.isfile(path) else None
+
+
+def prune(max_files):
+    """Borra los perfiles más antiguos por encima de `max_files`."""
+    for profile in list_profiles()[max_files:]:
+        try:
+            os.remove(os.path.join(profile_directory(), profile['filename']))
+        except FileNotFoundError:
+            pass
+
+
+def start_profiler(profiler_name):
+    """Perfilador ya iniciado, o None si no existe o no puede activarse."""
+    profiler = get_profiler(profiler_name)
+    if profiler is None:
+        return None
+    try:
+        profiler.start()
+    except ValueError:
+        # cProfile no admite dos perfiles activos a la vez
+        return None
+    return profiler
+
+
+def finish_profile(request, response, profiler, profiler_name, started):
+    """Guarda el perfil y lo anota en las cabeceras de la respuesta."""
+    elapsed = (time.perf_counter() - started) * 1000
+    match = getattr(request, 'resolver_match', None)
+    filename = save_profile(profiler, match.view_name if match else None, profiler_name)
+    response['X-Profile-File'] = filename
+    response['X-Profile-Duration'] = f'{elapsed:.1f}'
+    return response
+
+
+def profile_request(request, get_response, profiler_name):
+    """
+    Ejecuta la petición bajo el perfilador y guarda el resultado. Si el
+    perfilador no existe o no puede activarse, la petición se atiende sin
+    perfilar.
+    """
+    profiler = start_profiler(profiler_name)
+    if profiler is None:
+        return get_response(request)
+    started = time.perf_counter()
+    try:
+        response = get_response(request)
+    finally:
+        profiler.stop()
+    return finish_profile(request, response, profiler, profiler_name, started)
+
+
+async def aprofile_request(request, get_response, profiler_name):
+    """
+    Versión asíncrona de profile_request(). Los perfiladores miden el hilo
+    del bucle de eventos: incluyen las corrutinas de otras peticiones que
+    se ejecuten a la vez y no las consultas, que corren en otro hilo.
+    """
+    profiler = start_profiler(profiler_name)
+    if profiler is None:
+        return await get_response(request)
+    started = time.perf_counter()
+    try:
+        response = await get_response(request)
+    finally:
+        profiler.stop()
+    return finish_profile(request, response, profiler, profiler_name, started)
@@ -0,0 +1,36 @@
+"""
+Enrutado de consultas entre la conexión principal y la de solo lectura.
+
+Las lecturas van al alias 'replica', que abre el mismo fichero SQLite en
+modo solo lectura, de modo que el listado, el detalle y la exportación no
+compiten por la conexión de los escritores. Las escrituras, las
+migraciones y cualquier lectura hecha dentro de una transacción de la
+conexión principal se quedan en 'default': así una vista que lee y
+escribe en transaction.atomic() ve sus propios cambios y bloquea lo que
+lee.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ambos alias son la misma base de datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -1,3 +1,403 @@
-from django.test import TestCase
+import os
+import pstats
+import re
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from django.urls import reverse
+from django.utils import timezone
+
+from nonconformities import benchmark
+
+from . import db, instrumentation, jobs, profiling
+from .checks import check_sqlite_pragmas
+from .models import Area, Job
+from .routers import PrimaryReplicaRouter
+
+
+class SQLiteFileTestMixin:
+    """
+    Alias de conexión adicionales, abiertos sobre un fichero SQLite temporal
+    en lugar de la base de datos de tests.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'test.sqlite3')
+
+    def add_connections(self, **aliases):
+        configured = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            **{
+                alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.path, **options}
+                for alias, options in aliases.items()
+            },
+        })
+        for alias in aliases:
+            connections.settings[alias] = configured[alias]
+            self.addCleanup(self.remove_connection, alias)
+        # Permitir a este test abrir los alias recién creados
+        test_class = type(self)
+        allowed = test_class.databases
+        test_class.databases = allowed | set(aliases)
+        self.addCleanup(setattr, test_class, 'databases', allowed)
+        return [connections[alias] for alias in aliases]
+
+    def remove_connection(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+
+class SQLitePragmaTests(SQLiteFileTestMixin, SimpleTestCase):
+
+    def test_profile_is_applied_to_new_connections(self):
+        connection, = self.add_connections(tuning={})
+        connection.ensure_connection()
+        effective = db.read_pragmas(connection, ['journal_mode', 'synchronous', 'busy_timeout'])
+        self.assertEqual(effective, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000})
+        self.assertEqual(db.find_mismatches(connection), {})
+
+    def test_alias_can_override_or_skip_pragmas(self):
+        connection, = self.add_connections(
+            tuning={'PRAGMAS': {'journal_mode': None, 'cache_size': -2000}}
+        )
+        connection.ensure_connection()
+        effective = db.read_pragmas(connection, ['journal_mode', 'cache_size'])
+        self.assertEqual(effective, {'journal_mode': 'delete', 'cache_size': -2000})
+
+    def test_first_connection_warns_once_about_rejected_pragmas(self):
+        connection, = self.add_connections(tuning={})
+        rejected = {'journal_mode': ('wal', 'delete')}
+        with mock.patch.object(db, 'find_mismatches', return_value=rejected) as find_mismatches:
+            with self.assertLogs('core.db', 'WARNING') as logs:
+                connection.ensure_connection()
+            self.assertIn('PRAGMA journal_mode=wal', logs.output[0])
+            connection.close()
+            with self.assertNoLogs('core.db', 'WARNING'):
+                connection.ensure_connection()
+        self.assertEqual(find_mismatches.call_count, 1)
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL; DROP TABLE x'})
+    def test_invalid_pragma_values_are_rejected(self):
+        connection, = self.add_connections(tuning={})
+        with self.assertRaises(ValueError):
+            connection.ensure_connection()
+
+    def test_immediate_transactions_take_the_write_lock_up_front(self):
+        options = {
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+            'PRAGMAS': {'busy_timeout': 100},
+        }
+        first, second = self.add_connections(first=options, second=options)
+        with transaction.atomic(using='first'):
+            # Sin haber escrito nada, el segundo escritor ya no puede empezar
+            with self.assertRaises(OperationalError):
+                with transaction.atomic(using='second'):
+                    pass
+        with transaction.atomic(using='second'):
+            second.cursor().execute('CREATE TABLE t (id integer)')
+
+
+class SQLitePragmaCheckTests(TestCase):
+
+    def test_check_reports_effective_pragmas(self):
+        messages = check_sqlite_pragmas(None, databases=['default'])
+        self.assertEqual([message.id for message in messages], ['core.I001'])
+        self.assertIn('busy_timeout=20000', messages[0].msg)
+
+
+class ReadReplicaTests(SQLiteFileTestMixin, SimpleTestCase):
+    databases = {'default'}
+
+    def test_reads_go_to_the_replica_outside_write_transactions(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Area), 'replica')
+        self.assertEqual(router.db_for_write(Area), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Area), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+
+    def test_reads_continue_under_a_long_running_write(self):
+        primary, replica = self.add_connections(
+            primary={'OPTIONS': {'transaction_mode': 'IMMEDIATE'}},
+            reader={
+                'NAME': f'file:{self.path}?mode=ro',
+                'PRAGMAS': {'journal_mode': None, 'query_only': 'ON', 'busy_timeout': 100},
+            },
+        )
+        with primary.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (name text)')
+            cursor.execute("INSERT INTO item VALUES ('antes')")
+
+        with transaction.atomic(using='primary'):
+            primary.cursor().execute("INSERT INTO item VALUES ('durante')")
+            started = time.monotonic()
+            with replica.cursor() as cursor:
+                cursor.execute('SELECT name FROM item')
+                self.assertEqual(cursor.fetchall(), [('antes',)])
+            self.assertLess(time.monotonic() - started, 0.1)
+
+        with replica.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM item')
+            self.assertEqual(cursor.fetchone(), (2,))
+            with self.assertRaises(OperationalError):
+                cursor.execute("INSERT INTO item VALUES ('réplica')")
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_INSTRUMENTATION_SLOW_MS=60_000)
+class RequestInstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('auditor', password='secret')
+        cls.staff = User.objects.create_user('supervisor', password='secret', is_staff=True)
+
+    def setUp(self):
+        instrumentation.stats.clear()
+        self.client.force_login(self.user)
+
+    def timings(self, response):
+        return {
+            part.split(';')[0]: float(part.rsplit('dur=', 1)[1])
+            for part in response['Server-Timing'].split(', ')
+        }
+
+    @override_settings(REQUEST_INSTRUMENTATION_SLOW_MS=0)
+    def test_server_timing_for_pages_and_partials(self):
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            response = self.client.get(reverse('nonconformities:nonconformity_list'))
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'db', 'tpl', 'view', 'total'})
+        self.assertGreater(timings['tpl'], 0)
+        self.assertLessEqual(timings['view'], timings['total'])
+        self.assertIn('SQL (', response['Server-Timing'])
+        self.assertIn('(nonconformities:nonconformity_list)', logs.output[0])
+
+        with self.assertLogs('core.instrumentation', 'WARNING'):
+            response = self.client.get(
+                reverse('nonconformities:search'), {'q': 'fuga'}, headers={'x-requested-with': 'XMLHttpRequest'},
+            )
+        self.assertIn('db;', response['Server-Timing'])
+
+        names = {row['name']: row for row in instrumentation.stats.summary()}
+        self.assertEqual(names['nonconformities:nonconformity_list']['requests'], 1)
+        self.assertIn('nonconformities:search', names)
+
+    def test_streaming_responses_are_recorded_when_the_body_ends(self):
+        response = self.client.get(reverse('nonconformities:export'))
+        self.assertIn('stream;desc=', response['Server-Timing'])
+        header_queries = int(re.search(r'SQL \((\d+) consultas\)', response['Server-Timing'])[1])
+        self.assertEqual(instrumentation.stats.summary(), [])
+
+        b''.join(response.streaming_content)
+        [row] = instrumentation.stats.summary()
+        self.assertEqual(row['name'], 'nonconformities:export')
+        # La consulta de las filas se hace al generar el cuerpo
+        self.assertGreater(row['queries'], header_queries)
+
+    async def test_async_streaming_responses_are_recorded_when_the_body_ends(self):
+        await self.async_client.aforce_login(self.user)
+        with benchmark.serving_async_views(True):
+            response = await self.async_client.get(reverse('nonconformities:export'))
+        self.assertIn('stream;desc=', response['Server-Timing'])
+        b''.join([chunk async for chunk in response.streaming_content])
+        [row] = instrumentation.stats.summary()
+        self.assertEqual(row['name'], 'nonconformities:export')
+
+    def test_duplicate_queries_share_a_fingerprint(self):
+        metrics = instrumentation.RequestMetrics()
+        metrics.queries = [
+            ('SELECT * FROM t WHERE id IN (%s, %s, %s)', 1.0, 'default'),
+            ('SELECT * FROM t WHERE id IN (%s)', 3.0, 'default'),
+            ("SELECT * FROM u WHERE name = 'x' AND n = 3", 2.0, 'replica'),
+        ]
+        self.assertEqual(metrics.duplicates(), {'SELECT * FROM t WHERE id IN (...)': 2})
+        self.assertEqual(
+            instrumentation.fingerprint("SELECT * FROM u WHERE name = 'x' AND n = 3"),
+            'SELECT * FROM u WHERE name = ? AND n = ?',
+        )
+        self.assertEqual(metrics.slowest(1), [(3.0, 'default', 'SELECT * FROM t WHERE id IN (%s)')])
+
+    @override_settings(REQUEST_INSTRUMENTATION=False)
+    def test_disabled_middleware_is_not_loaded(self):
+        response = self.client.get(reverse('nonconformities:nonconformity_list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.stats.summary(), [])
+
+    def test_metrics_page_is_staff_only(self):
+        self.client.get(reverse('nonconformities:nonconformity_list'))
+        response = self.client.get(reverse('core:request_metrics'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('core:request_metrics'), {'format': 'json'})
+        names = [row['name'] for row in response.json()['results']]
+        self.assertIn('nonconformities:nonconformity_list', names)
+
+
+class RequestProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('auditor', password='secret')
+        cls.staff = User.objects.create_user('supervisor', password='secret', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            REQUEST_PROFILING_DIR=directory.name, REQUEST_PROFILING_MAX_FILES=2,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.url = reverse('nonconformities:nonconformity_list')
+
+    def test_regular_users_cannot_profile(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, {'_profile': '1'}, headers={'x-profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(profiling.list_profiles(), [])
+
+    def test_staff_profiles_are_kept_in_a_ring(self):
+        self.client.force_login(self.staff)
+        filenames = []
+        for params, headers in (({'_profile': '1'}, {}), ({}, {'x-profile': 'sample'}), ({'_profile': '1'}, {})):
+            response = self.client.get(self.url, params, headers=headers)
+            filenames.append(response['X-Profile-File'])
+            time.sleep(0.001)
+
+        profiles = profiling.list_profiles()
+        self.assertEqual([profile['filename'] for profile in profiles], filenames[:0:-1])
+        self.assertEqual(profiles[0]['url_name'], 'nonconformities.nonconformity_list')
+        self.assertEqual([profile['profiler'] for profile in profiles], ['cprofile', 'sample'])
+
+        stats = pstats.Stats(profiling.profile_path(filenames[2]))
+        self.assertTrue(any(name == 'nonconformity_list' for _, _, name in stats.stats))
+
+    def test_sampling_profiler_writes_pstats_format(self):
+        profiler = profiling.SamplingProfiler(interval=0.001)
+        profiler.start()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        profiler.stop()
+
+        path = os.path.join(profiling.profile_directory(), 'sample.prof')
+        os.makedirs(profiling.profile_directory(), exist_ok=True)
+        profiler.save(path)
+        stats = pstats.Stats(path)
+        self.assertIn('test_sampling_profiler_writes_pstats_format', [name for _, _, name in stats.stats])
+        self.assertGreater(stats.total_tt, 0)
+
+    def test_profile_pages_are_staff_only(self):
+        self.client.force_login(self.staff)
+        filename = self.client.get(self.url, {'_profile': '1'})['X-Profile-File']
+
+        response = self.client.get(reverse('core:profile_list'))
+        self.assertContains(response, filename)
+        response = self.client.get(reverse('core:profile_download', args=[filename]))
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{filename}"')
+        response = self.client.get(reverse('core:profile_download', args=['..settings.py']))
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:profile_download', args=[filename]))
+        self.assertEqual(response.status_code, 302)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(JOBS_RESULT_DIR=directory.name, JOBS_RETRY_DELAY=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.calls = []
+        self.register('tests.write', self.write_result)
+        self.register('tests.fail', self.fail_always)
+
+    def register(self, name, function):
+        jobs.task(name)(function)
+        self.addCleanup(jobs.TASKS.pop, name)
+
+    def write_result(self, job):
+        self.calls.append(job.attempts)
+        jobs.report_progress(job, 1, 2)
+        with jobs.result_file(job, 'result.txt') as output:
+            output.write(job.params['text'])
+        return 'result.txt'
+
+    def fail_always(self, job):
+        raise ValueError('fallo de prueba')
+
+    def test_worker_runs_jobs_and_keeps_their_result(self):
+        job = jobs.enqueue('tests.write', {'text': 'hola'})
+        call_command('run_jobs', once=True, processes=0, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total), (Job.DONE, 2, 2))
+        with open(jobs.result_path(job)) as result:
+            self.assertEqual(result.read(), 'hola')
+        self.assertEqual(os.listdir(jobs.result_directory(job)), ['result.txt'])
+
+    def test_failures_are_retried_with_backoff_until_max_attempts(self):
+        job = jobs.enqueue('tests.fail', max_attempts=2)
+        claimed = jobs.claim()
+        jobs.execute(claimed.pk, claimed.attempts)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('fallo de prueba', job.error)
+        # Hasta que pase la espera no está disponible
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=50))
+        self.assertIsNone(jobs.claim())
+
+        Job.objects.filter(pk=job.pk).update(available_at=timezone.now())
+        claimed = jobs.claim()
+        jobs.execute(claimed.pk, claimed.attempts)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_expired_lease_is_taken_over_and_the_old_attempt_is_discarded(self):
+        job = jobs.enqueue('tests.write', {'text': 'hola'})
+        stale = jobs.claim('proceso-1')
+        self.assertIsNone(jobs.claim('proceso-2'))
+
+        # El primer proceso deja de dar noticias y vence su reserva
+        Job.objects.filter(pk=job.pk).update(available_at=timezone.now() - timedelta(seconds=1))
+        current = jobs.claim('proceso-2')
+        self.assertEqual((current.worker, current.attempts), ('proceso-2', 2))
+        with self.assertRaises(jobs.LeaseLost):
+            jobs.report_progress(stale, 1)
+        jobs.execute(stale.pk, stale.attempts)
+        self.assertEqual(self.calls, [])
+
+        jobs.execute(current.pk, current.attempts)
+        job.refresh_from_db()
+        self.assertEqual((job.status, self.calls), (Job.DONE, [2]))
+
+    def test_job_pages_are_only_for_their_owner(self):
+        owner = User.objects.create_user('auditor')
+        job = jobs.enqueue('tests.write', {'text': 'hola'}, user=owner)
+        jobs.execute(jobs.claim().pk, 1)
+
+        self.client.force_login(owner)
+        data = self.client.get(reverse('core:job_detail', args=[job.pk]), {'format': 'json'}).json()
+        self.assertEqual(data['status'], Job.DONE)
+        response = self.client.get(data['download_url'])
+        self.assertEqual(b''.join(response.streaming_content), b'hola')
+
+        self.client.force_login(User.objects.create_user('otro'))
+        self.assertEqual(self.client.get(reverse('core:job_detail', args=[job.pk])).status_code, 404)
+        self.assertEqual(self.client.get(data['download_url']).status_code, 404)
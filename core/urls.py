@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('metrics/', views.request_metrics, name='request_metrics'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:filename>', views.profile_download, name='profile_download'),
+    path('jobs/<int:pk>/', views.job_detail, name='job_detail'),
+    path('jobs/<int:pk>/download/', views.job_download, name='job_download'),
+]
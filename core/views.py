@@ -1,3 +1,88 @@
+import os
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import render
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from . import instrumentation, jobs, profiling
+from .models import Job
+
+
+@staff_member_required
+@require_GET
+def request_metrics(request):
+    """
+    Percentiles de duración por nombre de URL de este proceso (solo staff).
+    Con ?format=json devuelve los mismos datos en JSON.
+    """
+    rows = instrumentation.stats.summary()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'results': rows})
+    return render(request, 'core/request_metrics.html', {
+        'rows': rows,
+        'window': instrumentation.stats.window,
+    })
+
+
+@staff_member_required
+@require_GET
+def profile_list(request):
+    """Perfiles guardados con ?_profile, del más reciente al más antiguo."""
+    return render(request, 'core/profile_list.html', {
+        'profiles': profiling.list_profiles(),
+        'max_files': settings.REQUEST_PROFILING_MAX_FILES,
+    })
+
+
+@staff_member_required
+@require_GET
+def profile_download(request, filename):
+    path = profiling.profile_path(filename)
+    if path is None:
+        raise Http404('El perfil no existe')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
+
+
+def get_user_job(request, pk):
+    """Trabajo `pk` si es del usuario (o el usuario es staff); si no, 404."""
+    job = Job.objects.filter(pk=pk).first()
+    if job is None or (job.user_id != request.user.pk and not request.user.is_staff):
+        raise Http404('El trabajo no existe')
+    return job
+
+
+@login_required
+@require_GET
+def job_detail(request, pk):
+    """
+    Estado de un trabajo en segundo plano. La página consulta cada pocos
+    segundos ?format=json hasta que termina y muestra el enlace de descarga.
+    """
+    job = get_user_job(request, pk)
+    data = {
+        'id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'total': job.total,
+        'attempts': job.attempts,
+        'download_url': reverse('core:job_download', args=[job.pk]) if jobs.result_path(job) else None,
+        # El detalle del error solo para staff
+        'error': job.error.strip().splitlines()[-1] if job.error and request.user.is_staff else '',
+    }
+    if request.GET.get('format') == 'json':
+        return JsonResponse(data)
+    return render(request, 'core/job_detail.html', {'job': job, 'data': data})
+
 
-# Create your views here.
+@login_required
+@require_GET
+def job_download(request, pk):
+    path = jobs.result_path(get_user_job(request, pk))
+    if path is None:
+        raise Http404('El trabajo no tiene resultado')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
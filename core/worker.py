@@ -0,0 +1,16 @@
+"""
+Funciones que ejecutan los procesos del grupo de run_jobs.
+
+Los procesos se arrancan con 'spawn' y cargan este módulo antes de
+configurar Django, así que no puede importar modelos al cargarse.
+"""
+
+
+def setup():
+    import django
+    django.setup()
+
+
+def execute(job_id, attempt):
+    from . import jobs
+    jobs.execute(job_id, attempt)
@@ -1,7 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
+from django.db import transaction
+from django.db.models import Count
+
+from . import bulk, counters
 # Importa los modelos con los nuevos nombres en inglés
-from .models import Severity, Status, Category, Nonconformity, NonconformityLine
+from .models import Severity, Status, Category, CodeSequence, Nonconformity, NonconformityLine
+from .workflow import get_workflow
 
 # Registro de modelos específicos de 'nonconformities'
 
@@ -13,11 +18,91 @@ class NonconformityAdmin(admin.ModelAdmin):
     list_display = ('code', 'description', 'creation_date', 'status', 'area', 'category')
     list_filter = ('status', 'area', 'category')
     inlines = [NonconformityLineInline]
+    actions = ['close_selected']
+
+    # Los cambios hechos desde el admin también mantienen los contadores del panel
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                old = Nonconformity.objects.filter(pk=obj.pk).values(*counters.SOURCE_FIELDS).first()
+                super().save_model(request, obj, form, change)
+                if old:
+                    counters.record_change(counters.counter_key(old), obj)
+            else:
+                super().save_model(request, obj, form, change)
+                counters.record_created(obj)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            key = counters.counter_key(obj)
+            super().delete_model(request, obj)
+            counters.record_deleted(key)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            rows = queryset.values(*counters.SOURCE_FIELDS).annotate(total=Count('id')).order_by()
+            deltas = {counters.counter_key(row): -row['total'] for row in rows}
+            super().delete_queryset(request, queryset)
+            counters.apply_deltas(deltas)
+
+    # Acciones masivas: mismas reglas y registro de auditoría que el listado
+
+    def report_bulk_results(self, request, results):
+        totals = bulk.summarize(results)
+        level = messages.WARNING if totals[bulk.ERROR] else messages.SUCCESS
+        self.message_user(
+            request,
+            f"{totals[bulk.UPDATED]} actualizadas, {totals[bulk.UNCHANGED]} sin cambios, "
+            f"{totals[bulk.ERROR]} con errores",
+            level,
+        )
+        for result in results:
+            if result['result'] == bulk.ERROR:
+                self.message_user(request, f"{result['code']}: {result['message']}", messages.ERROR)
+
+    @admin.action(description='Cerrar las NC seleccionadas')
+    def close_selected(self, request, queryset):
+        ids = list(queryset.values_list('pk', flat=True))
+        self.report_bulk_results(request, bulk.close(ids, request.user))
+
+    def get_actions(self, request):
+        """Añade una acción "Cambiar estado a ..." por cada estado del flujo."""
+        actions = super().get_actions(request)
+        # Sin acciones (p. ej. en ventanas emergentes) no se añade ninguna
+        if 'close_selected' not in actions:
+            return actions
+        for status in get_workflow().statuses.values():
+            name = f'set_status_{status.pk}'
+            actions[name] = (
+                self.make_status_action(status.pk),
+                name,
+                f'Cambiar estado a "{status}"',
+            )
+        return actions
+
+    def make_status_action(self, status_id):
+        def set_status(modeladmin, request, queryset):
+            status = get_workflow().get(status_id)
+            if status is None:
+                modeladmin.message_user(request, 'Estado no válido', messages.ERROR)
+                return
+            ids = list(queryset.values_list('pk', flat=True))
+            modeladmin.report_bulk_results(request, bulk.change_status(ids, status, request.user))
+        return set_status
+
+class StatusAdmin(admin.ModelAdmin):
+    list_display = ('description', 'is_initial', 'is_terminal', 'is_reopen_target')
+    filter_horizontal = ('allowed_next',)
+
+class CodeSequenceAdmin(admin.ModelAdmin):
+    # Último número asignado por área y año; se puede adelantar, nunca retrasar
+    list_display = ('area_code', 'year', 'last_number')
+    list_filter = ('year',)
 
 
 admin.site.register(Severity)
-admin.site.register(Status)
+admin.site.register(Status, StatusAdmin)
 admin.site.register(Nonconformity, NonconformityAdmin)
 admin.site.register(Category)
-
-
+admin.site.register(CodeSequence, CodeSequenceAdmin)
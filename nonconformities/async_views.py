@@ -0,0 +1,137 @@
+"""
+Variantes asíncronas del listado, del panel de detalle, de la exportación
+y de los cambios en vivo (events.py).
+
+Con ASGI (quality/asgi.py activa NONCONFORMITY_ASYNC_VIEWS) urls.py sirve
+estas vistas en lugar de las de views.py. Las consultas usan el ORM
+asíncrono y la exportación se genera con un iterador asíncrono: mientras
+un cliente lento descarga el CSV, la petición solo ocupa una corrutina en
+espera y no un hilo del servidor.
+
+Lo que depende de la sesión (usuario, mensajes) o de la caché de tablas
+auxiliares, que puede recargarse desde la base de datos, se ejecuta con
+sync_to_async. Con WSGI se siguen usando las vistas síncronas: Django
+tendría que consumir el iterador asíncrono entero antes de responder.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from . import events, views
+from .exports import aiter_csv
+from .models import Nonconformity
+from .pagination import InvalidCursor, KeysetPaginator
+from .workflow import get_workflow
+
+
+def async_condition(etag_func):
+    """
+    Equivalente de @condition(etag_func=...) para vistas asíncronas. El
+    decorador de Django llama a etag_func de forma síncrona, y las
+    funciones de ETag consultan la base de datos.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+async def get_filtered_etag(request, *extra):
+    """Versión asíncrona de views.get_filtered_etag()."""
+    stats = await Nonconformity.objects.filter(
+        **views.get_nonconformity_filters(request.GET)
+    ).aaggregate(last_updated=Max('updated_at'), total=Count('id'))
+    return views.make_filtered_etag(request, views.format_filter_set_version(stats), *extra)
+
+
+async def get_list_etag(request):
+    """Versión asíncrona de views.get_list_etag()."""
+    if await sync_to_async(lambda: len(messages.get_messages(request)))():
+        return None
+    user = await request.auser()
+    return await get_filtered_etag(request, 'list', user.pk, views.get_csrf_secret(request))
+
+
+async def get_detail_partial_etag(request, pk):
+    """Versión asíncrona de views.get_detail_partial_etag()."""
+    if not hasattr(request, '_detail_partial_etag'):
+        updated_at = await (
+            Nonconformity.objects.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+        )
+        request._detail_partial_etag = views.format_detail_partial_etag(pk, updated_at)
+    return request._detail_partial_etag
+
+
+@login_required
+@async_condition(etag_func=get_list_etag)
+async def nonconformity_list(request):
+    last_event_id = events.bus.last_id()
+    paginator = KeysetPaginator(
+        views.get_filtered_nonconformities(request),
+        views.NONCONFORMITY_ORDERING,
+        views.get_page_size(request),
+    )
+    try:
+        page = await paginator.aget_page(
+            after=request.GET.get('after') or None,
+            before=request.GET.get('before') or None,
+        )
+    except InvalidCursor:
+        page = await paginator.aget_page()
+    # La plantilla base lee el usuario y los mensajes de la sesión
+    return await sync_to_async(views.render_nonconformity_list)(request, page, last_event_id)
+
+
+@login_required
+@async_condition(etag_func=lambda request: get_filtered_etag(request, 'export'))
+async def export_nonconformities(request):
+    """Exportación CSV en streaming con un iterador asíncrono."""
+    return views.export_response(aiter_csv(views.get_filtered_nonconformities(request)))
+
+
+@login_required
+@async_condition(etag_func=get_detail_partial_etag)
+async def nonconformity_detail_partial(request, pk):
+    """Panel de detalle, con la misma caché por ETag que la versión síncrona."""
+    etag = await get_detail_partial_etag(request, pk)
+    cache_key = f'nonconformities:detail_partial:{etag}'
+    html = await cache.aget(cache_key) if etag else None
+
+    if html is None:
+        nonconformity = await (
+            Nonconformity.objects.select_related('status', 'severity', 'area', 'category')
+            .filter(pk=pk).afirst()
+        )
+        if nonconformity is None:
+            raise Http404('No existe la No Conformidad')
+        action_page = await views.get_action_paginator(pk).aget_last_page()
+        workflow = await sync_to_async(get_workflow)()
+        html = views.render_detail_partial(nonconformity, action_page, workflow)
+        await cache.aset(cache_key, html, settings.NONCONFORMITY_PARTIAL_CACHE_TIMEOUT)
+
+    return views.detail_partial_response(html)
+
+
+@login_required
+async def nonconformity_events(request):
+    """Cambios del listado en vivo: cada cliente conectado es una corrutina."""
+    return views.events_response(events.astream(views.get_last_event_id(request)))
@@ -0,0 +1,420 @@
+"""
+Benchmark de las vistas principales de No Conformidades.
+
+Cada escenario es una petición (GET o POST) hecha con el cliente de
+pruebas de Django, repetida varias veces sobre datos generados con
+dataset.py. Por escenario se guardan los percentiles de latencia, el
+número de consultas (en todos los alias de base de datos) y el pico de
+memoria de Python (tracemalloc, en una petición aparte para no falsear
+las latencias). El resultado es un diccionario serializable a JSON que
+se puede comparar entre commits (ver compare()).
+
+run_wsgi_clients() y run_asgi_clients() comparan WSGI y ASGI con muchos
+clientes concurrentes que leen la respuesta despacio. Se ejecutan en el
+propio proceso, llamando directamente a los manejadores de Django: con
+WSGI cada petición ocupa uno de los `workers` hilos del servidor hasta
+que el cliente ha leído la respuesta; con ASGI solo ocupa una corrutina.
+"""
+import asyncio
+import importlib
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.db.models import Sum
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+from django.urls import clear_url_caches, reverse
+
+from .models import Nonconformity, NonconformityCounter, Status
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Palabra presente en las descripciones generadas (ver dataset.PROBLEMS)
+SEARCH_WORD = 'calibración'
+
+
+class Scenario:
+    """
+    Petición a medir. `build(i)` devuelve (url, datos) para la repetición i;
+    `weight` reduce las repeticiones de los escenarios caros (exportación).
+    """
+
+    def __init__(self, name, method, build, weight=1.0):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.weight = weight
+
+
+def _most_common(key_field):
+    """Id más frecuente de una dimensión, según los contadores del panel."""
+    return (
+        NonconformityCounter.objects.exclude(**{key_field: 0})
+        .values(key_field).annotate(total=Sum('count'))
+        .order_by('-total').values_list(key_field, flat=True).first()
+    )
+
+
+def collect_sample(seed=0, size=50):
+    """Ids y valores reales sobre los que se construyen los escenarios."""
+    rng = random.Random(seed)
+    last_id = Nonconformity.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    candidates = sorted({rng.randint(1, last_id) for _ in range(size * 2)}) if last_id else []
+    rows = list(
+        Nonconformity.objects.filter(pk__in=candidates)
+        .values('pk', 'code', 'creation_date', 'closure_date')[:size]
+    )
+    if not rows:
+        raise ValueError('No hay No Conformidades sobre las que medir')
+    open_rows = [row for row in rows if row['closure_date'] is None] or rows
+    statuses = list(
+        Status.objects.filter(is_terminal=False).order_by('pk').values_list('pk', flat=True)[:2]
+    )
+    return {
+        'pks': [row['pk'] for row in rows],
+        'open_pk': open_rows[0]['pk'],
+        'statuses': statuses or list(Status.objects.values_list('pk', flat=True)[:2]),
+        'filters': {
+            'status': {'status': _most_common('status_key')},
+            'severity': {'severity': _most_common('severity_key')},
+            'category': {'category': _most_common('category_key')},
+            'area': {'area': _most_common('area_key')},
+            'creation_date': {'creation_date': rows[0]['creation_date'].date().isoformat()},
+            'code': {'code': rows[0]['code'][:-2]},
+            'description': {'description': SEARCH_WORD},
+        },
+    }
+
+
+def build_scenarios(sample):
+    """Escenarios del benchmark: listado (sin filtro y con cada filtro),
+    filas filtradas, panel de detalle, exportación, nueva acción y cambio
+    de estado."""
+    list_url = reverse('nonconformities:nonconformity_list')
+    export_url = reverse('nonconformities:export')
+    pks = sample['pks']
+    statuses = sample['statuses']
+    open_pk = sample['open_pk']
+
+    scenarios = [Scenario('list', 'get', lambda i: (list_url, {}))]
+    for name, params in sample['filters'].items():
+        scenarios.append(Scenario(f'list[{name}]', 'get', lambda i, params=params: (list_url, params)))
+    # Lo que cuesta filtrar desde scripts.js: solo las filas de la tabla
+    rows_url = reverse('nonconformities:nonconformity_rows')
+    scenarios.append(Scenario('rows[description]', 'get', lambda i: (rows_url, sample['filters']['description'])))
+    scenarios += [
+        Scenario('detail_partial', 'get', lambda i: (
+            reverse('nonconformities:nonconformity_detail_partial', args=[pks[i % len(pks)]]), {}
+        )),
+        Scenario('export', 'get', lambda i: (export_url, {}), weight=0.2),
+        Scenario('add_action', 'post', lambda i: (
+            reverse('nonconformities:add_action', args=[pks[i % len(pks)]]),
+            {'action_description': f'Acción registrada por el benchmark ({i})'},
+        )),
+        Scenario('change_status', 'post', lambda i: (
+            reverse('nonconformities:change_status', args=[open_pk]),
+            {'status': statuses[i % len(statuses)]},
+        )),
+    ]
+    return scenarios
+
+
+def _request(client, scenario, i):
+    """Hace la petición y consume el cuerpo (incluido el de streaming)."""
+    url, data = scenario.build(i)
+    response = getattr(client, scenario.method)(url, data)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{scenario.name}: {url} respondió {response.status_code}')
+    return size
+
+
+def _percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def run_scenarios(client, scenarios, repeat=20, aliases=None):
+    """
+    Mide cada escenario `repeat` veces (ponderado por su peso), tras una
+    petición de calentamiento. Las consultas se suman en `aliases` (por
+    defecto, todos). Devuelve {escenario: métricas}.
+    """
+    aliases = list(aliases or connections)
+    results = {}
+    for scenario in scenarios:
+        count = max(1, round(repeat * scenario.weight))
+        _request(client, scenario, 0)
+
+        timings, queries = [], []
+        for i in range(1, count + 1):
+            with ExitStack() as stack:
+                contexts = [
+                    stack.enter_context(CaptureQueriesContext(connections[alias]))
+                    for alias in aliases
+                ]
+                started = time.perf_counter()
+                size = _request(client, scenario, i)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(sum(len(context.captured_queries) for context in contexts))
+
+        tracemalloc.start()
+        try:
+            _request(client, scenario, count + 1)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        results[scenario.name] = {
+            'requests': count,
+            **{f'p{percent}_ms': round(_percentile(timings, percent), 3) for percent in PERCENTILES},
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': max(queries),
+            'peak_memory_kib': round(peak / 1024, 1),
+            'response_bytes': size,
+        }
+    return results
+
+
+@contextmanager
+def temporary_database(path):
+    """
+    Base de datos de pruebas en el fichero `path` (para medir con E/S real
+    y no en memoria) y caché en memoria, que no se mezcla con la caché en
+    disco del servidor. Se destruye al salir.
+    """
+    connections['default'].settings_dict['TEST']['NAME'] = path
+    setup_test_environment()
+    cache_settings = override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    cache_settings.enable()
+    old_config = setup_databases(verbosity=0, interactive=False, aliases=set(connections))
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        cache_settings.disable()
+        teardown_test_environment()
+
+
+def _reload_urlconf():
+    importlib.reload(sys.modules['nonconformities.urls'])
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def serving_async_views(enabled):
+    """Sirve las URL con las vistas asíncronas o las síncronas (ver urls.py)."""
+    try:
+        with override_settings(NONCONFORMITY_ASYNC_VIEWS=enabled):
+            _reload_urlconf()
+            yield
+    finally:
+        _reload_urlconf()
+
+
+class SlowReader:
+    """
+    Cliente que lee `rate` bytes por segundo. El servidor puede adelantar
+    hasta `buffer` bytes sin leer (el búfer del socket); a partir de ahí
+    cada envío espera a que el cliente lea.
+    """
+
+    def __init__(self, rate, buffer=64 * 1024):
+        self.rate = rate
+        self.buffer = buffer
+        self.pending = 0
+        self.size = 0
+
+    def feed(self, size):
+        """Segundos que el servidor queda bloqueado al enviar `size` bytes."""
+        self.size += size
+        self.pending += size
+        if self.pending <= self.buffer:
+            return 0.0
+        blocked, self.pending = (self.pending - self.buffer) / self.rate, self.buffer
+        return blocked
+
+    def drain(self):
+        """Segundos que tarda el cliente en leer lo que queda en el búfer."""
+        pending, self.pending = self.pending, 0
+        return pending / self.rate
+
+
+def _concurrency_summary(latencies, elapsed, sizes, errors):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        **{f'p{percent}_ms': round(_percentile(latencies, percent), 1) for percent in PERCENTILES},
+        'response_bytes': max(sizes, default=0),
+    }
+
+
+def _client_urls(urls, client, requests):
+    return [urls[(client + i) % len(urls)] for i in range(requests)]
+
+
+def run_wsgi_clients(urls, cookie, clients=50, workers=8, requests=5, read_rate=256 * 1024):
+    """
+    `clients` clientes piden `requests` veces las `urls` a un servidor WSGI
+    con `workers` hilos. La latencia incluye la espera hasta que un hilo
+    queda libre y la lectura lenta de la respuesta.
+    """
+    handler = WSGIHandler()
+    slots = threading.Semaphore(workers)
+    latencies, sizes, errors = [], [], []
+    lock = threading.Lock()
+
+    def request(url):
+        parts = urlsplit(url)
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': parts.path, 'QUERY_STRING': parts.query,
+            'SCRIPT_NAME': '', 'SERVER_NAME': 'testserver', 'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie,
+            'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        reader = SlowReader(read_rate)
+        started = time.perf_counter()
+        with slots:
+            body = handler(environ, lambda value, headers, exc_info=None: status.append(value))
+            try:
+                for chunk in body:
+                    time.sleep(reader.feed(len(chunk)))
+            finally:
+                body.close()
+        time.sleep(reader.drain())
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            sizes.append(reader.size)
+            errors.extend(value for value in status if not value.startswith('200'))
+
+    def client(number):
+        for url in _client_urls(urls, number, requests):
+            request(url)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _concurrency_summary(latencies, time.perf_counter() - started, sizes, len(errors))
+
+
+def run_asgi_clients(urls, cookie, clients=50, requests=5, read_rate=256 * 1024):
+    """Como run_wsgi_clients(), contra el manejador ASGI en un bucle de eventos."""
+    handler = ASGIHandler()
+    latencies, sizes, errors = [], [], []
+
+    async def request(url):
+        parts = urlsplit(url)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': parts.path,
+            'raw_path': parts.path.encode(), 'query_string': parts.query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+        }
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        status = []
+        reader = SlowReader(read_rate)
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # El cliente no se desconecta: Django cancela esta espera al terminar
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                await asyncio.sleep(reader.feed(len(message.get('body', b''))))
+
+        started = time.perf_counter()
+        await handler(scope, receive, send)
+        await asyncio.sleep(reader.drain())
+        latencies.append(time.perf_counter() - started)
+        sizes.append(reader.size)
+        errors.extend(value for value in status if value != 200)
+
+    async def client(number):
+        for url in _client_urls(urls, number, requests):
+            await request(url)
+
+    async def main():
+        await asyncio.gather(*(client(number) for number in range(clients)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return _concurrency_summary(latencies, time.perf_counter() - started, sizes, len(errors))
+
+
+def environment():
+    """Datos del entorno para poder comparar resultados entre commits."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+    }
+
+
+def compare(previous, current, metrics=('p50_ms', 'p95_ms', 'queries', 'peak_memory_kib')):
+    """
+    Compara dos resultados y devuelve filas (tamaño, escenario, métrica,
+    antes, después, variación %) de los escenarios presentes en ambos.
+    """
+    rows = []
+    for size, scenarios in current['results'].items():
+        for name, values in scenarios.items():
+            before = previous.get('results', {}).get(size, {}).get(name)
+            if not before:
+                continue
+            for metric in metrics:
+                old, new = before.get(metric), values.get(metric)
+                if old is None or new is None:
+                    continue
+                change = (new - old) / old * 100 if old else 0.0
+                rows.append((size, name, metric, old, new, round(change, 1)))
+    return rows
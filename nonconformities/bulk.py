@@ -0,0 +1,192 @@
+"""
+Cambios de estado y cierres masivos de No Conformidades.
+
+Cada operación trabaja sobre una lista de ids dentro de una única
+transacción: lee en una consulta los datos de todas las NC, valida cada
+una contra el flujo de estados, aplica el cambio con un solo UPDATE y
+registra las líneas de auditoría con un solo bulk_create. El coste en
+consultas depende del número de bloques de ids, no del número de NC.
+
+Como UPDATE y bulk_create no disparan señales, aquí se mantienen también
+el índice de búsqueda, los contadores del panel, updated_at y los eventos
+del listado en vivo.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import counters, events, search
+from .models import Nonconformity, NonconformityLine
+from .workflow import get_workflow
+
+
+# Ids por sentencia, por debajo del límite de parámetros de SQLite
+BATCH_SIZE = 500
+
+ROW_FIELDS = ('id', 'code', 'closure_date') + counters.SOURCE_FIELDS
+
+# Resultado de cada NC
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+ERROR = 'error'
+
+
+def parse_ids(values):
+    """Ids enteros y sin repetir de una lista de valores enviados por POST."""
+    ids, seen = [], set()
+    for value in values:
+        value = str(value).strip()
+        if value.isdigit() and int(value) not in seen:
+            seen.add(int(value))
+            ids.append(int(value))
+    return ids
+
+
+def _batches(ids):
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _load_rows(ids):
+    """Datos actuales de las NC, bloqueados hasta el final de la transacción."""
+    rows = {}
+    for batch in _batches(ids):
+        queryset = Nonconformity.objects.select_for_update().filter(pk__in=batch)
+        rows.update((row['id'], row) for row in queryset.values(*ROW_FIELDS))
+    return rows
+
+
+def _result(nc_id, row, outcome, message):
+    return {
+        'id': nc_id,
+        'code': row['code'] if row else None,
+        'result': outcome,
+        'message': message,
+    }
+
+
+def _apply(rows, updates, status, user, action_text):
+    """
+    Ejecuta el UPDATE sobre las NC aceptadas y registra sus líneas de
+    auditoría, contadores e índice de búsqueda.
+    """
+    ids = [row['id'] for row in rows]
+    for batch in _batches(ids):
+        Nonconformity.objects.filter(pk__in=batch).update(**updates)
+
+    NonconformityLine.objects.bulk_create([
+        NonconformityLine(nonconformity_id=row['id'], action_description=action_text(row), user=user)
+        for row in rows
+    ])
+
+    if status is not None:
+        deltas = Counter()
+        for row in rows:
+            old_key = counters.counter_key(row)
+            deltas[old_key] -= 1
+            deltas[(status.pk,) + old_key[1:]] += 1
+        counters.apply_deltas(deltas)
+
+    # Las líneas nuevas forman parte del texto indexado
+    if search.include_actions():
+        search.index_nonconformities(ids)
+    events.notify_changed(ids)
+
+
+def change_status(ids, status, user):
+    """
+    Pasa las NC `ids` al estado `status` (una instancia del flujo vigente).
+
+    Igual que el cambio individual, fija closure_date al entrar en un estado
+    final y la limpia al salir de uno. Las NC que ya están en ese estado se
+    dejan sin tocar. Devuelve un resultado por id, en el orden recibido.
+    """
+    workflow = get_workflow()
+    results, accepted = [], []
+
+    with transaction.atomic():
+        rows = _load_rows(ids)
+        for nc_id in ids:
+            row = rows.get(nc_id)
+            if row is None:
+                results.append(_result(nc_id, row, ERROR, 'No existe'))
+            elif row['status_id'] == status.pk:
+                results.append(_result(nc_id, row, UNCHANGED, f'Ya está en "{status}"'))
+            elif not workflow.can_transition(row['status_id'], status.pk):
+                old_status = workflow.get(row['status_id'])
+                results.append(_result(
+                    nc_id, row, ERROR, f'No se permite pasar de "{old_status}" a "{status}"'
+                ))
+            else:
+                results.append(_result(nc_id, row, UPDATED, f'Estado actualizado a "{status}"'))
+                accepted.append(row)
+
+        if accepted:
+            now = timezone.now()
+            if workflow.is_terminal(status.pk):
+                closure_date = Coalesce('closure_date', Value(now))
+            else:
+                closure_date = Case(
+                    When(status_id__in=workflow.terminal_ids, then=Value(None)),
+                    default=F('closure_date'),
+                    output_field=DateTimeField(),
+                )
+
+            def action_text(row):
+                return f"Estado cambiado de '{workflow.get(row['status_id'])}' a '{status}'"
+
+            _apply(
+                accepted,
+                {'status_id': status.pk, 'closure_date': closure_date, 'updated_at': now},
+                status, user, action_text,
+            )
+
+    return results
+
+
+def close(ids, user, closing_comment=''):
+    """
+    Cierra las NC `ids`: fija closure_date y las pasa al estado final del
+    flujo (si hay alguno configurado). Las ya cerradas se dejan sin tocar y
+    las que el flujo no permite cerrar desde su estado se rechazan.
+    """
+    workflow = get_workflow()
+    closed_status = workflow.closing
+    action_text = 'No conformidad cerrada.'
+    if closing_comment:
+        action_text += f' Comentario: {closing_comment}'
+
+    results, accepted = [], []
+
+    with transaction.atomic():
+        rows = _load_rows(ids)
+        for nc_id in ids:
+            row = rows.get(nc_id)
+            if row is None:
+                results.append(_result(nc_id, row, ERROR, 'No existe'))
+            elif row['closure_date']:
+                results.append(_result(nc_id, row, UNCHANGED, 'Ya está cerrada'))
+            elif not workflow.can_close(row['status_id']):
+                old_status = workflow.get(row['status_id'])
+                results.append(_result(nc_id, row, ERROR, f'No se permite cerrar desde "{old_status}"'))
+            else:
+                results.append(_result(nc_id, row, UPDATED, 'Cerrada'))
+                accepted.append(row)
+
+        if accepted:
+            now = timezone.now()
+            updates = {'closure_date': now, 'updated_at': now}
+            if closed_status:
+                updates['status_id'] = closed_status.pk
+            _apply(accepted, updates, closed_status, user, lambda row: action_text)
+
+    return results
+
+
+def summarize(results):
+    """Número de NC por resultado: {'updated': n, 'unchanged': n, 'error': n}."""
+    totals = Counter(result['result'] for result in results)
+    return {outcome: totals.get(outcome, 0) for outcome in (UPDATED, UNCHANGED, ERROR)}
@@ -0,0 +1,156 @@
+"""
+Asignación automática de códigos de No Conformidad.
+
+Si el usuario deja el código vacío, se asigna el siguiente de su área y
+año: NC-<codificación del área>-<año>-<número> (NC-<año>-<número> sin
+área). El último número de cada (área, año) se guarda en CodeSequence y
+se incrementa con un UPDATE dentro de la transacción del alta: con SQLite
+(transacciones IMMEDIATE) las altas simultáneas esperan su turno para
+escribir, y en otros motores el UPDATE bloquea la fila. Dos altas nunca
+reciben el mismo número y no hace falta reintentar.
+
+La unicidad de los códigos escritos a mano la garantiza la restricción
+nc_code_unique. Para que un código manual con el mismo formato no choque
+después con uno automático, observe() adelanta la secuencia hasta él.
+
+Con NONCONFORMITY_CODE_BLOCK_SIZE > 1 cada proceso reserva bloques de
+números y los asigna sin escribir en CodeSequence hasta agotarlos. Se
+reduce la contención entre procesos a cambio de huecos en la numeración
+y de que el orden de los números no sea el de creación. observe() no
+puede retirar los números ya reservados por otros procesos, así que un
+número del bloque se comprueba (una lectura del índice único, sin
+bloqueo de escritura) antes de asignarlo y se salta si un código manual
+o importado lo ha ocupado.
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CodeSequence, Nonconformity
+
+
+# Cualquier código que produzca code_prefix(): la codificación del área se
+# usa tal cual (puede llevar '-' o '_') y el año y el número son siempre
+# los dos últimos grupos, así que el área es todo lo que queda delante
+CODE_RE = re.compile(r'^NC-(?:(?P<area>.+)-)?(?P<year>\d{4})-(?P<number>\d+)$')
+
+
+def area_code(area):
+    return area.codification.strip().upper() if area and area.codification else ''
+
+
+def code_prefix(area_code, year):
+    return f'NC-{area_code}-{year}-' if area_code else f'NC-{year}-'
+
+
+def format_code(area_code, year, number):
+    return f'{code_prefix(area_code, year)}{number:0{settings.NONCONFORMITY_CODE_DIGITS}d}'
+
+
+def _highest_existing(area_code, year):
+    """Mayor número ya usado con ese prefijo (solo al crear la secuencia)."""
+    prefix = code_prefix(area_code, year)
+    # Rango sobre el índice único de code; el guion final pasa a ser '.'
+    codes = Nonconformity.objects.filter(
+        code__gte=prefix, code__lt=prefix[:-1] + '.'
+    ).values_list('code', flat=True)
+    numbers = [int(code[len(prefix):]) for code in codes if code[len(prefix):].isdigit()]
+    return max(numbers, default=0)
+
+
+def reserve(area_code, year, count=1):
+    """Reserva `count` números consecutivos y devuelve el primero."""
+    sequence = CodeSequence.objects.filter(area_code=area_code, year=year)
+    with transaction.atomic():
+        if not sequence.update(last_number=F('last_number') + count):
+            start = _highest_existing(area_code, year)
+            try:
+                with transaction.atomic():
+                    CodeSequence.objects.create(area_code=area_code, year=year, last_number=start + count)
+                return start + 1
+            except IntegrityError:
+                # Otra transacción la ha creado a la vez
+                sequence.update(last_number=F('last_number') + count)
+        return sequence.values_list('last_number', flat=True).get() - count + 1
+
+
+def is_code_conflict(exc):
+    """¿El IntegrityError es el de la restricción única del código?"""
+    # SQLite nombra la columna; PostgreSQL, la restricción
+    message = str(exc)
+    return 'nc_code_unique' in message or 'nonconformity.code' in message
+
+
+def observe(codes):
+    """
+    Adelanta las secuencias hasta los códigos dados (altas con código
+    manual o importadas) si tienen el formato automático.
+    """
+    highest = {}
+    for code in codes:
+        match = CODE_RE.match(code)
+        if match:
+            key = (match['area'] or '', int(match['year']))
+            highest[key] = max(highest.get(key, 0), int(match['number']))
+    for (area_code, year), number in highest.items():
+        # Sin secuencia no hace falta: al crearla se parte del mayor código existente
+        CodeSequence.objects.filter(
+            area_code=area_code, year=year, last_number__lt=number
+        ).update(last_number=number)
+
+
+class CodeAllocator:
+    """Asigna códigos, con bloques reservados por proceso si se configuran."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (área, año) -> lista de rangos [siguiente, último] ya confirmados
+        self._blocks = {}
+
+    def allocate(self, area=None, year=None):
+        """Siguiente código del área y año (por defecto, el actual)."""
+        key = (area_code(area), year or timezone.localdate().year)
+        block_size = settings.NONCONFORMITY_CODE_BLOCK_SIZE
+        if block_size <= 1:
+            return format_code(*key, reserve(*key))
+
+        number = self._take(key)
+        while number is not None:
+            code = format_code(*key, number)
+            if not Nonconformity.objects.filter(code=code).exists():
+                return code
+            number = self._take(key)
+
+        first = reserve(*key, block_size)
+        # El resto del bloque solo se usa si la reserva se confirma: si la
+        # transacción se deshace, otro proceso puede recibir esos números
+        transaction.on_commit(lambda: self._add_block(key, first + 1, first + block_size - 1))
+        return format_code(*key, first)
+
+    def _take(self, key):
+        """Siguiente número de los bloques de este proceso, o None."""
+        with self._lock:
+            blocks = self._blocks.get(key)
+            if not blocks:
+                return None
+            number, last = blocks[0]
+            if number == last:
+                blocks.pop(0)
+            else:
+                blocks[0] = [number + 1, last]
+            return number
+
+    def _add_block(self, key, first, last):
+        with self._lock:
+            self._blocks.setdefault(key, []).append([first, last])
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+allocator = CodeAllocator()
@@ -0,0 +1,128 @@
+"""
+Contadores agregados de No Conformidades para el panel.
+
+Cada NC aporta una unidad al contador de su combinación (estado, área,
+severidad, clasificación). Las operaciones que crean o modifican NC
+aplican aquí el incremento correspondiente dentro de su transacción, de
+modo que el panel solo lee la tabla resumen en lugar de agrupar toda la
+tabla de NC.
+
+Borrar una fila de una tabla auxiliar deja sus NC sin ese valor
+(SET_NULL, un UPDATE sin señales): el receptor de signals.py llama a
+move_deleted_lookup() para pasar sus contadores a la clave 0. Cualquier
+otra escritura que esquive estas funciones se corrige con el comando
+reconcile_counters.
+"""
+from collections import Counter
+
+from django.db.models import Count, F
+
+from .models import Nonconformity, NonconformityCounter
+
+
+KEY_FIELDS = ('status_key', 'area_key', 'severity_key', 'category_key')
+SOURCE_FIELDS = ('status_id', 'area_id', 'severity_id', 'category_id')
+
+
+def counter_key(nc):
+    """Clave del contador para una NC (instancia o diccionario con los *_id)."""
+    if isinstance(nc, dict):
+        return tuple(nc[field] or 0 for field in SOURCE_FIELDS)
+    return tuple(getattr(nc, field) or 0 for field in SOURCE_FIELDS)
+
+
+def apply_deltas(deltas):
+    """
+    Suma cada delta {clave: incremento} a su fila resumen, creándola si no
+    existe. Debe llamarse dentro de la transacción que modifica las NC.
+
+    Cuesta un número fijo de consultas sea cual sea el número de claves:
+    una lectura de las filas existentes, un UPDATE con CASE que suma los
+    incrementos en SQL y un INSERT de las que faltan.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # Se acota por los valores de cada campo y se casan las claves en Python
+    candidates = NonconformityCounter.objects.filter(**{
+        f'{field}__in': {key[index] for key in deltas} for index, field in enumerate(KEY_FIELDS)
+    }).only('pk', *KEY_FIELDS)
+    existing = []
+    for counter in candidates:
+        key = tuple(getattr(counter, field) for field in KEY_FIELDS)
+        if key in deltas:
+            counter.count = F('count') + deltas.pop(key)
+            existing.append(counter)
+    if existing:
+        NonconformityCounter.objects.bulk_update(existing, ['count'])
+    if deltas:
+        NonconformityCounter.objects.bulk_create([
+            NonconformityCounter(count=delta, **dict(zip(KEY_FIELDS, key)))
+            for key, delta in deltas.items()
+        ])
+
+
+def record_created(nc):
+    apply_deltas({counter_key(nc): 1})
+
+
+def record_deleted(key):
+    apply_deltas({key: -1})
+
+
+def record_change(old_key, nc):
+    """Mueve una unidad de `old_key` a la clave actual de `nc` si ha cambiado."""
+    new_key = counter_key(nc)
+    if new_key != old_key:
+        apply_deltas({old_key: -1, new_key: 1})
+
+
+def move_deleted_lookup(key_field, pk):
+    """Suma los contadores con `key_field` = `pk` a los de la misma clave con 0."""
+    index = KEY_FIELDS.index(key_field)
+    rows = list(NonconformityCounter.objects.filter(**{key_field: pk}).exclude(count=0))
+    if not rows:
+        return
+    deltas = Counter()
+    for row in rows:
+        key = [getattr(row, field) for field in KEY_FIELDS]
+        deltas[tuple(key)] -= row.count
+        key[index] = 0
+        deltas[tuple(key)] += row.count
+    apply_deltas(deltas)
+
+
+def actual_counts():
+    """Recuentos reales calculados con GROUP BY sobre la tabla de NC."""
+    rows = (
+        Nonconformity.objects
+        .values(*SOURCE_FIELDS)
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    return Counter({counter_key(row): row['total'] for row in rows})
+
+
+def stored_counts():
+    """Recuentos guardados en la tabla resumen (sin las filas a cero)."""
+    rows = NonconformityCounter.objects.exclude(count=0).values_list(*KEY_FIELDS, 'count')
+    return Counter({tuple(row[:4]): row[4] for row in rows})
+
+
+def find_mismatches():
+    """Devuelve {clave: (guardado, real)} para las combinaciones que no cuadran."""
+    actual, stored = actual_counts(), stored_counts()
+    return {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in set(actual) | set(stored)
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
+
+
+def rebuild():
+    """Regenera la tabla resumen completa. Llamar dentro de una transacción."""
+    NonconformityCounter.objects.all().delete()
+    NonconformityCounter.objects.bulk_create([
+        NonconformityCounter(count=total, **dict(zip(KEY_FIELDS, key)))
+        for key, total in actual_counts().items()
+    ])
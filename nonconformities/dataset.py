@@ -0,0 +1,248 @@
+"""
+Generador de datos sintéticos para pruebas de carga y benchmarks.
+
+Crea tablas auxiliares con cardinalidades parecidas a las reales (pocas
+severidades, una docena de clasificaciones, un flujo de cinco estados y
+unas decenas de áreas) y tantas NC como se pidan, con fechas repartidas
+en los últimos años y un número variable de acciones por NC. Todo se
+inserta con bulk_create por lotes, con las fechas en el propio INSERT.
+
+El resultado es reproducible: la misma semilla genera los mismos datos.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Area
+from . import counters, search
+from .importer import explicit_dates
+from .models import Category, Nonconformity, NonconformityLine, Severity, Status
+
+
+SEVERITIES = (('Crítica', 5), ('Mayor', 25), ('Menor', 50), ('Observación', 20))
+
+CATEGORIES = (
+    'Proceso', 'Producto', 'Proveedor', 'Documentación', 'Formación', 'Equipos',
+    'Medio ambiente', 'Seguridad', 'Cliente', 'Auditoría interna', 'Calibración', 'Almacén',
+)
+
+# (descripción, peso, inicial, final); la mayoría de las NC antiguas están cerradas
+STATUSES = (
+    ('Abierta', 10, True, False),
+    ('En análisis', 8, False, False),
+    ('Acción en curso', 12, False, False),
+    ('Pendiente de verificación', 5, False, False),
+    ('Cerrada', 65, False, True),
+)
+
+AREAS = (
+    ('Producción', 'PRO'), ('Calidad', 'CAL'), ('Mantenimiento', 'MAN'), ('Logística', 'LOG'),
+    ('Compras', 'COM'), ('Ingeniería', 'ING'), ('Laboratorio', 'LAB'), ('Almacén', 'ALM'),
+    ('Recursos Humanos', 'RRHH'), ('Expediciones', 'EXP'),
+) + tuple((f'Línea {n}', f'L{n:02d}') for n in range(1, 16))
+
+PROBLEMS = (
+    'Desviación dimensional', 'Fuga de aceite', 'Etiquetado incorrecto', 'Registro incompleto',
+    'Calibración vencida', 'Falta de formación', 'Embalaje dañado', 'Contaminación cruzada',
+    'Temperatura fuera de rango', 'Procedimiento no actualizado', 'Material no conforme',
+    'Retraso en la entrega', 'Reclamación de cliente', 'Residuo mal segregado',
+)
+OBJECTS = (
+    'la prensa hidráulica', 'el lote de producción', 'el certificado del proveedor',
+    'la báscula de recepción', 'el horno de secado', 'la instrucción de trabajo',
+    'el equipo de medición', 'la línea de envasado', 'el almacén de materias primas',
+    'el plan de control', 'la ficha técnica', 'el carro de transporte',
+)
+CONTEXTS = (
+    'detectada en la inspección final', 'durante la auditoría interna',
+    'en el turno de noche', 'tras el mantenimiento preventivo',
+    'en la recepción de materiales', 'según el informe del cliente',
+    'al revisar los registros', 'en la verificación semanal',
+)
+ACTIONS = (
+    'Análisis de causa raíz con el equipo', 'Sustitución de la pieza afectada',
+    'Formación del personal implicado', 'Actualización del procedimiento',
+    'Revisión del plan de control', 'Comunicación al proveedor',
+    'Verificación de la eficacia de la acción', 'Segregación del material afectado',
+    'Recalibración del equipo', 'Inspección reforzada durante un mes',
+)
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def ensure_lookups(users=30):
+    """
+    Crea las tablas auxiliares y los usuarios que falten (por nombre) y
+    devuelve sus ids con el peso de cada uno. Los papeles del flujo solo se
+    asignan si ningún estado existente los tiene ya.
+    """
+    with transaction.atomic():
+        severities = []
+        for name, weight in SEVERITIES:
+            severity = Severity.objects.filter(name=name).first() or Severity.objects.create(name=name)
+            severities.append((severity.pk, weight))
+
+        categories = []
+        for description in CATEGORIES:
+            category = (
+                Category.objects.filter(description=description).first()
+                or Category.objects.create(description=description)
+            )
+            categories.append((category.pk, 1))
+
+        has_initial = Status.objects.filter(is_initial=True).exists()
+        has_reopen = Status.objects.filter(is_reopen_target=True).exists()
+        statuses = []
+        for description, weight, initial, terminal in STATUSES:
+            status = Status.objects.filter(description=description).first()
+            if status is None:
+                status = Status.objects.create(
+                    description=description,
+                    is_initial=initial and not has_initial,
+                    is_reopen_target=initial and not has_reopen,
+                    is_terminal=terminal,
+                )
+            statuses.append((status.pk, weight))
+
+        areas = []
+        for description, codification in AREAS:
+            area = (
+                Area.objects.filter(description=description).first()
+                or Area.objects.create(description=description, codification=codification)
+            )
+            areas.append((area.pk, 1))
+
+        usernames = [f'usuario{n:02d}' for n in range(1, users + 1)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=username, password='!') for username in usernames if username not in existing
+        ])
+        user_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+
+    return {
+        'severity': severities,
+        'category': categories,
+        'status': statuses,
+        'area': areas,
+        'user': [(pk, 1) for pk in user_ids],
+    }
+
+
+def _next_sequence(prefix):
+    """Siguiente número libre para los códigos '<prefix>-NNNNNNN'."""
+    last = (
+        Nonconformity.objects.filter(code__startswith=f'{prefix}-')
+        .order_by('-code').values_list('code', flat=True).first()
+    )
+    if last is None:
+        return 1
+    try:
+        return int(last.rsplit('-', 1)[1]) + 1
+    except ValueError:
+        return 1
+
+
+class DatasetGenerator:
+    """
+    Genera NC y acciones sintéticas.
+
+    `lines_mean` es la media de acciones por NC (distribución geométrica,
+    con muchas NC con pocas acciones y unas pocas con muchas) y
+    `lines_max` su máximo.
+    """
+
+    def __init__(self, seed=0, lines_mean=3.0, lines_max=30, years=3, prefix='SYN',
+                 batch_size=DEFAULT_BATCH_SIZE, users=30):
+        self.random = random.Random(seed)
+        self.lines_mean = lines_mean
+        self.lines_max = lines_max
+        self.years = years
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.users = users
+
+    def _choices(self, weighted, k):
+        ids, weights = zip(*weighted)
+        return self.random.choices(ids, weights=weights, k=k)
+
+    def _line_count(self):
+        if self.lines_mean <= 0:
+            return 0
+        return min(self.lines_max, int(self.random.expovariate(1 / self.lines_mean) + 0.5))
+
+    def _description(self):
+        return (
+            f'{self.random.choice(PROBLEMS)} en {self.random.choice(OBJECTS)} '
+            f'{self.random.choice(CONTEXTS)}'
+        )
+
+    def generate(self, count, progress=None):
+        """
+        Añade `count` NC con sus acciones. Llama a `progress(creadas)` tras
+        cada lote. Devuelve (NC creadas, acciones creadas).
+        """
+        refs = ensure_lookups(self.users)
+        terminal_ids = set(Status.objects.filter(is_terminal=True).values_list('pk', flat=True))
+        sequence = _next_sequence(self.prefix)
+        now = timezone.now()
+        span = timedelta(days=365 * self.years).total_seconds()
+
+        created_ncs = created_lines = 0
+        while created_ncs < count:
+            size = min(self.batch_size, count - created_ncs)
+            columns = {field: self._choices(refs[field], size) for field in refs}
+
+            nonconformities = []
+            for i in range(size):
+                creation_date = now - timedelta(seconds=self.random.random() * span)
+                status_id = columns['status'][i]
+                closure_date = None
+                if status_id in terminal_ids:
+                    closure_date = min(now, creation_date + timedelta(days=self.random.expovariate(1 / 30)))
+                nonconformities.append(Nonconformity(
+                    code=f'{self.prefix}-{sequence + created_ncs + i:07d}',
+                    description=self._description(),
+                    creation_date=creation_date,
+                    closure_date=closure_date,
+                    status_id=status_id,
+                    severity_id=columns['severity'][i],
+                    category_id=columns['category'][i],
+                    area_id=columns['area'][i],
+                    user_id=columns['user'][i],
+                ))
+
+            with transaction.atomic():
+                with explicit_dates(Nonconformity, 'creation_date'):
+                    nonconformities = Nonconformity.objects.bulk_create(nonconformities)
+
+                lines = []
+                for nonconformity in nonconformities:
+                    end = nonconformity.closure_date or now
+                    window = max((end - nonconformity.creation_date).total_seconds(), 1)
+                    for _ in range(self._line_count()):
+                        lines.append(NonconformityLine(
+                            nonconformity_id=nonconformity.pk,
+                            action_description=self.random.choice(ACTIONS),
+                            date=nonconformity.creation_date + timedelta(seconds=self.random.random() * window),
+                            user_id=nonconformity.user_id,
+                        ))
+                with explicit_dates(NonconformityLine, 'date'):
+                    NonconformityLine.objects.bulk_create(lines)
+
+            created_ncs += size
+            created_lines += len(lines)
+            if progress:
+                progress(created_ncs)
+
+        # Con miles de combinaciones por lote es más rápido recalcular los
+        # contadores y el índice de una vez que mantenerlos lote a lote
+        with transaction.atomic():
+            counters.rebuild()
+            if search.is_available():
+                with connection.cursor() as cursor:
+                    search.rebuild_index(cursor)
+
+        return created_ncs, created_lines
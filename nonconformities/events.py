@@ -0,0 +1,251 @@
+"""
+Cambios del listado en vivo: bus de eventos y flujo Server-Sent Events.
+
+Los receptores de señales (signals.py) y las operaciones masivas (bulk.py,
+importer.py) anuncian qué NC han cambiado con notify_changed(); al
+confirmarse la transacción se publica un evento 'change' con sus ids. La
+vista nonconformity_events lo envía a las páginas del listado abiertas,
+que sustituyen solo esas filas y el panel de detalle si está abierto.
+
+El contenido de un evento (la fila ya renderizada de cada NC, o su
+baja) se genera la primera vez que se envía, con una sola consulta para
+todas sus NC, y se reutiliza para el resto de clientes: si no hay nadie
+escuchando, publicar no cuesta ninguna consulta. Con más de
+NONCONFORMITY_EVENTS_MAX_ROWS NC (una importación, por ejemplo) se
+publica 'reset' y los clientes recargan las filas.
+
+Con WSGI cada conexión ocupa un hilo durante
+NONCONFORMITY_EVENTS_STREAM_SECONDS, así que el listado solo se suscribe
+si NONCONFORMITY_LIVE_UPDATES está activo (por defecto, con las vistas
+asíncronas). La página lleva el id del último evento al generarse y lo
+envía como ?last_event_id= para no perder los cambios hechos antes de
+suscribirse.
+
+El bus es de este proceso: con varios procesos cada cliente recibe los
+cambios hechos en el proceso al que está conectado. Los ids de evento
+son "<arranque>-<número>"; los últimos NONCONFORMITY_EVENTS_BUFFER se
+conservan para que un cliente que se reconecta con Last-Event-ID reciba
+lo que se perdió. Si ese id es de otro arranque o ya no está en el
+búfer, recibe 'reset'.
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .models import Nonconformity
+
+
+CHANGE = 'change'
+RESET = 'reset'
+
+# Campos con los que el cliente comprueba si la fila sigue cumpliendo los filtros
+FILTER_FIELDS = {'status': 'status_id', 'severity': 'severity_id', 'category': 'category_id', 'area': 'area_id'}
+
+
+def render_rows(ids):
+    """Contenido de un evento 'change': filas actuales y NC borradas."""
+    from .views import NONCONFORMITY_ROW_FIELDS, NONCONFORMITY_ROW_RELATED
+
+    rows = Nonconformity.objects.filter(pk__in=ids).values(
+        *NONCONFORMITY_ROW_FIELDS, *FILTER_FIELDS.values(), **NONCONFORMITY_ROW_RELATED
+    )
+    changed = [
+        {
+            'id': row['id'],
+            'row': render_to_string(
+                'nonconformities/nonconformity_rows_partial.html', {'nonconformities': [row]}
+            ).strip(),
+            **{name: row[field] for name, field in FILTER_FIELDS.items()},
+        }
+        for row in rows
+    ]
+    present = {row['id'] for row in changed}
+    return {'rows': changed, 'deleted': [pk for pk in ids if pk not in present]}
+
+
+class Event:
+
+    def __init__(self, id, sequence, kind, ids=()):
+        self.id = id
+        self.sequence = sequence
+        self.kind = kind
+        self.ids = tuple(ids)
+        self._data = None
+        self._lock = threading.Lock()
+
+    def data(self):
+        """Contenido del evento, generado una sola vez para todos los clientes."""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = render_rows(self.ids) if self.kind == CHANGE else {}
+        return self._data
+
+    def format(self):
+        """Evento en el formato de text/event-stream."""
+        return f'id: {self.id}\nevent: {self.kind}\ndata: {json.dumps(self.data())}\n\n'
+
+
+class EventBus:
+    """Últimos eventos de este proceso y clientes esperando uno nuevo."""
+
+    def __init__(self, size=500):
+        self.boot = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self._events = deque(maxlen=size)
+        self._condition = threading.Condition()
+        # Clientes asíncronos: asyncio.Event -> su bucle de eventos
+        self._waiters = {}
+
+    def publish(self, kind, ids=()):
+        with self._condition:
+            self.sequence += 1
+            event = Event(f'{self.boot}-{self.sequence}', self.sequence, kind, ids)
+            self._events.append(event)
+            self._condition.notify_all()
+            waiters = list(self._waiters.items())
+        for waiter, loop in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+        return event
+
+    def publish_changes(self, ids):
+        ids = sorted(set(ids))
+        if len(ids) > settings.NONCONFORMITY_EVENTS_MAX_ROWS:
+            return self.publish(RESET)
+        return self.publish(CHANGE, ids)
+
+    def resume(self, last_event_id):
+        """
+        Número desde el que seguir para un cliente que envía Last-Event-ID,
+        o None si se ha perdido eventos y debe recargar. Sin Last-Event-ID
+        empieza en el último evento.
+        """
+        if not last_event_id:
+            return self.sequence
+        boot, _, sequence = last_event_id.partition('-')
+        if boot != self.boot or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        with self._condition:
+            oldest = self._events[0].sequence if self._events else self.sequence + 1
+            if sequence > self.sequence or sequence < oldest - 1:
+                return None
+        return sequence
+
+    def after(self, sequence):
+        """Eventos posteriores a `sequence`, o None si ya no están en el búfer."""
+        with self._condition:
+            if sequence >= self.sequence:
+                return []
+            if not self._events or self._events[0].sequence > sequence + 1:
+                return None
+            return [event for event in self._events if event.sequence > sequence]
+
+    def wait(self, sequence, timeout):
+        """Espera (en este hilo) hasta `timeout` segundos a un evento posterior."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence > sequence, timeout)
+        return self.after(sequence)
+
+    async def await_after(self, sequence, timeout):
+        """Como wait(), sin bloquear el bucle de eventos."""
+        waiter = asyncio.Event()
+        with self._condition:
+            if self.sequence > sequence:
+                return self.after(sequence)
+            self._waiters[waiter] = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                self._waiters.pop(waiter, None)
+        return self.after(sequence)
+
+    def last_id(self):
+        """Id del último evento publicado (la posición actual)."""
+        return f'{self.boot}-{self.sequence}'
+
+    def reset_event(self):
+        """'reset' para un cliente concreto, con el id de la posición actual."""
+        return Event(self.last_id(), self.sequence, RESET)
+
+
+bus = EventBus(settings.NONCONFORMITY_EVENTS_BUFFER)
+
+
+def notify_changed(ids):
+    """Publica el cambio de las NC `ids` cuando se confirme la transacción."""
+    if ids:
+        transaction.on_commit(partial(bus.publish_changes, list(ids)))
+
+
+def _stream_start():
+    return f'retry: {settings.NONCONFORMITY_EVENTS_RETRY_MS}\n\n'
+
+
+def _timeout(deadline):
+    return max(0.0, min(settings.NONCONFORMITY_EVENTS_KEEPALIVE, deadline - time.monotonic()))
+
+
+def stream(last_event_id=None):
+    """
+    Flujo text/event-stream para StreamingHttpResponse. Termina pasados
+    NONCONFORMITY_EVENTS_STREAM_SECONDS para liberar el hilo (con WSGI) y
+    el cliente se reconecta con Last-Event-ID sin perder eventos.
+    """
+    yield _stream_start()
+    sequence = bus.resume(last_event_id)
+    deadline = time.monotonic() + settings.NONCONFORMITY_EVENTS_STREAM_SECONDS
+    while True:
+        if sequence is None:
+            # El cliente se ha perdido eventos: debe recargar las filas
+            event = bus.reset_event()
+            sequence = event.sequence
+            yield event.format()
+        events = bus.wait(sequence, _timeout(deadline))
+        if events is None:
+            sequence = None
+            continue
+        if not events:
+            # Comentario para mantener viva la conexión a través de proxies
+            yield ': ping\n\n'
+        for event in events:
+            sequence = event.sequence
+            yield event.format()
+        if time.monotonic() >= deadline:
+            return
+
+
+async def astream(last_event_id=None):
+    """Versión asíncrona de stream(): un cliente solo ocupa una corrutina."""
+    yield _stream_start()
+    sequence = bus.resume(last_event_id)
+    deadline = time.monotonic() + settings.NONCONFORMITY_EVENTS_STREAM_SECONDS
+    while True:
+        if sequence is None:
+            event = bus.reset_event()
+            sequence = event.sequence
+            yield event.format()
+        events = await bus.await_after(sequence, _timeout(deadline))
+        if events is None:
+            sequence = None
+            continue
+        if not events:
+            yield ': ping\n\n'
+        for event in events:
+            sequence = event.sequence
+            # El contenido de 'change' se genera con el ORM síncrono
+            yield await sync_to_async(event.format)()
+        if time.monotonic() >= deadline:
+            return
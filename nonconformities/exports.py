@@ -0,0 +1,57 @@
+"""
+Generación de la exportación CSV de No Conformidades.
+
+Las filas se leen del cursor en bloques y se convierten a CSV una a una,
+de modo que la memoria usada no crece con el número de filas exportadas.
+"""
+import csv
+
+from django.conf import settings
+
+
+EXPORT_HEADER = ['Código', 'Fecha Apertura', 'Descripción', 'Severidad', 'Clasificación', 'Estado']
+
+
+class Echo:
+    """Pseudo-buffer para csv.writer: devuelve la línea en lugar de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def export_row(nc):
+    """Convierte una fila de get_filtered_nonconformities en columnas CSV."""
+    return [
+        nc['code'],
+        nc['creation_date'].strftime('%d/%m/%Y'),
+        nc['description'],
+        nc['severity_name'] or '',
+        nc['category_description'] or '',
+        nc['status_description'] or '',
+    ]
+
+
+def iter_csv(nonconformities, chunk_size=None):
+    """
+    Genera la exportación línea a línea.
+
+    Recorre el queryset con iterator() para no cachear los resultados.
+    """
+    chunk_size = chunk_size or settings.NONCONFORMITY_EXPORT_CHUNK_SIZE
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for nc in nonconformities.iterator(chunk_size=chunk_size):
+        yield writer.writerow(export_row(nc))
+
+
+async def aiter_csv(nonconformities, chunk_size=None):
+    """
+    Versión asíncrona de iter_csv() para StreamingHttpResponse con ASGI:
+    cada bloque se lee con el ORM asíncrono y, mientras el cliente recibe
+    las líneas, la petición solo ocupa una corrutina.
+    """
+    chunk_size = chunk_size or settings.NONCONFORMITY_EXPORT_CHUNK_SIZE
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    async for nc in nonconformities.aiterator(chunk_size=chunk_size):
+        yield writer.writerow(export_row(nc))
@@ -0,0 +1,177 @@
+"""
+Flujo de cambios para integraciones: NC, acciones y bajas en JSON Lines.
+
+Un consumidor pide páginas con el cursor que recibió en la anterior y
+obtiene lo creado, modificado o borrado desde entonces. Hay tres flujos,
+cada uno recorrido por su índice sobre (fecha, id): NC por updated_at,
+acciones por updated_at y bajas (DeletedRecord) por deleted_at. El cursor
+es opaco y guarda la posición alcanzada en cada flujo; una página lee como
+mucho `limit` + 1 filas de cada uno, las mezcla por fecha y emite las
+`limit` primeras.
+
+Las fechas se asignan al guardar, antes de confirmar la transacción, así
+que una transacción larga puede confirmar cambios con fechas anteriores a
+otros ya leídos. Para no saltárselos solo se entregan los cambios con más
+de NONCONFORMITY_FEED_LAG_SECONDS de antigüedad.
+
+Las bajas se conservan NONCONFORMITY_FEED_TOMBSTONE_DAYS días
+(prune_tombstones); un cursor más antiguo ya no puede saber qué se borró
+y se rechaza con CursorExpired: el consumidor debe empezar de cero.
+"""
+import base64
+import datetime
+import heapq
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DeletedRecord, Nonconformity, NonconformityLine
+from .pagination import InvalidCursor
+
+
+class CursorExpired(Exception):
+    """El cursor es anterior a las bajas conservadas."""
+
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+NONCONFORMITY_FIELDS = (
+    'id', 'code', 'description', 'creation_date', 'closure_date', 'updated_at',
+    'status_id', 'severity_id', 'category_id', 'area_id', 'user_id',
+)
+LINE_FIELDS = ('id', 'nonconformity_id', 'action_description', 'date', 'user_id', 'updated_at')
+
+# Flujo -> (queryset, campo de fecha, columnas). El orden desempata
+# cambios con la misma fecha en flujos distintos.
+STREAMS = {
+    'nonconformity': (Nonconformity.objects.all(), 'updated_at', NONCONFORMITY_FIELDS),
+    'line': (NonconformityLine.objects.all(), 'updated_at', LINE_FIELDS),
+    'deleted': (DeletedRecord.objects.all(), 'deleted_at', ('id', 'kind', 'object_id', 'deleted_at')),
+}
+STREAM_ORDER = {name: index for index, name in enumerate(STREAMS)}
+
+
+def _json_default(value):
+    # isoformat conserva los microsegundos (DjangoJSONEncoder los trunca)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(value):
+    return json.dumps(value, default=_json_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_cursor(positions):
+    raw = _dumps({name: positions.get(name) for name in STREAMS})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Posición (fecha, id) de cada flujo, o None si no se ha leído nada."""
+    if not cursor:
+        return dict.fromkeys(STREAMS)
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        positions = {}
+        for name in STREAMS:
+            position = values[name]
+            if position is None:
+                positions[name] = None
+                continue
+            at, pk = position
+            at = datetime.datetime.fromisoformat(at)
+            if timezone.is_naive(at) or not isinstance(pk, int):
+                raise ValueError(cursor)
+            positions[name] = (at, pk)
+    except (ValueError, TypeError, KeyError) as exc:
+        raise InvalidCursor(cursor) from exc
+    return positions
+
+
+def cursor_since(moment):
+    """Cursor que empieza en `moment`: sirve para una primera sincronización parcial."""
+    return encode_cursor(dict.fromkeys(STREAMS, (moment, 0)))
+
+
+def tombstone_cutoff(now=None):
+    return (now or timezone.now()) - timedelta(days=settings.NONCONFORMITY_FEED_TOMBSTONE_DAYS)
+
+
+def prune_tombstones(now=None):
+    """Borra las bajas más antiguas que el periodo de retención. Devuelve cuántas."""
+    deleted, _ = DeletedRecord.objects.filter(deleted_at__lt=tombstone_cutoff(now)).delete()
+    return deleted
+
+
+def _record(stream, row):
+    if stream == 'deleted':
+        return {'type': row['kind'], 'op': DELETE, 'id': row['object_id'], 'at': row['deleted_at']}
+    return {'type': stream, 'op': UPSERT, 'id': row['id'], 'at': row['updated_at'], 'data': row}
+
+
+class FeedPage:
+    """Una página del flujo y el cursor para pedir la siguiente."""
+
+    def __init__(self, records, cursor, has_more):
+        self.records = records
+        self.cursor = cursor
+        self.has_more = has_more
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def iter_lines(self):
+        """Una línea JSON por registro y una última con el cursor."""
+        for record in self.records:
+            yield _dumps(record) + '\n'
+        yield _dumps({'type': 'cursor', 'cursor': self.cursor, 'has_more': self.has_more}) + '\n'
+
+
+def read_page(cursor=None, limit=None):
+    """
+    Cambios posteriores a `cursor` (None: desde el principio), como mucho
+    `limit` registros. Lanza InvalidCursor o CursorExpired.
+    """
+    limit = limit or settings.NONCONFORMITY_FEED_PAGE_SIZE
+    positions = decode_cursor(cursor)
+    now = timezone.now()
+    deleted_position = positions['deleted']
+    if deleted_position is not None and deleted_position[0] < tombstone_cutoff(now):
+        raise CursorExpired(cursor)
+    until = now - timedelta(seconds=settings.NONCONFORMITY_FEED_LAG_SECONDS)
+
+    candidates = []
+    for name, (queryset, field, fields) in STREAMS.items():
+        queryset = queryset.filter(**{f'{field}__lt': until})
+        if positions[name] is not None:
+            at, pk = positions[name]
+            # Rango sobre el índice en lugar de OR: SQLite lo recorre en orden
+            # y se detiene en el LIMIT, sin ordenar todo lo pendiente
+            queryset = queryset.filter(**{f'{field}__gte': at}).exclude(Q(**{field: at, 'pk__lte': pk}))
+        rows = queryset.order_by(field, 'pk').values(*fields)[:limit + 1]
+        candidates.append([(row[field], STREAM_ORDER[name], row['id'], name, row) for row in rows])
+
+    merged = list(heapq.merge(*candidates, key=lambda item: item[:3]))
+    has_more = len(merged) > limit
+    records = []
+    for at, _, pk, name, row in merged[:limit]:
+        positions[name] = (at, pk)
+        records.append(_record(name, row))
+
+    if not has_more:
+        # Todo lo anterior a `until` está entregado: los flujos sin cambios
+        # avanzan también, y el cursor no caduca mientras se siga leyendo.
+        positions = {
+            name: position if position is not None and position[0] >= until else (until, 0)
+            for name, position in positions.items()
+        }
+    return FeedPage(records, encode_cursor(positions), has_more)
@@ -1,17 +1,108 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from .lookups import lookup_cache
 from .models import Nonconformity, NonconformityLine, Status, Category, Severity
 from core.models import Area
 
 
+# Reglas de validación compartidas por los formularios y la importación
+# masiva (ver importer.py)
+
+def normalize_code(code):
+    """Código en mayúsculas; error si está vacío."""
+    code = (code or '').strip()
+
+    if not code:
+        raise ValidationError('El código es requerido.')
+
+    return code.upper()  # Convertir a mayúsculas
+
+
+def validate_description(description):
+    """Descripción sin espacios sobrantes y con contenido significativo."""
+    description = (description or '').strip()
+
+    if not description:
+        raise ValidationError('La descripción es requerida.')
+
+    if len(description) < 10:
+        raise ValidationError('La descripción debe tener al menos 10 caracteres.')
+
+    return description
+
+
+def validate_action_description(action):
+    """Descripción de una acción de seguimiento, no vacía."""
+    action = (action or '').strip()
+
+    if not action:
+        raise ValidationError('La descripción de la acción es requerida.')
+
+    if len(action) < 5:
+        raise ValidationError('La descripción debe tener al menos 5 caracteres.')
+
+    return action
+
+
+class LookupChoiceIterator(ModelChoiceIterator):
+    """Recorre las opciones desde la caché de tablas auxiliares, sin consultas."""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in lookup_cache.all(self.queryset.model):
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(lookup_cache.all(self.queryset.model)) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(lookup_cache.all(self.queryset.model))
+
+
+class LookupChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField para Severidad, Clasificación, Estado y Área.
+
+    Tanto las opciones como la validación del valor enviado se resuelven
+    con la caché de tablas auxiliares (ver lookups.py).
+    """
+
+    iterator = LookupChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        model = self.queryset.model
+        if isinstance(value, model):
+            return value
+        try:
+            obj = lookup_cache.get(model, int(value))
+        except (TypeError, ValueError):
+            obj = None
+        if obj is None:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return obj
+
+
 class NonconformityForm(forms.ModelForm):
     """
     Formulario para crear y editar No Conformidades.
 
     Incluye validaciones:
-    - Código único (solo en creación)
-    - Campos requeridos: code, description, severity, category
+    - Código opcional en creación: vacío, se asigna automáticamente (codes.py)
+    - Campos requeridos: code (al editar), description, severity, category
     - Closure_date solo si status es "Cerrada"
+
+    La unicidad del código no se comprueba aquí: una consulta previa no
+    evitaría la carrera entre dos altas simultáneas. La garantiza la
+    restricción nc_code_unique al guardar y las vistas convierten el
+    IntegrityError en un error del campo (ver add_code_conflict_error).
     """
 
     class Meta:
@@ -24,13 +115,19 @@ class NonconformityForm(forms.ModelForm):
             'area',
             'status',
         ]
+        field_classes = {
+            'severity': LookupChoiceField,
+            'category': LookupChoiceField,
+            'area': LookupChoiceField,
+            'status': LookupChoiceField,
+        }
         widgets = {
             'description': forms.Textarea(attrs={
                 'rows': 4,
                 'placeholder': 'Describe la no conformidad detectada...'
             }),
             'code': forms.TextInput(attrs={
-                'placeholder': 'Ej: NC-2025-001'
+                'placeholder': 'Vacío para asignarlo automáticamente (NC-ÁREA-2025-001)'
             }),
         }
         labels = {
@@ -44,8 +141,8 @@ class NonconformityForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Hacer campos requeridos
-        self.fields['code'].required = True
+        # Hacer campos requeridos; el código solo al editar
+        self.fields['code'].required = bool(self.instance.pk)
         self.fields['description'].required = True
         self.fields['severity'].required = True
         self.fields['category'].required = True
@@ -57,32 +154,27 @@ class NonconformityForm(forms.ModelForm):
         self.fields['status'].empty_label = "Seleccione estado"
 
     def clean_code(self):
-        """Valida que el código sea único (solo en creación)."""
+        """Código normalizado; vacío en creación para asignarlo automáticamente."""
         code = self.cleaned_data.get('code')
-
-        if not code:
-            raise ValidationError('El código es requerido.')
-
-        # Solo validar unicidad si es una nueva NC (no tiene pk)
-        if not self.instance.pk:
-            if Nonconformity.objects.filter(code=code).exists():
-                raise ValidationError(
-                    f'El código "{code}" ya existe. Por favor, use uno diferente.'
-                )
-
-        return code.upper()  # Convertir a mayúsculas
+        if not self.instance.pk and not (code or '').strip():
+            return ''
+        return normalize_code(code)
+
+    def _get_validation_exclusions(self):
+        # Sin la comprobación de nc_code_unique de Model.validate_constraints()
+        exclude = super()._get_validation_exclusions()
+        exclude.add('code')
+        return exclude
+
+    def add_code_conflict_error(self):
+        """Error del campo código cuando el guardado choca con nc_code_unique."""
+        self.add_error('code', ValidationError(
+            f'El código "{self.instance.code}" ya existe. Por favor, use uno diferente.'
+        ))
 
     def clean_description(self):
         """Valida que la descripción tenga contenido significativo."""
-        description = self.cleaned_data.get('description', '').strip()
-
-        if not description:
-            raise ValidationError('La descripción es requerida.')
-
-        if len(description) < 10:
-            raise ValidationError('La descripción debe tener al menos 10 caracteres.')
-
-        return description
+        return validate_description(self.cleaned_data.get('description', ''))
 
     def clean(self):
         """Validaciones que involucran múltiples campos."""
@@ -119,15 +211,7 @@ class NonconformityLineForm(forms.ModelForm):
 
     def clean_action_description(self):
         """Valida que la descripción de la acción no esté vacía."""
-        action = self.cleaned_data.get('action_description', '').strip()
-
-        if not action:
-            raise ValidationError('La descripción de la acción es requerida.')
-
-        if len(action) < 5:
-            raise ValidationError('La descripción debe tener al menos 5 caracteres.')
-
-        return action
+        return validate_action_description(self.cleaned_data.get('action_description', ''))
 
 
 class NonconformityStatusForm(forms.ModelForm):
@@ -140,6 +224,7 @@ class NonconformityStatusForm(forms.ModelForm):
     class Meta:
         model = Nonconformity
         fields = ['status']
+        field_classes = {'status': LookupChoiceField}
         widgets = {
             'status': forms.Select(attrs={
                 'class': 'form-control status-select'
@@ -214,28 +299,28 @@ class NonconformityFilterForm(forms.Form):
         label='Descripción'
     )
 
-    severity = forms.ModelChoiceField(
+    severity = LookupChoiceField(
         required=False,
         queryset=Severity.objects.all(),
         empty_label='Todas',
         label='Severidad'
     )
 
-    category = forms.ModelChoiceField(
+    category = LookupChoiceField(
         required=False,
         queryset=Category.objects.all(),
         empty_label='Todas',
         label='Clasificación'
     )
 
-    status = forms.ModelChoiceField(
+    status = LookupChoiceField(
         required=False,
         queryset=Status.objects.all(),
         empty_label='Todos',
         label='Estado'
     )
 
-    area = forms.ModelChoiceField(
+    area = LookupChoiceField(
         required=False,
         queryset=Area.objects.all(),
         empty_label='Todas',
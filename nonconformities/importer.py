@@ -0,0 +1,408 @@
+"""
+Importación masiva de No Conformidades y de sus acciones.
+
+Los registros se leen en streaming desde CSV o JSONL y se procesan por
+lotes. Cada lote se valida con las mismas reglas que los formularios
+(ver forms.py), pero de forma vectorizada: los nombres de Severidad,
+Clasificación, Estado y Área se resuelven con mapas en memoria y la
+unicidad de los códigos se comprueba con una sola consulta `code IN`.
+Después se inserta con bulk_create (con las fechas del fichero en el
+propio INSERT) dentro de una transacción por lote,
+de modo que una importación interrumpida puede reanudarse desde el
+último lote confirmado.
+
+La comprobación de códigos se hace dentro de esa transacción: con SQLite
+(transacciones IMMEDIATE) nadie puede insertar entre la consulta y el
+INSERT. En otros motores un alta simultánea con el mismo código aún puede
+chocar con nc_code_unique; entonces el lote entero se informa como
+error y puede volver a importarse.
+
+bulk_create no dispara señales: aquí se mantienen también los contadores
+del panel, el índice de búsqueda, updated_at y los eventos del listado en
+vivo.
+"""
+import csv
+import json
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime, time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.models import Area
+from . import codes, counters, events, search
+from .forms import normalize_code, validate_action_description, validate_description
+from .lookups import lookup_cache
+from .models import Category, Nonconformity, NonconformityLine, Severity, Status
+from .workflow import get_workflow
+
+
+# Ids o códigos por consulta, por debajo del límite de parámetros de SQLite
+QUERY_BATCH_SIZE = 500
+
+# Columnas admitidas, además de los nombres de campo en inglés. Incluye las
+# cabeceras de la exportación CSV para poder reimportarla.
+FIELD_ALIASES = {
+    'código': 'code',
+    'descripción': 'description',
+    'severidad': 'severity',
+    'clasificación': 'category',
+    'estado': 'status',
+    'área': 'area',
+    'fecha apertura': 'creation_date',
+    'fecha cierre': 'closure_date',
+    'usuario': 'user',
+    'acción': 'action_description',
+    'fecha': 'date',
+}
+
+FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(path):
+    return 'jsonl' if str(path).lower().endswith(('.jsonl', '.json')) else 'csv'
+
+
+def _normalize_keys(record):
+    normalized = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        key = key.strip().lower()
+        normalized[FIELD_ALIASES.get(key, key)] = value
+    return normalized
+
+
+def read_records(stream, fmt):
+    """
+    Recorre los registros de un fichero abierto en modo texto, uno a uno.
+
+    Devuelve diccionarios con las claves ya normalizadas (ver FIELD_ALIASES).
+    En JSONL se ignoran las líneas vacías.
+    """
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            yield _normalize_keys(record)
+    else:
+        for line in stream:
+            if line.strip():
+                yield _normalize_keys(json.loads(line))
+
+
+def _text(record, field):
+    value = record.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def parse_moment(value):
+    """
+    Fecha u hora en ISO 8601 o en el formato de la exportación (dd/mm/aaaa).
+    Devuelve None si está vacía; las fechas sin hora son el inicio del día.
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                day = datetime.strptime(value, '%d/%m/%Y').date()
+            moment = datetime.combine(day, time.min)
+    except ValueError:
+        raise ValidationError(f'Fecha no válida: "{value}".')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _name_map(model, *attributes):
+    """nombre normalizado -> pk, a partir de la caché de tablas auxiliares."""
+    names = {}
+    for obj in lookup_cache.all(model):
+        for attribute in attributes:
+            names.setdefault(str(getattr(obj, attribute)).strip().casefold(), obj.pk)
+    return names
+
+
+class LookupMaps:
+    """Mapas nombre -> id de las tablas auxiliares y de los usuarios."""
+
+    def __init__(self):
+        self.severity = _name_map(Severity, 'name')
+        self.category = _name_map(Category, 'description')
+        self.status = _name_map(Status, 'description')
+        self.area = _name_map(Area, 'description', 'codification')
+        self.users = dict(User.objects.values_list('username', 'id'))
+
+    def resolve(self, field, value, label):
+        """Id del valor indicado; None si está vacío y error si no existe."""
+        if not value:
+            return None
+        pk = getattr(self, field).get(value.casefold())
+        if pk is None:
+            raise ValidationError(f'Valor desconocido para {label}: "{value}".')
+        return pk
+
+    def user_id(self, username, default=None):
+        if not username:
+            return default
+        if username not in self.users:
+            raise ValidationError(f'Usuario desconocido: "{username}".')
+        return self.users[username]
+
+
+class BatchResult:
+    """Resultado de un lote: registros creados y errores por número de registro."""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def error(self, number, exc):
+        messages = exc.messages if isinstance(exc, ValidationError) else [str(exc)]
+        self.errors.append((number, ' '.join(messages)))
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), QUERY_BATCH_SIZE):
+        yield values[start:start + QUERY_BATCH_SIZE]
+
+
+def _existing_codes(codes):
+    """Códigos que ya existen, con una consulta `code IN` por bloque."""
+    existing = set()
+    for batch in _chunks(codes):
+        existing.update(Nonconformity.objects.filter(code__in=batch).values_list('code', flat=True))
+    return existing
+
+
+@contextmanager
+def explicit_dates(model, field_name):
+    """
+    Desactiva auto_now_add en `field_name` mientras dura el bloque, para que
+    bulk_create guarde en el propio INSERT la fecha asignada a cada objeto en
+    lugar de la actual. Afecta a la definición del campo en todo el proceso,
+    por eso solo se usa en comandos con proceso propio (importación y
+    generación de datos de prueba).
+    """
+    field = model._meta.get_field(field_name)
+    auto_now_add = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = auto_now_add
+
+
+def _build_lines(actions, maps, default_user_id):
+    """Líneas de acción incluidas en un registro JSONL (lista de textos u objetos)."""
+    lines = []
+    for action in actions or ():
+        if isinstance(action, str):
+            action = {'action_description': action}
+        action = _normalize_keys(action)
+        if 'description' in action and 'action_description' not in action:
+            action['action_description'] = action['description']
+        lines.append((
+            NonconformityLine(
+                action_description=validate_action_description(_text(action, 'action_description')),
+                user_id=maps.user_id(_text(action, 'user'), default_user_id),
+            ),
+            parse_moment(_text(action, 'date')),
+        ))
+    return lines
+
+
+def build_nonconformity(record, maps, workflow, default_user_id=None):
+    """
+    Valida un registro y devuelve (NC sin guardar, fecha de apertura).
+
+    Aplica las reglas de NonconformityForm salvo la unicidad del código,
+    que se comprueba por lotes.
+    """
+    status_id = maps.resolve('status', _text(record, 'status'), 'estado')
+    if status_id is None and workflow.initial:
+        status_id = workflow.initial.pk
+
+    severity_id = maps.resolve('severity', _text(record, 'severity'), 'severidad')
+    category_id = maps.resolve('category', _text(record, 'category'), 'clasificación')
+    if severity_id is None:
+        raise ValidationError('La severidad es requerida.')
+    if category_id is None:
+        raise ValidationError('La clasificación es requerida.')
+
+    creation_date = parse_moment(_text(record, 'creation_date'))
+    closure_date = parse_moment(_text(record, 'closure_date'))
+    if workflow.is_terminal(status_id):
+        closure_date = closure_date or creation_date or timezone.now()
+    elif closure_date:
+        raise ValidationError('Solo las NC en un estado final pueden tener fecha de cierre.')
+
+    nonconformity = Nonconformity(
+        code=normalize_code(_text(record, 'code')),
+        description=validate_description(_text(record, 'description')),
+        severity_id=severity_id,
+        category_id=category_id,
+        status_id=status_id,
+        area_id=maps.resolve('area', _text(record, 'area'), 'área'),
+        closure_date=closure_date,
+        user_id=maps.user_id(_text(record, 'user'), default_user_id),
+    )
+    return nonconformity, creation_date
+
+
+def import_nonconformities(records, maps, default_user_id=None):
+    """
+    Importa un lote de registros [(número, registro), ...] de NC, con sus
+    acciones si el registro trae una lista 'actions'. Los registros con
+    errores se omiten y se informan en el resultado.
+    """
+    result = BatchResult()
+    workflow = get_workflow()
+
+    candidates = []
+    for number, record in records:
+        try:
+            nonconformity, creation_date = build_nonconformity(record, maps, workflow, default_user_id)
+            actions = record.get('actions')
+            if isinstance(actions, str):
+                actions = [actions] if actions.strip() else []
+            lines = _build_lines(actions, maps, default_user_id)
+        except ValidationError as exc:
+            result.error(number, exc)
+            continue
+        candidates.append((number, nonconformity, creation_date, lines))
+
+    if not candidates:
+        return result
+
+    reported = len(result.errors)
+    try:
+        with transaction.atomic():
+            created = _create_nonconformities(candidates, result)
+    except IntegrityError as exc:
+        if not codes.is_code_conflict(exc):
+            raise
+        # Se informa el lote entero en lugar de los errores de código del intento
+        del result.errors[reported:]
+        for number, nonconformity, _, _ in candidates:
+            result.error(number, ValidationError(
+                f'Lote no importado: otro proceso ha creado a la vez uno de sus códigos ({nonconformity.code}).'
+            ))
+        return result
+
+    result.created = len(created)
+    return result
+
+
+def _accept_unique_codes(candidates, result):
+    """Candidatos con un código que no existe ni se repite en el lote."""
+    existing = _existing_codes({candidate[1].code for candidate in candidates})
+    accepted = []
+    for candidate in candidates:
+        number, nonconformity = candidate[:2]
+        if nonconformity.code in existing:
+            result.error(number, ValidationError(
+                f'El código "{nonconformity.code}" ya existe. Por favor, use uno diferente.'
+            ))
+            continue
+        existing.add(nonconformity.code)
+        accepted.append(candidate)
+    return accepted
+
+
+def _create_nonconformities(candidates, result):
+    """Inserta el lote (dentro de su transacción) y devuelve las NC creadas."""
+    accepted = _accept_unique_codes(candidates, result)
+    if not accepted:
+        return []
+
+    now = timezone.now()
+    for _, nonconformity, creation_date, _ in accepted:
+        nonconformity.creation_date = creation_date or now
+
+    with explicit_dates(Nonconformity, 'creation_date'):
+        created = Nonconformity.objects.bulk_create(
+            [candidate[1] for candidate in accepted], batch_size=QUERY_BATCH_SIZE
+        )
+
+    lines = []
+    for nonconformity, candidate in zip(created, accepted):
+        for line, moment in candidate[3]:
+            line.nonconformity_id = nonconformity.pk
+            line.date = moment or now
+            lines.append(line)
+    if lines:
+        with explicit_dates(NonconformityLine, 'date'):
+            NonconformityLine.objects.bulk_create(lines, batch_size=QUERY_BATCH_SIZE)
+
+    counters.apply_deltas(Counter(counters.counter_key(nc) for nc in created))
+    codes.observe([nc.code for nc in created])
+    search.index_nonconformities([nc.pk for nc in created])
+    events.notify_changed([nc.pk for nc in created])
+
+    return created
+
+
+def import_lines(records, maps, default_user_id=None):
+    """
+    Importa un lote de acciones [(número, registro), ...]. Cada registro
+    indica el código de su NC, que debe existir ya.
+    """
+    result = BatchResult()
+
+    candidates = []
+    for number, record in records:
+        try:
+            code = normalize_code(_text(record, 'code'))
+            line = NonconformityLine(
+                action_description=validate_action_description(_text(record, 'action_description')),
+                user_id=maps.user_id(_text(record, 'user'), default_user_id),
+            )
+            candidates.append((number, code, line, parse_moment(_text(record, 'date'))))
+        except ValidationError as exc:
+            result.error(number, exc)
+
+    nonconformity_ids = {}
+    for batch in _chunks({candidate[1] for candidate in candidates}):
+        nonconformity_ids.update(
+            Nonconformity.objects.filter(code__in=batch).values_list('code', 'id')
+        )
+
+    accepted = []
+    for number, code, line, moment in candidates:
+        if code not in nonconformity_ids:
+            result.error(number, ValidationError(f'No existe ninguna NC con el código "{code}".'))
+            continue
+        line.nonconformity_id = nonconformity_ids[code]
+        accepted.append((line, moment))
+
+    if not accepted:
+        return result
+
+    now = timezone.now()
+    for line, moment in accepted:
+        line.date = moment or now
+
+    with transaction.atomic():
+        with explicit_dates(NonconformityLine, 'date'):
+            lines = NonconformityLine.objects.bulk_create(
+                [line for line, _ in accepted], batch_size=QUERY_BATCH_SIZE
+            )
+
+        # Nueva versión de las NC afectadas (caché del panel de detalle)
+        touched = sorted({line.nonconformity_id for line in lines})
+        for batch in _chunks(touched):
+            Nonconformity.objects.filter(pk__in=batch).update(updated_at=now)
+        if search.include_actions():
+            search.index_nonconformities(touched)
+        events.notify_changed(touched)
+
+    result.created = len(lines)
+    return result
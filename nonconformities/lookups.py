@@ -0,0 +1,131 @@
+"""
+Caché en proceso de las tablas auxiliares (Severidad, Clasificación,
+Estado y Área).
+
+Estas tablas casi nunca cambian, así que cada proceso guarda en memoria
+sus filas y solo las vuelve a leer cuando cambia la versión global. La
+versión es un testigo aleatorio guardado en la caché de Django (compartida
+entre procesos), que las señales post_save/post_delete renuevan. En estado
+estable leer un desplegable no cuesta ninguna consulta a la base de datos.
+
+Cada proceso relee la versión de la caché compartida como mucho cada
+NONCONFORMITY_LOOKUP_VERSION_TTL segundos (una petición la consulta varias
+veces: formularios, ETag, flujo de estados). El proceso que invalida ve la
+nueva versión al instante; los demás, pasado ese plazo.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Area
+from .models import Category, Severity, Status
+
+
+LOOKUP_MODELS = (Severity, Category, Status, Area)
+
+VERSION_CACHE_KEY = 'nonconformities:lookups:version'
+
+
+class LookupCache:
+    """Filas de las tablas auxiliares de este proceso, ligadas a una versión."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = ({}, {}, {})
+        # (versión leída de la caché compartida, momento de la lectura)
+        self._seen = None
+
+    def version(self):
+        """Versión global actual; la crea si la caché compartida no la tiene."""
+        seen = self._seen
+        if seen is not None and time.monotonic() - seen[1] < settings.NONCONFORMITY_LOOKUP_VERSION_TTL:
+            return seen[0]
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(VERSION_CACHE_KEY)
+        self._seen = (version, time.monotonic())
+        return version
+
+    def expire(self):
+        """Olvida la versión leída: el siguiente acceso la relee de la caché compartida."""
+        self._seen = None
+
+    def _current(self):
+        """Devuelve (filas, mapas por pk) de la versión vigente, recargando si cambió."""
+        version = self.version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    tables = {
+                        model: tuple(model.objects.order_by('pk'))
+                        for model in LOOKUP_MODELS
+                    }
+                    maps = {
+                        model: {obj.pk: obj for obj in rows}
+                        for model, rows in tables.items()
+                    }
+                    self._data = (tables, maps, {})
+                    self._version = version
+        return self._data
+
+    def all(self, model):
+        """Tupla con todas las filas de la tabla, ordenadas por pk."""
+        return self._current()[0][model]
+
+    def by_pk(self, model):
+        """Diccionario pk -> instancia (no modificar)."""
+        return self._current()[1][model]
+
+    def get(self, model, pk):
+        """Instancia con ese pk o None."""
+        return self.by_pk(model).get(pk)
+
+    def derived(self, name, builder):
+        """
+        Valor calculado a partir de las tablas auxiliares (p. ej. el flujo
+        de estados), memorizado hasta la siguiente invalidación.
+        """
+        derived = self._current()[2]
+        if name not in derived:
+            derived[name] = builder()
+        return derived[name]
+
+    def invalidate(self):
+        """Renueva la versión global; todos los procesos recargarán sus filas."""
+        version = uuid.uuid4().hex
+        cache.set(VERSION_CACHE_KEY, version, timeout=None)
+        self._seen = (version, time.monotonic())
+
+
+lookup_cache = LookupCache()
+
+
+def severities():
+    return lookup_cache.all(Severity)
+
+
+def categories():
+    return lookup_cache.all(Category)
+
+
+def statuses():
+    return lookup_cache.all(Status)
+
+
+def areas():
+    return lookup_cache.all(Area)
+
+
+def invalidate():
+    """
+    Invalida la caché ahora y otra vez al confirmar la transacción, para
+    que ningún proceso guarde bajo la nueva versión datos aún sin confirmar.
+    """
+    lookup_cache.invalidate()
+    transaction.on_commit(lookup_cache.invalidate)
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from nonconformities import benchmark
+from nonconformities.dataset import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia, consultas y memoria de las vistas principales sobre '
+        'datos generados, en una base de datos de pruebas temporal, para uno '
+        'o varios tamaños. Guarda el resultado en JSON para compararlo entre commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000],
+            help='Número de NC de cada medición (p. ej. 1000 100000 1000000).',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Peticiones por escenario.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--lines-mean', type=float, default=3.0)
+        parser.add_argument('--output', default='benchmark.json', help='Fichero JSON de resultados.')
+        parser.add_argument('--compare', help='JSON de una ejecución anterior con el que comparar.')
+
+    def handle(self, *args, **options):
+        sizes = sorted(set(options['sizes']))
+        if sizes[0] < 1 or options['repeat'] < 1:
+            raise CommandError('Los tamaños y --repeat deben ser positivos')
+
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as stream:
+                    previous = json.load(stream)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'No se puede leer {options["compare"]}: {exc}')
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = self.run(sizes, options, os.path.join(directory, 'benchmark.sqlite3'))
+
+        report = {
+            'environment': benchmark.environment(),
+            'settings': {'repeat': options['repeat'], 'seed': options['seed'], 'lines_mean': options['lines_mean']},
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as stream:
+            json.dump(report, stream, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'✓ Resultados guardados en {options["output"]}'))
+
+        if previous:
+            self.stdout.write('Comparación con la ejecución anterior:')
+            for size, name, metric, old, new, change in benchmark.compare(previous, report):
+                self.stdout.write(f'  {size:>8} {name:<24} {metric:<16} {old:>10} → {new:<10} ({change:+.1f}%)')
+
+    def run(self, sizes, options, path):
+        """
+        Crea una base de datos de pruebas en un fichero temporal, la llena
+        hasta cada tamaño y mide.
+        """
+        with benchmark.temporary_database(path):
+            user = User.objects.create_user('benchmark')
+            client = Client()
+            client.force_login(user)
+
+            generator = DatasetGenerator(seed=options['seed'], lines_mean=options['lines_mean'])
+            results, current = {}, 0
+            for size in sizes:
+                started = time.monotonic()
+                generator.generate(size - current)
+                current = size
+                self.stdout.write(f'{size} NC generadas en {time.monotonic() - started:.1f} s; midiendo...')
+
+                scenarios = benchmark.build_scenarios(benchmark.collect_sample(options['seed']))
+                results[str(size)] = benchmark.run_scenarios(client, scenarios, options['repeat'])
+                for name, metrics in results[str(size)].items():
+                    self.stdout.write(
+                        f'  {name:<24} p50 {metrics["p50_ms"]:>9.2f} ms  p95 {metrics["p95_ms"]:>9.2f} ms  '
+                        f'{metrics["queries"]:>3} consultas  {metrics["peak_memory_kib"]:>9.1f} KiB'
+                    )
+            return results
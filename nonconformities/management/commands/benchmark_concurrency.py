@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from nonconformities import benchmark
+from nonconformities.dataset import DatasetGenerator
+
+
+# Vistas que tienen variante asíncrona (ver nonconformities/async_views.py)
+VIEWS = ('export', 'nonconformity_list', 'nonconformity_detail_partial')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el rendimiento de WSGI y ASGI con muchos clientes concurrentes '
+        'que leen la respuesta despacio (por defecto, la exportación CSV), en una '
+        'base de datos de pruebas temporal. Guarda el resultado en JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=2000, help='Número de NC generadas.')
+        parser.add_argument('--views', nargs='+', choices=VIEWS, default=['export'])
+        parser.add_argument('--clients', type=int, default=50, help='Clientes concurrentes.')
+        parser.add_argument('--workers', type=int, default=8, help='Hilos del servidor WSGI.')
+        parser.add_argument('--requests', type=int, default=5, help='Peticiones de cada cliente.')
+        parser.add_argument(
+            '--read-rate', type=int, default=256,
+            help='KiB por segundo que lee cada cliente.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark-concurrency.json', help='Fichero JSON de resultados.')
+
+    def handle(self, *args, **options):
+        for name in ('size', 'clients', 'workers', 'requests', 'read_rate'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} debe ser positivo')
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = self.run(options, os.path.join(directory, 'benchmark.sqlite3'))
+
+        report = {
+            'environment': benchmark.environment(),
+            'settings': {
+                name: options[name]
+                for name in ('size', 'views', 'clients', 'workers', 'requests', 'read_rate', 'seed')
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as stream:
+            json.dump(report, stream, indent=2, ensure_ascii=False)
+
+        for server, metrics in results.items():
+            self.stdout.write(
+                f'  {server:<5} {metrics["throughput_rps"]:>8.2f} peticiones/s  '
+                f'p50 {metrics["p50_ms"]:>9.1f} ms  p95 {metrics["p95_ms"]:>9.1f} ms  '
+                f'{metrics["errors"]} errores'
+            )
+        self.stdout.write(self.style.SUCCESS(f'✓ Resultados guardados en {options["output"]}'))
+
+    def run(self, options, path):
+        with benchmark.temporary_database(path):
+            user = User.objects.create_user('benchmark')
+            client = Client()
+            client.force_login(user)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+            started = time.monotonic()
+            DatasetGenerator(seed=options['seed']).generate(options['size'])
+            self.stdout.write(f'{options["size"]} NC generadas en {time.monotonic() - started:.1f} s; midiendo...')
+
+            sample = benchmark.collect_sample(options['seed'])
+            urls = []
+            for name in options['views']:
+                if name == 'nonconformity_detail_partial':
+                    urls.extend(reverse(f'nonconformities:{name}', args=[pk]) for pk in sample['pks'][:10])
+                else:
+                    urls.append(reverse(f'nonconformities:{name}'))
+            read_rate = options['read_rate'] * 1024
+
+            with benchmark.serving_async_views(False):
+                wsgi = benchmark.run_wsgi_clients(
+                    urls, cookie, options['clients'], options['workers'], options['requests'], read_rate,
+                )
+            with benchmark.serving_async_views(True):
+                asgi = benchmark.run_asgi_clients(
+                    urls, cookie, options['clients'], options['requests'], read_rate,
+                )
+            return {'wsgi': wsgi, 'asgi': asgi}
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from nonconformities.query_plans import (
+    FILTER_COMBINATIONS, ORDERED_COMBINATIONS, explain, find_full_scans, find_unordered_pages, page_querysets,
+)
+from nonconformities.views import filter_nonconformities
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta EXPLAIN QUERY PLAN sobre las combinaciones de filtros del listado '
+        'y falla si alguna recorre entera la tabla de No Conformidades o si las '
+        'páginas del listado sin filtros se ordenan fuera del índice.'
+    )
+
+    def handle(self, *args, **options):
+        problems = {**find_full_scans(), **find_unordered_pages()}
+
+        if options['verbosity'] > 1:
+            for name, params in FILTER_COMBINATIONS.items():
+                self.stdout.write(f'{name}:')
+                for detail in explain(filter_nonconformities(params)):
+                    self.stdout.write(f'    {detail}')
+            for name, params in ORDERED_COMBINATIONS.items():
+                for page, queryset in page_querysets(params).items():
+                    self.stdout.write(f'{name} ({page}):')
+                    for detail in explain(queryset):
+                        self.stdout.write(f'    {detail}')
+
+        if problems:
+            lines = [f'{name}: {" | ".join(plan)}' for name, plan in problems.items()]
+            raise CommandError('Recorridos completos u ordenaciones detectados:\n' + '\n'.join(lines))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {len(FILTER_COMBINATIONS)} combinaciones de filtros usan índices y '
+            f'{len(ORDERED_COMBINATIONS)} listados se ordenan con ellos'
+        ))
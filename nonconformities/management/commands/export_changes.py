@@ -0,0 +1,88 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from nonconformities import feed
+from nonconformities.pagination import InvalidCursor
+
+
+class Command(BaseCommand):
+    help = (
+        'Escribe en JSON Lines las NC, acciones y bajas posteriores a un cursor '
+        '(el mismo flujo que /nonconformities/feed/), página a página. Con '
+        '--state el cursor se lee de un fichero y se guarda al terminar, para '
+        'ejecuciones periódicas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cursor', help='Cursor de la última ejecución (por defecto, desde el principio).')
+        parser.add_argument('--since', help='Empezar en esta fecha (AAAA-MM-DD HH:MM) en lugar de un cursor.')
+        parser.add_argument('--state', help='Fichero del que leer el cursor y en el que guardar el nuevo.')
+        parser.add_argument('--output', default='-', help='Fichero de salida (por defecto, la salida estándar).')
+        parser.add_argument('--limit', type=int, default=settings.NONCONFORMITY_FEED_PAGE_SIZE, help='Registros por página.')
+        parser.add_argument('--max-pages', type=int, help='Parar tras este número de páginas.')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help=f'Purgar antes las bajas de más de {settings.NONCONFORMITY_FEED_TOMBSTONE_DAYS} días.',
+        )
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1 or (options['max_pages'] is not None and options['max_pages'] < 1):
+            raise CommandError('--limit y --max-pages deben ser positivos')
+        if options['prune']:
+            self.stderr.write(f'{feed.prune_tombstones()} bajas purgadas')
+
+        cursor = self.initial_cursor(options)
+        output = self.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        try:
+            cursor, total, pages = self.export(output, cursor, options['limit'], options['max_pages'])
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+        if options['state']:
+            # Se guarda al final: si algo falla, la siguiente ejecución repite las páginas
+            temporary = f'{options["state"]}.tmp'
+            with open(temporary, 'w', encoding='utf-8') as state:
+                state.write(cursor)
+            os.replace(temporary, options['state'])
+        self.stderr.write(self.style.SUCCESS(f'✓ {total} cambios en {pages} páginas'))
+
+    def initial_cursor(self, options):
+        if options['since']:
+            moment = parse_datetime(options['since'])
+            if moment is None:
+                raise CommandError(f'Fecha no válida: {options["since"]}')
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            return feed.cursor_since(moment)
+        if options['cursor']:
+            return options['cursor']
+        if options['state'] and os.path.exists(options['state']):
+            with open(options['state'], encoding='utf-8') as state:
+                return state.read().strip() or None
+        return None
+
+    def export(self, output, cursor, limit, max_pages):
+        """Escribe las páginas y una última línea con el cursor. Devuelve (cursor, registros, páginas)."""
+        total = pages = 0
+        while True:
+            try:
+                page = feed.read_page(cursor, limit)
+            except InvalidCursor:
+                raise CommandError('Cursor no válido')
+            except feed.CursorExpired:
+                raise CommandError('Cursor caducado: las bajas posteriores ya se han purgado; empiece sin cursor')
+            lines = list(page.iter_lines())
+            # La línea del cursor solo se escribe al final
+            for line in lines[:-1]:
+                output.write(line)
+            cursor = page.cursor
+            total += len(page)
+            pages += 1
+            if not page.has_more or (max_pages and pages >= max_pages):
+                output.write(lines[-1])
+                return cursor, total, pages
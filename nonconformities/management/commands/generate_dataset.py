@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nonconformities.dataset import DEFAULT_BATCH_SIZE, DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera No Conformidades y acciones sintéticas con bulk_create para '
+        'pruebas de carga. Con la misma semilla los datos son los mismos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Número de NC a añadir.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--lines-mean', type=float, default=3.0,
+            help='Media de acciones por NC (distribución geométrica).',
+        )
+        parser.add_argument('--lines-max', type=int, default=30, help='Máximo de acciones por NC.')
+        parser.add_argument('--years', type=int, default=3, help='Antigüedad máxima de las NC.')
+        parser.add_argument('--users', type=int, default=30, help='Usuarios sintéticos.')
+        parser.add_argument('--prefix', default='SYN', help='Prefijo de los códigos generados.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['batch_size'] < 1:
+            raise CommandError('El número de NC y --batch-size deben ser positivos')
+
+        generator = DatasetGenerator(
+            seed=options['seed'],
+            lines_mean=options['lines_mean'],
+            lines_max=options['lines_max'],
+            years=options['years'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            users=options['users'],
+        )
+        started = time.monotonic()
+
+        def progress(created):
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {created} NC ({created / elapsed:.0f} NC/s)')
+
+        ncs, lines = generator.generate(options['count'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {ncs} NC y {lines} acciones generadas en {time.monotonic() - started:.1f} s'
+        ))
@@ -0,0 +1,112 @@
+import csv
+import sys
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from nonconformities import importer
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa No Conformidades (o sus acciones, con --lines) desde un '
+        'fichero CSV o JSONL, por lotes. Cada lote se confirma en su propia '
+        'transacción; tras una interrupción se reanuda con --offset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Fichero CSV o JSONL; "-" para la entrada estándar.')
+        parser.add_argument(
+            '--format', choices=importer.FORMATS,
+            help='Formato del fichero (por defecto, según la extensión).',
+        )
+        parser.add_argument(
+            '--lines', action='store_true',
+            help='El fichero contiene acciones (code, action_description, date, user).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.NONCONFORMITY_IMPORT_BATCH_SIZE,
+            help='Registros por lote y por transacción.',
+        )
+        parser.add_argument(
+            '--offset', type=int, default=0,
+            help='Registros iniciales a omitir (ya importados en una ejecución anterior).',
+        )
+        parser.add_argument(
+            '--user',
+            help='Usuario asignado a los registros que no indican ninguno.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1 or options['offset'] < 0:
+            raise CommandError('--batch-size debe ser positivo y --offset no negativo')
+
+        default_user_id = None
+        if options['user']:
+            default_user_id = User.objects.filter(username=options['user']).values_list('id', flat=True).first()
+            if default_user_id is None:
+                raise CommandError(f'No existe el usuario "{options["user"]}"')
+
+        fmt = options['format'] or importer.detect_format(options['path'])
+        import_batch = importer.import_lines if options['lines'] else importer.import_nonconformities
+        maps = importer.LookupMaps()
+
+        if options['path'] == '-':
+            self.run(importer.read_records(sys.stdin, fmt), import_batch, maps, default_user_id, options)
+        else:
+            try:
+                stream = open(options['path'], encoding='utf-8-sig', newline='')
+            except OSError as exc:
+                raise CommandError(f'No se puede abrir el fichero: {exc}')
+            with stream:
+                self.run(importer.read_records(stream, fmt), import_batch, maps, default_user_id, options)
+
+    def run(self, records, import_batch, maps, default_user_id, options):
+        offset, batch_size = options['offset'], options['batch_size']
+        numbered = enumerate(islice(records, offset, None), start=offset)
+
+        created = errors = processed = 0
+        started = time.monotonic()
+        while True:
+            batch = self.read_batch(numbered, batch_size, offset + processed)
+            if not batch:
+                break
+            result = import_batch(batch, maps, default_user_id)
+            created += result.created
+            errors += len(result.errors)
+            processed += len(batch)
+
+            for number, message in result.errors:
+                self.stderr.write(f'  registro {number + 1}: {message}')
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'  {processed} registros ({processed / elapsed:.0f} registros/s), '
+                f'{created} creados, {errors} con errores; '
+                f'para reanudar: --offset {batch[-1][0] + 1}'
+            )
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Importación terminada: {created} creados, {errors} con errores, '
+            f'{processed} registros en {elapsed:.1f} s ({rate:.0f} registros/s)'
+        ))
+
+    def read_batch(self, numbered, batch_size, position):
+        """
+        Lee el siguiente lote. Solo la lectura traduce los errores de formato:
+        los del propio importador no deben parecer un fichero mal formado.
+        """
+        try:
+            return list(islice(numbered, batch_size))
+        except (ValueError, csv.Error) as exc:
+            # Fichero mal formado (JSON no válido, CSV ilegible, codificación...)
+            raise CommandError(
+                f'Error de lectura tras el registro {position}: {exc}. '
+                f'Los lotes anteriores ya están confirmados; reanude con --offset {position}.'
+            )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from nonconformities import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de texto completo (FTS5) de No Conformidades.'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('El índice de texto completo solo está disponible en SQLite.')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            count = search.rebuild_index(cursor)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexadas {count} no conformidades'))
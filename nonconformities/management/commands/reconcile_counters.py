@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from nonconformities import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara los contadores del panel con los recuentos reales y los '
+        'regenera. Con --check solo verifica y falla si no cuadran.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Solo verificar; no modificar la tabla resumen.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = counters.find_mismatches()
+
+            for key, (stored, actual) in sorted(mismatches.items()):
+                self.stdout.write(
+                    f'  estado={key[0]} área={key[1]} severidad={key[2]} '
+                    f'clasificación={key[3]}: guardado {stored}, real {actual}'
+                )
+
+            if options['check']:
+                if mismatches:
+                    raise CommandError(f'{len(mismatches)} contadores no cuadran')
+                self.stdout.write(self.style.SUCCESS('✓ Los contadores cuadran'))
+                return
+
+            counters.rebuild()
+            remaining = counters.find_mismatches()
+            if remaining:
+                raise CommandError(f'{len(remaining)} contadores siguen sin cuadrar tras regenerar')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Contadores regenerados ({len(mismatches)} combinaciones corregidas)'
+        ))
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+CREATE_TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS nonconformities_search USING fts5(
+        code, description, actions,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+POPULATE_SQL = """
+    INSERT INTO nonconformities_search (rowid, code, description, actions)
+    SELECT nc.id, nc.code, nc.description, coalesce(
+        (SELECT group_concat(l.action_description, ' ')
+         FROM nonconformities_nonconformityline l
+         WHERE l.nonconformity_id = nc.id), '')
+    FROM nonconformities_nonconformity nc
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """Crea y llena el índice FTS5 (solo en SQLite)."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE_SQL)
+        cursor.execute(POPULATE_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS nonconformities_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nonconformities', '0002_severity_alter_nonconformity_severity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2 on 2026-10-18 19:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def check_duplicate_codes(apps, schema_editor):
+    """
+    Aborta con un mensaje claro si hay códigos repetidos, que impedirían
+    crear la restricción de unicidad.
+    """
+    Nonconformity = apps.get_model('nonconformities', 'Nonconformity')
+    duplicates = list(
+        Nonconformity.objects.values('code')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+        .order_by('code')
+        .values_list('code', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Existen códigos de No Conformidad duplicados; corríjalos antes de '
+            f'migrar: {", ".join(duplicates)}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_delete_severity'),
+        ('nonconformities', '0003_nonconformity_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='nonconformity',
+            name='area',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.area'),
+        ),
+        migrations.AlterField(
+            model_name='nonconformity',
+            name='category',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='nonconformities.category'),
+        ),
+        migrations.AlterField(
+            model_name='nonconformity',
+            name='severity',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='nonconformities.severity'),
+        ),
+        migrations.AlterField(
+            model_name='nonconformity',
+            name='status',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='nonconformities.status'),
+        ),
+        migrations.AddIndex(
+            model_name='nonconformity',
+            index=models.Index(fields=['status', 'creation_date'], name='nc_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nonconformity',
+            index=models.Index(fields=['severity', 'creation_date'], name='nc_severity_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nonconformity',
+            index=models.Index(fields=['category', 'creation_date'], name='nc_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nonconformity',
+            index=models.Index(fields=['area', 'creation_date'], name='nc_area_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nonconformity',
+            index=models.Index(fields=['creation_date'], name='nc_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='nonconformity',
+            constraint=models.UniqueConstraint(fields=('code',), name='nc_code_unique'),
+        ),
+    ]
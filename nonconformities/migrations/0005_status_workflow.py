@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+def assign_roles_from_descriptions(apps, schema_editor):
+    """
+    Traslada a los nuevos campos la semántica que antes se deducía del
+    texto: "Abierta" es el estado inicial y el de reapertura, y los
+    estados "Cerrada/Cerrado/Closed" son finales.
+    """
+    Status = apps.get_model('nonconformities', 'Status')
+    open_status = None
+    for status in Status.objects.order_by('pk'):
+        description = status.description.lower()
+        if open_status is None and ('abierta' in description or description == 'open'):
+            open_status = status
+            status.is_initial = True
+            status.is_reopen_target = True
+        if 'cerrad' in description or description == 'closed':
+            status.is_terminal = True
+        status.save(update_fields=['is_initial', 'is_reopen_target', 'is_terminal'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nonconformities', '0004_nonconformity_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='status',
+            name='allowed_next',
+            field=models.ManyToManyField(blank=True, related_name='allowed_previous', to='nonconformities.status', verbose_name='siguientes permitidos'),
+        ),
+        migrations.AddField(
+            model_name='status',
+            name='is_initial',
+            field=models.BooleanField(default=False, help_text='Estado asignado a las NC nuevas.', verbose_name='inicial'),
+        ),
+        migrations.AddField(
+            model_name='status',
+            name='is_reopen_target',
+            field=models.BooleanField(default=False, help_text='Estado asignado al reabrir una NC.', verbose_name='destino al reabrir'),
+        ),
+        migrations.AddField(
+            model_name='status',
+            name='is_terminal',
+            field=models.BooleanField(default=False, help_text='La NC queda cerrada (con fecha de cierre).', verbose_name='final'),
+        ),
+        migrations.RunPython(assign_roles_from_descriptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='status',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_initial', True)), fields=('is_initial',), name='status_single_initial'),
+        ),
+        migrations.AddConstraint(
+            model_name='status',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_reopen_target', True)), fields=('is_reopen_target',), name='status_single_reopen_target'),
+        ),
+    ]
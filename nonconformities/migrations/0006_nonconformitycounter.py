@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    """Llena los contadores a partir de las NC existentes."""
+    Nonconformity = apps.get_model('nonconformities', 'Nonconformity')
+    NonconformityCounter = apps.get_model('nonconformities', 'NonconformityCounter')
+    rows = (
+        Nonconformity.objects
+        .values('status_id', 'area_id', 'severity_id', 'category_id')
+        .annotate(total=models.Count('id'))
+        .order_by()
+    )
+    NonconformityCounter.objects.bulk_create([
+        NonconformityCounter(
+            status_key=row['status_id'] or 0,
+            area_key=row['area_id'] or 0,
+            severity_key=row['severity_id'] or 0,
+            category_key=row['category_id'] or 0,
+            count=row['total'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nonconformities', '0005_status_workflow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NonconformityCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status_key', models.PositiveBigIntegerField(default=0)),
+                ('area_key', models.PositiveBigIntegerField(default=0)),
+                ('severity_key', models.PositiveBigIntegerField(default=0)),
+                ('category_key', models.PositiveBigIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('status_key', 'area_key', 'severity_key', 'category_key'), name='nc_counter_unique_key')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nonconformities', '0006_nonconformitycounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nonconformity',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
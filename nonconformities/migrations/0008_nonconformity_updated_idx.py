@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nonconformities', '0007_nonconformity_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nonconformity',
+            index=models.Index(fields=['updated_at'], name='nc_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_line_dates(apps, schema_editor):
+    # Las acciones existentes entran en el flujo con su fecha de registro
+    NonconformityLine = apps.get_model('nonconformities', 'NonconformityLine')
+    NonconformityLine.objects.update(updated_at=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nonconformities', '0008_nonconformity_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nonconformityline',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_line_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='nonconformityline',
+            index=models.Index(fields=['updated_at'], name='nc_line_updated_idx'),
+        ),
+        migrations.CreateModel(
+            name='DeletedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('nonconformity', 'No conformidad'), ('line', 'Acción')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at'], name='nc_deleted_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 20:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nonconformities', '0009_change_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nonconformityline',
+            index=models.Index(fields=['nonconformity', 'date'], name='nc_line_history_idx'),
+        ),
+        migrations.AlterField(
+            model_name='nonconformityline',
+            name='nonconformity',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='nonconformities.nonconformity'),
+        ),
+    ]
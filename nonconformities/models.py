@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from core.models import Area
 
 class Severity(models.Model):
@@ -11,6 +12,27 @@ class Severity(models.Model):
 class Status(models.Model):
     id = models.AutoField(primary_key=True)
     description = models.CharField(max_length=50, db_column='Es_Descripcion')
+    # Papel del estado en el flujo de trabajo (ver workflow.py)
+    is_initial = models.BooleanField('inicial', default=False, help_text='Estado asignado a las NC nuevas.')
+    is_terminal = models.BooleanField('final', default=False, help_text='La NC queda cerrada (con fecha de cierre).')
+    is_reopen_target = models.BooleanField('destino al reabrir', default=False, help_text='Estado asignado al reabrir una NC.')
+    # Transiciones permitidas desde este estado; vacío = cualquiera
+    allowed_next = models.ManyToManyField(
+        'self', symmetrical=False, blank=True, related_name='allowed_previous',
+        verbose_name='siguientes permitidos',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_initial'], condition=models.Q(is_initial=True),
+                name='status_single_initial',
+            ),
+            models.UniqueConstraint(
+                fields=['is_reopen_target'], condition=models.Q(is_reopen_target=True),
+                name='status_single_reopen_target',
+            ),
+        ]
 
     def __str__(self):
         return self.description
@@ -26,24 +48,126 @@ class Nonconformity(models.Model):
     description = models.TextField()
     creation_date = models.DateTimeField(auto_now_add=True)
     closure_date = models.DateTimeField(null=True, blank=True)
+    # Sello de versión: cambia con cada modificación de la NC o de sus acciones
+    updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='nonconformities')
-    status = models.ForeignKey(Status, on_delete=models.SET_NULL, null=True)
+    # Las FK filtrables no llevan índice propio: las cubren los índices
+    # compuestos (fk, creation_date) definidos en Meta
+    status = models.ForeignKey(Status, on_delete=models.SET_NULL, null=True, db_index=False)
     code = models.CharField(max_length=50)
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)  # Nuevo campo
-    area = models.ForeignKey(Area, on_delete=models.SET_NULL, null=True)
-    severity = models.ForeignKey(Severity, on_delete=models.SET_NULL, null=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, db_index=False)  # Nuevo campo
+    area = models.ForeignKey(Area, on_delete=models.SET_NULL, null=True, db_index=False)
+    severity = models.ForeignKey(Severity, on_delete=models.SET_NULL, null=True, db_index=False)
 
+    class Meta:
+        # Índices alineados con las combinaciones de filtro y orden del listado
+        indexes = [
+            models.Index(fields=['status', 'creation_date'], name='nc_status_created_idx'),
+            models.Index(fields=['severity', 'creation_date'], name='nc_severity_created_idx'),
+            models.Index(fields=['category', 'creation_date'], name='nc_category_created_idx'),
+            models.Index(fields=['area', 'creation_date'], name='nc_area_created_idx'),
+            models.Index(fields=['creation_date'], name='nc_created_idx'),
+            # max(updated_at) del validador de GET condicional del listado
+            models.Index(fields=['updated_at'], name='nc_updated_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['code'], name='nc_code_unique'),
+        ]
 
     def __str__(self):
         return f"{self.code} - {self.description[:50]}"
 
 class NonconformityLine(models.Model):
     # La clave primaria 'id' es automática
-    nonconformity = models.ForeignKey(Nonconformity, related_name='lines', on_delete=models.CASCADE)
+    # El índice del historial (nonconformity, date) también sirve para
+    # buscar por NC: no hace falta el índice propio de la clave foránea
+    nonconformity = models.ForeignKey(
+        Nonconformity, related_name='lines', on_delete=models.CASCADE, db_index=False
+    )
     action_description = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Posición de la acción en el flujo de cambios (feed.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # En SQLite el índice incluye el rowid: sirve para (updated_at, id)
+            models.Index(fields=['updated_at'], name='nc_line_updated_idx'),
+            # Historial paginado de una NC por (date, id)
+            models.Index(fields=['nonconformity', 'date'], name='nc_line_history_idx'),
+        ]
 
     def __str__(self):
         return f"Action {self.id} of Nonconformity {self.nonconformity.code}"
 
+
+class CodeSequence(models.Model):
+    """
+    Último número asignado a los códigos automáticos de NC de un área (por
+    su codificación; vacía sin área) y un año. Ver codes.py.
+    """
+    area_code = models.CharField(max_length=10, blank=True)
+    year = models.PositiveSmallIntegerField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['area_code', 'year'], name='nc_code_sequence_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.area_code or '-'} {self.year}: {self.last_number}"
+
+
+class DeletedRecord(models.Model):
+    """
+    Baja de una NC o de una acción, para que el flujo de cambios (feed.py)
+    pueda comunicarla. La registran los receptores de post_delete; se
+    conservan NONCONFORMITY_FEED_TOMBSTONE_DAYS días.
+    """
+    NONCONFORMITY = 'nonconformity'
+    LINE = 'line'
+    KIND_CHOICES = [
+        (NONCONFORMITY, 'No conformidad'),
+        (LINE, 'Acción'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='nc_deleted_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} ({self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class NonconformityCounter(models.Model):
+    """
+    Recuento de NC por combinación de estado, área, severidad y clasificación.
+
+    Lo mantienen las vistas con incrementos dentro de la misma transacción
+    que modifica la NC (ver counters.py). Las claves guardan el id de cada
+    tabla auxiliar, o 0 si la NC no tiene ese dato, para que la restricción
+    de unicidad funcione también con los valores vacíos.
+    """
+    status_key = models.PositiveBigIntegerField(default=0)
+    area_key = models.PositiveBigIntegerField(default=0)
+    severity_key = models.PositiveBigIntegerField(default=0)
+    category_key = models.PositiveBigIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['status_key', 'area_key', 'severity_key', 'category_key'],
+                name='nc_counter_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.status_key}/{self.area_key}/{self.severity_key}/{self.category_key}: {self.count}"
@@ -0,0 +1,225 @@
+"""
+Paginación por cursor (keyset) para listados ordenados.
+
+A diferencia de OFFSET, cada página se obtiene filtrando a partir de la
+clave de ordenación de la última (o primera) fila vista, por lo que el
+coste de una página no depende de lo profunda que esté en el listado.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+
+class InvalidCursor(Exception):
+    """El cursor recibido no se puede decodificar."""
+
+
+class KeysetPage:
+    """Una página de resultados con los cursores para navegar."""
+
+    def __init__(self, object_list, page_size, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.page_size = page_size
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _resolve_field(model, lookup):
+    """Devuelve (campo final, admite_nulos) para una ruta tipo 'status__description'."""
+    nullable = False
+    field = None
+    for part in lookup.split('__'):
+        field = model._meta.get_field(part)
+        nullable = nullable or field.null
+        if field.is_relation:
+            model = field.related_model
+    return field, nullable
+
+
+class KeysetPaginator:
+    """
+    Pagina un queryset según una tupla de claves de ordenación ascendentes.
+
+    La última clave debe ser única (normalmente 'id') para que el orden sea
+    total. Las claves pueden atravesar relaciones nulas; en ese caso se
+    respeta el orden de SQLite, que coloca los NULL primero en ASC.
+    """
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+        self.aliases = tuple(f'cursor_key_{i}' for i in range(len(self.ordering)))
+        self.fields = [
+            _resolve_field(queryset.model, lookup) for lookup in self.ordering
+        ]
+
+    # --- Codificación del cursor ------------------------------------------
+
+    @staticmethod
+    def _json_default(value):
+        # isoformat conserva los microsegundos (DjangoJSONEncoder los trunca)
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        return str(value)
+
+    def encode_cursor(self, values):
+        raw = json.dumps(list(values), default=self._json_default, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+
+        try:
+            return [
+                None if value is None else field.to_python(value)
+                for value, (field, _) in zip(values, self.fields)
+            ]
+        except ValidationError as exc:
+            raise InvalidCursor(cursor) from exc
+
+    # --- Construcción de condiciones --------------------------------------
+
+    def _equal(self, index, value):
+        alias = self.aliases[index]
+        if value is None:
+            return Q(**{f'{alias}__isnull': True})
+        return Q(**{alias: value})
+
+    def _beyond(self, index, value, forward):
+        """Condición 'estrictamente después' (o antes) en la clave indicada."""
+        alias = self.aliases[index]
+        nullable = self.fields[index][1]
+        if forward:
+            if value is None:
+                return Q(**{f'{alias}__isnull': False})
+            return Q(**{f'{alias}__gt': value})
+        if value is None:
+            return None  # Nada va antes de NULL
+        condition = Q(**{f'{alias}__lt': value})
+        if nullable:
+            condition |= Q(**{f'{alias}__isnull': True})
+        return condition
+
+    def _seek(self, values, forward):
+        condition = Q(pk__in=[])
+        for index, value in enumerate(values):
+            beyond = self._beyond(index, value, forward)
+            if beyond is None:
+                continue
+            prefix = Q()
+            for previous in range(index):
+                prefix &= self._equal(previous, values[previous])
+            condition |= prefix & beyond
+        first, (_, nullable) = values[0], self.fields[0]
+        # NULL va primero en ASC: hacia delante ninguna fila posterior al
+        # cursor tiene NULL en la primera clave, aunque la columna lo admita
+        if first is not None and (forward or not nullable):
+            # Redundante, pero acota el rango del índice: sin ella SQLite
+            # recorre el índice desde el principio (o el final) hasta el cursor
+            lookup = 'gte' if forward else 'lte'
+            condition &= Q(**{f'{self.aliases[0]}__{lookup}': first})
+        return condition
+
+    # --- API pública ------------------------------------------------------
+
+    def _row_key(self, row):
+        if isinstance(row, dict):
+            return [row[alias] for alias in self.aliases]
+        return [getattr(row, alias) for alias in self.aliases]
+
+    def _page_queryset(self, after, before, last=False):
+        """Devuelve (queryset de la página más una fila, avanza, cursor)."""
+        queryset = self.queryset.annotate(
+            **{alias: F(lookup) for alias, lookup in zip(self.aliases, self.ordering)}
+        )
+
+        # La última página se lee hacia atrás desde el final, sin cursor
+        forward = before is None and not last
+        cursor = after if forward else before
+        if cursor:
+            queryset = queryset.filter(self._seek(self.decode_cursor(cursor), forward))
+
+        if forward:
+            queryset = queryset.order_by(*self.aliases)
+        else:
+            queryset = queryset.order_by(*(f'-{alias}' for alias in self.aliases))
+
+        # Se pide una fila extra para saber si hay más páginas en esa dirección
+        return queryset[:self.page_size + 1], forward, cursor
+
+    def _build_page(self, rows, forward, cursor):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            first_key = self.encode_cursor(self._row_key(rows[0]))
+            last_key = self.encode_cursor(self._row_key(rows[-1]))
+            if forward:
+                next_cursor = last_key if has_more else None
+                previous_cursor = first_key if cursor else None
+            else:
+                next_cursor = last_key if cursor else None
+                previous_cursor = first_key if has_more else None
+
+        return KeysetPage(rows, self.page_size, next_cursor, previous_cursor)
+
+    def page_queryset(self, after=None, before=None):
+        """Consulta de la página que devolvería get_page() (p. ej. para EXPLAIN)."""
+        return self._page_queryset(after, before)[0]
+
+    def get_page(self, after=None, before=None):
+        """
+        Devuelve la página siguiente a `after` o la anterior a `before`.
+
+        Sin cursores devuelve la primera página. Lanza InvalidCursor si
+        alguno de los cursores no es válido.
+        """
+        queryset, forward, cursor = self._page_queryset(after, before)
+        return self._build_page(list(queryset), forward, cursor)
+
+    async def aget_page(self, after=None, before=None):
+        """Versión asíncrona de get_page(), con el ORM asíncrono."""
+        queryset, forward, cursor = self._page_queryset(after, before)
+        return self._build_page([row async for row in queryset], forward, cursor)
+
+    def get_last_page(self):
+        """
+        Devuelve la última página (las filas más recientes si se ordena por
+        fecha), con el cursor de la anterior. Cuesta lo mismo que la primera:
+        se recorre el índice desde el final.
+        """
+        queryset, forward, cursor = self._page_queryset(None, None, last=True)
+        return self._build_page(list(queryset), forward, cursor)
+
+    async def aget_last_page(self):
+        """Versión asíncrona de get_last_page()."""
+        queryset, forward, cursor = self._page_queryset(None, None, last=True)
+        return self._build_page([row async for row in queryset], forward, cursor)
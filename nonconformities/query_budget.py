@@ -0,0 +1,185 @@
+"""
+Presupuesto de consultas y de filas leídas por vista.
+
+BUDGETS declara, para cada URL de urls.py (y para cada filtro del
+listado), el máximo de consultas SQL y de filas que puede costar una
+petición con la caché vacía. Los tests lo comprueban con dos tamaños de
+datos: el número de consultas no puede crecer con el tamaño (un N+1 en
+una plantilla lo haría crecer) y las filas leídas deben quedar dentro del
+máximo también con los datos grandes. None en filas significa que la
+vista lee por diseño todo el conjunto (la exportación, o la tabla resumen
+completa en el panel).
+
+Las filas se cuentan envolviendo los métodos fetch* del cursor de SQLite,
+así que solo se miden con ese motor.
+"""
+from collections import namedtuple
+from contextlib import ExitStack
+from unittest import mock
+
+from django.core.cache import cache
+from django.db.backends.sqlite3.base import SQLiteCursorWrapper
+from django.urls import reverse
+
+from .lookups import lookup_cache
+
+
+# target: NC sobre la que actúa la URL ('open', 'closed' o None).
+# Los valores de data se formatean con los datos de la prueba ({status}...).
+Budget = namedtuple('Budget', 'label url_name method target data queries rows')
+
+NEW_NC = {
+    'code': 'NC-PRESUPUESTO', 'description': 'Descripción de la NC de presupuesto',
+    'severity': '{severity}', 'category': '{category}', 'status': '{status}', 'area': '{area}',
+}
+EDITED_NC = {
+    'code': '{code}', 'description': 'Descripción editada en la prueba',
+    'severity': '{severity}', 'category': '{category}', 'status': '{status}', 'area': '{area}',
+}
+# Sin código: se asigna el siguiente de la secuencia (codes.py)
+AUTO_CODE_NC = {key: value for key, value in NEW_NC.items() if key != 'code'}
+CLOSE = {'confirm': 'on', 'closing_comment': 'Cierre de prueba'}
+BULK_STATUS = {'action': 'status', 'status': '{next_status}', 'ids': '{ids}'}
+ACTION = {'action_description': 'Acción registrada en la prueba'}
+
+BUDGETS = (
+    #      etiqueta               URL                             método  NC        datos                                   consultas filas
+    Budget('list',                'nonconformity_list',           'get',  None,     {},                                     8,        110),
+    Budget('list[status]',        'nonconformity_list',           'get',  None,     {'status': '{status}'},                 8,        110),
+    Budget('list[severity]',      'nonconformity_list',           'get',  None,     {'severity': '{severity}'},             8,        110),
+    Budget('list[category]',      'nonconformity_list',           'get',  None,     {'category': '{category}'},             8,        110),
+    Budget('list[area]',          'nonconformity_list',           'get',  None,     {'area': '{area}'},                     8,        110),
+    Budget('list[creation_date]', 'nonconformity_list',           'get',  None,     {'creation_date': '{creation_date}'},   8,        110),
+    Budget('list[code]',          'nonconformity_list',           'get',  None,     {'code': 'SYN-000'},                    8,        110),
+    Budget('list[description]',   'nonconformity_list',           'get',  None,     {'description': 'prensa'},              8,        110),
+    Budget('rows',                'nonconformity_rows',           'get',  None,     {},                                     4,        60),
+    Budget('rows[description]',   'nonconformity_rows',           'get',  None,     {'description': 'prensa'},              4,        60),
+    Budget('events',              'nonconformity_events',         'get',  None,     {},                                     2,        2),
+    Budget('feed',                'change_feed',                  'get',  None,     {'limit': '50'},                        5,        155),
+    Budget('export',              'export',                       'get',  None,     {},                                     4,        None),
+    Budget('export_job',          'export_job',                   'post', None,     {},                                     3,        3),
+    Budget('search',              'search',                       'get',  None,     {'q': 'prensa'},                        4,        45),
+    Budget('dashboard',           'dashboard',                    'get',  None,     {},                                     7,        None),
+    Budget('create[get]',         'create_nonconformity',         'get',  None,     {},                                     6,        60),
+    Budget('create[post]',        'create_nonconformity',         'post', None,     NEW_NC,                                 22,       60),
+    Budget('create[post,auto]',   'create_nonconformity',         'post', None,     AUTO_CODE_NC,                           30,       60),
+    Budget('update[get]',         'update_nonconformity',         'get',  'open',   {},                                     8,        60),
+    Budget('update[post]',        'update_nonconformity',         'post', 'open',   EDITED_NC,                              26,       60),
+    Budget('detail',              'nonconformity_detail',         'get',  'open',   {},                                     6,        10),
+    Budget('detail_partial',      'nonconformity_detail_partial', 'get',  'open',   {},                                     10,       72),
+    Budget('actions',             'nonconformity_actions',        'get',  'open',   {},                                     4,        25),
+    Budget('change_status',       'change_status',                'post', 'open',   {'status': '{next_status}'},            21,       60),
+    Budget('close[get]',          'close_nonconformity',          'get',  'open',   {},                                     9,        50),
+    Budget('close[post]',         'close_nonconformity',          'post', 'open',   CLOSE,                                  20,       60),
+    Budget('reopen',              'reopen_nonconformity',         'post', 'closed', {},                                     20,       60),
+    Budget('bulk_change_status',  'bulk_change_status',           'post', None,     BULK_STATUS,                            17,       180),
+    Budget('add_action[post]',    'add_action',                   'post', 'open',   ACTION,                                 7,        10),
+)
+
+
+class QueryLog:
+    """
+    Registra cada consulta ejecutada por los cursores de SQLite y las filas
+    que se leen de ella (fetchone, fetchmany, fetchall o iterando).
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for name in ('execute', 'executemany'):
+            self._stack.enter_context(mock.patch.object(
+                SQLiteCursorWrapper, name, self._wrap_execute(getattr(SQLiteCursorWrapper, name)),
+            ))
+        for name in ('fetchone', 'fetchmany', 'fetchall', '__next__'):
+            self._stack.enter_context(mock.patch.object(
+                SQLiteCursorWrapper, name, self._wrap_fetch(name, getattr(SQLiteCursorWrapper, name)),
+            ))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+    def _wrap_execute(self, method):
+        log = self
+
+        def execute(cursor, query, params=None):
+            cursor._query_log_entry = {'sql': query, 'params': params, 'rows': 0}
+            log.queries.append(cursor._query_log_entry)
+            return method(cursor, query, params)
+        return execute
+
+    def _wrap_fetch(self, name, method):
+        def fetch(cursor, *args):
+            result = method(cursor, *args)
+            entry = getattr(cursor, '_query_log_entry', None)
+            if entry is not None:
+                if name in ('fetchone', '__next__'):
+                    entry['rows'] += result is not None
+                else:
+                    entry['rows'] += len(result)
+            return result
+        return fetch
+
+    @property
+    def rows(self):
+        return sum(entry['rows'] for entry in self.queries)
+
+
+def measure(client, budget, context):
+    """
+    Hace la petición de `budget` con la caché vacía y devuelve su QueryLog.
+    `context` aporta los pk de las NC destino y los valores de los datos.
+    """
+    args = [context[budget.target]] if budget.target else []
+    data = {key: str(value).format(**context) for key, value in budget.data.items()}
+    if 'ids' in data:
+        # Varios valores para el mismo parámetro
+        data['ids'] = data['ids'].split(',')
+    cache.clear()
+    lookup_cache.expire()
+    with QueryLog() as log:
+        response = getattr(client, budget.method)(
+            reverse(f'nonconformities:{budget.url_name}', args=args), data,
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+    if response.status_code >= 400:
+        raise AssertionError(f'{budget.label}: la petición respondió {response.status_code}')
+    return log
+
+
+def format_queries(log):
+    """Lista numerada de las consultas con las filas que leyó cada una."""
+    return '\n'.join(
+        f"  {number}. [{entry['rows']} filas] {entry['sql']} {entry['params'] or ''}".rstrip()
+        for number, entry in enumerate(log.queries, 1)
+    )
+
+
+def check(budget, logs):
+    """
+    Compara las mediciones {tamaño: QueryLog} de una URL con su presupuesto.
+    Devuelve la descripción de las infracciones, o '' si lo cumple.
+    """
+    problems = []
+    sizes = sorted(logs)
+    for size in sizes:
+        log = logs[size]
+        if len(log.queries) > budget.queries:
+            problems.append(f'{len(log.queries)} consultas con {size} NC (máximo {budget.queries})')
+        if budget.rows is not None and log.rows > budget.rows:
+            problems.append(f'{log.rows} filas leídas con {size} NC (máximo {budget.rows})')
+    smallest, largest = logs[sizes[0]], logs[sizes[-1]]
+    if len(largest.queries) > len(smallest.queries):
+        problems.append(
+            f'las consultas crecen con los datos: {len(smallest.queries)} con {sizes[0]} NC, '
+            f'{len(largest.queries)} con {sizes[-1]} NC'
+        )
+    if not problems:
+        return ''
+    return (
+        f"{budget.label} ({budget.method.upper()} {budget.url_name}): {'; '.join(problems)}\n"
+        f'Consultas con {sizes[-1]} NC:\n{format_queries(largest)}'
+    )
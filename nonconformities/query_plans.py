@@ -0,0 +1,101 @@
+"""
+Comprobación de los planes de consulta (EXPLAIN QUERY PLAN) del listado.
+
+Para cada combinación de filtros habitual se obtiene el plan de SQLite y
+se marca como problema cualquier recorrido completo (SCAN) de las tablas
+grandes, que indicaría que falta un índice o que el filtro no es sargable.
+
+Además, para el listado sin filtros y por estado se comprueba que el
+índice sirve el orden de las páginas (NONCONFORMITY_ORDERING): ni la
+primera página ni la siguiente a un cursor deben ordenar el conjunto en
+un B-tree temporal, y la segunda debe buscar el cursor en el índice en
+lugar de recorrerlo desde el principio.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .pagination import KeysetPaginator
+from .views import NONCONFORMITY_ORDERING, filter_nonconformities
+
+
+# Tablas cuyo recorrido completo no es aceptable
+LARGE_TABLES = ('nonconformities_nonconformity', 'nonconformities_nonconformityline')
+
+# Combinaciones de filtros del listado y la exportación (valores de ejemplo)
+FILTER_COMBINATIONS = {
+    'status': {'status': '1'},
+    'severity': {'severity': '1'},
+    'category': {'category': '1'},
+    'area': {'area': '1'},
+    'creation_date': {'creation_date': '2025-01-15'},
+    'status+creation_date': {'status': '1', 'creation_date': '2025-01-15'},
+    'severity+creation_date': {'severity': '1', 'creation_date': '2025-01-15'},
+    'category+creation_date': {'category': '1', 'creation_date': '2025-01-15'},
+    'area+creation_date': {'area': '1', 'creation_date': '2025-01-15'},
+    'code': {'code': 'NC-2025'},
+    'description': {'description': 'calibración'},
+}
+
+# Listados cuyas páginas debe ordenar el índice
+ORDERED_COMBINATIONS = {
+    'unfiltered': {},
+    'status': {'status': '1'},
+}
+
+
+def explain(queryset):
+    """Devuelve las líneas 'detail' de EXPLAIN QUERY PLAN para el queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan(detail):
+    """True si la línea del plan recorre entera una de las tablas grandes."""
+    words = detail.split()
+    return len(words) >= 2 and words[0] == 'SCAN' and words[1] in LARGE_TABLES
+
+
+def find_full_scans(combinations=None):
+    """
+    Devuelve {combinación: plan} para las combinaciones cuyo plan hace un
+    recorrido completo. Un diccionario vacío significa que todo usa índices.
+    """
+    if connection.vendor != 'sqlite':
+        return {}
+    problems = {}
+    for name, params in (combinations or FILTER_COMBINATIONS).items():
+        plan = explain(filter_nonconformities(params))
+        if any(is_full_scan(detail) for detail in plan):
+            problems[name] = plan
+    return problems
+
+
+def page_querysets(params):
+    """Consultas de la primera página y de la siguiente a un cursor de ejemplo."""
+    paginator = KeysetPaginator(
+        filter_nonconformities(params), NONCONFORMITY_ORDERING, settings.NONCONFORMITY_PAGE_SIZE
+    )
+    cursor = paginator.encode_cursor([1, timezone.now(), 1])
+    return {'first': paginator.page_queryset(), 'after': paginator.page_queryset(after=cursor)}
+
+
+def find_unordered_pages(combinations=None):
+    """
+    Devuelve {'combinación (página)': plan} para las páginas que se ordenan
+    en un B-tree temporal o que, tras un cursor, recorren la tabla. Un
+    diccionario vacío significa que el índice da el orden de cada página.
+    """
+    if connection.vendor != 'sqlite':
+        return {}
+    problems = {}
+    for name, params in (combinations or ORDERED_COMBINATIONS).items():
+        for page, queryset in page_querysets(params).items():
+            plan = explain(queryset)
+            sorted_in_temp = any('TEMP B-TREE' in detail for detail in plan)
+            scanned = page == 'after' and any(is_full_scan(detail) for detail in plan)
+            if sorted_in_temp or scanned:
+                problems[f'{name} ({page})'] = plan
+    return problems
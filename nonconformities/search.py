@@ -0,0 +1,186 @@
+"""
+Índice de texto completo (SQLite FTS5) para las No Conformidades.
+
+La tabla virtual `nonconformities_search` replica el código, la
+descripción y, opcionalmente, las descripciones de las acciones de cada
+NC (rowid = id de la NC). Usa el tokenizador unicode61 sin diacríticos,
+por lo que las búsquedas no distinguen mayúsculas ni acentos, e índices
+de prefijo para que cada palabra buscada funcione como "empieza por".
+
+Los filtros de código y descripción del listado usan el índice: buscan
+palabras que empiezan por el texto, no una subcadena como `icontains`.
+"NC-2025-0" encuentra "NC-2025-001", pero "025" no (está en medio de la
+palabra "2025"). El filtro de descripción solo mira la descripción; las
+acciones se buscan con la búsqueda general (search(), vista
+search_nonconformities).
+
+En bases de datos distintas de SQLite no se crea la tabla y los filtros
+vuelven a `icontains`.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, connections, router
+from django.db.models.expressions import RawSQL
+
+from .models import Nonconformity
+
+
+SEARCH_TABLE = 'nonconformities_search'
+
+CREATE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        code, description, actions,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+# Pesos bm25 por columna (code, description, actions)
+RANK_WEIGHTS = (10.0, 4.0, 1.0)
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def is_available():
+    """El índice solo existe en SQLite."""
+    return connection.vendor == 'sqlite'
+
+
+def include_actions():
+    return getattr(settings, 'NONCONFORMITY_SEARCH_INCLUDE_ACTIONS', True)
+
+
+def _select_documents_sql(where=''):
+    """SELECT que produce las filas del índice a partir de las tablas reales."""
+    if include_actions():
+        actions = (
+            "(SELECT group_concat(l.action_description, ' ') "
+            "FROM nonconformities_nonconformityline l WHERE l.nonconformity_id = nc.id)"
+        )
+    else:
+        actions = "''"
+    return (
+        f"SELECT nc.id, nc.code, nc.description, coalesce({actions}, '') "
+        f"FROM nonconformities_nonconformity nc {where}"
+    )
+
+
+def _phrase(chunk):
+    """Convierte un fragmento del texto buscado en una frase FTS5 con prefijo."""
+    words = _WORD_RE.findall(chunk)
+    if not words:
+        return None
+    return ' + '.join(f'"{word}"' for word in words) + '*'
+
+
+def build_match_query(columns, term):
+    """
+    Construye la expresión MATCH para buscar `term` en `columns`.
+
+    Cada palabra (o grupo de palabras unidas por guiones, como un código)
+    se busca como prefijo y todas deben aparecer. Devuelve None si el
+    texto no contiene nada indexable.
+    """
+    phrases = [phrase for phrase in map(_phrase, term.split()) if phrase]
+    if not phrases:
+        return None
+    return '{%s} : (%s)' % (' '.join(columns), ' '.join(phrases))
+
+
+def description_columns():
+    """Columnas de texto de la búsqueda general (search())."""
+    if include_actions():
+        return ('description', 'actions')
+    return ('description',)
+
+
+def build_filter_query(code='', description=''):
+    """
+    Expresión MATCH para los filtros de código y descripción del listado.
+    Cada filtro busca solo en su columna (la descripción, sin las acciones).
+    """
+    parts = []
+    if code:
+        parts.append(build_match_query(('code',), code))
+    if description:
+        parts.append(build_match_query(('description',), description))
+    if not parts or None in parts:
+        return None
+    return ' AND '.join(parts)
+
+
+def matching_ids(match_query):
+    """Subconsulta con los ids que cumplen la expresión MATCH, para usar en `id__in`."""
+    return RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [match_query],
+    )
+
+
+def search(term, limit=20):
+    """
+    Busca `term` en todas las columnas y devuelve los ids ordenados por relevancia.
+    """
+    match_query = build_match_query(('code',) + description_columns(), term)
+    if match_query is None or not is_available():
+        return []
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    # Consulta de solo lectura: va a la misma conexión que el ORM (réplica)
+    using = router.db_for_read(Nonconformity)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s',
+            [match_query, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# --- Mantenimiento del índice -------------------------------------------------
+
+# Límite prudente de parámetros por sentencia en SQLite
+ID_BATCH_SIZE = 500
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        yield ids[start:start + ID_BATCH_SIZE]
+
+
+def index_nonconformities(ids):
+    """(Re)indexa las NC indicadas con dos sentencias por cada bloque de ids."""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        for batch in _batches(ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', batch)
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, code, description, actions) '
+                + _select_documents_sql(f'WHERE nc.id IN ({placeholders})'),
+                batch,
+            )
+
+
+def remove_nonconformities(ids):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        for batch in _batches(ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', batch)
+
+
+def rebuild_index(cursor):
+    """Vacía y vuelve a llenar el índice completo. Devuelve el número de NC indexadas."""
+    cursor.execute(CREATE_TABLE_SQL)
+    cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    cursor.execute(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, code, description, actions) '
+        + _select_documents_sql()
+    )
+    cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+    return cursor.fetchone()[0]
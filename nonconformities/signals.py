@@ -0,0 +1,105 @@
+"""
+Receptores de señales de la app de No Conformidades.
+
+Mantienen sincronizado el índice de búsqueda con cada guardado o borrado,
+actualizan el sello updated_at de la NC cuando cambian sus acciones,
+publican los cambios para el listado en vivo (events.py), registran las
+bajas para el flujo de cambios (feed.py) e invalidan la caché de tablas
+auxiliares cuando estas cambian.
+Las operaciones masivas (update, bulk_create) no emiten señales y deben
+llamar directamente a las funciones de `search` y `events`.
+
+Al borrar una NC sus acciones caen en cascada antes que ella: los
+receptores de acciones no hacen nada entonces (reindexar o tocar la NC
+una vez por acción), porque los de la propia NC ya la retiran.
+"""
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Area
+from . import counters, events, lookups, search
+from .models import Category, DeletedRecord, Nonconformity, NonconformityLine, Severity, Status
+
+
+def deleted_with_nonconformity(origin=None, **kwargs):
+    """¿La acción se borra en cascada con su NC? `origin` es lo que se borró."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is Nonconformity
+
+
+@receiver(post_save, sender=Nonconformity)
+def index_nonconformity(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_nonconformities([instance.pk])
+
+
+@receiver(post_delete, sender=Nonconformity)
+def unindex_nonconformity(sender, instance, **kwargs):
+    search.remove_nonconformities([instance.pk])
+
+
+@receiver(post_save, sender=NonconformityLine)
+@receiver(post_delete, sender=NonconformityLine)
+def reindex_line_nonconformity(sender, instance, raw=False, **kwargs):
+    if not raw and search.include_actions() and not deleted_with_nonconformity(**kwargs):
+        search.index_nonconformities([instance.nonconformity_id])
+
+
+@receiver(post_save, sender=NonconformityLine)
+@receiver(post_delete, sender=NonconformityLine)
+def touch_line_nonconformity(sender, instance, raw=False, **kwargs):
+    """Una acción nueva o borrada cambia la versión de su NC."""
+    if not raw and not deleted_with_nonconformity(**kwargs):
+        Nonconformity.objects.filter(pk=instance.nonconformity_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Nonconformity)
+@receiver(post_delete, sender=Nonconformity)
+def publish_nonconformity_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        events.notify_changed([instance.pk])
+
+
+@receiver(post_save, sender=NonconformityLine)
+@receiver(post_delete, sender=NonconformityLine)
+def publish_line_change(sender, instance, raw=False, **kwargs):
+    """El panel de detalle abierto de esa NC debe recargarse."""
+    if not raw and not deleted_with_nonconformity(**kwargs):
+        events.notify_changed([instance.nonconformity_id])
+
+
+@receiver(post_delete, sender=Nonconformity)
+@receiver(post_delete, sender=NonconformityLine)
+def record_deletion(sender, instance, **kwargs):
+    """Baja para el flujo de cambios; al borrar una NC, también la de cada acción."""
+    kind = DeletedRecord.NONCONFORMITY if sender is Nonconformity else DeletedRecord.LINE
+    DeletedRecord.objects.create(kind=kind, object_id=instance.pk)
+
+
+@receiver(post_save, sender=Severity)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Status)
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Severity)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Status)
+@receiver(post_delete, sender=Area)
+@receiver(m2m_changed, sender=Status.allowed_next.through)
+def invalidate_lookups(sender, **kwargs):
+    lookups.invalidate()
+
+
+LOOKUP_COUNTER_FIELDS = {
+    Status: 'status_key', Area: 'area_key', Severity: 'severity_key', Category: 'category_key',
+}
+
+
+@receiver(post_delete, sender=Severity)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Status)
+@receiver(post_delete, sender=Area)
+def move_deleted_lookup_counters(sender, instance, **kwargs):
+    """Sus NC han quedado sin ese valor (SET_NULL no emite señales)."""
+    counters.move_deleted_lookup(LOOKUP_COUNTER_FIELDS[sender], instance.pk)
@@ -0,0 +1,32 @@
+"""
+Tareas de la cola de trabajos (core/jobs.py) de la app de No Conformidades.
+
+La exportación CSV de muchas filas puede superar el tiempo de espera del
+proxy si se genera dentro de la petición; como trabajo se escribe en un
+fichero que el usuario descarga cuando termina.
+"""
+from django.conf import settings
+
+from core import jobs
+from .exports import iter_csv
+
+
+EXPORT_TASK = 'nonconformities.export'
+EXPORT_FILENAME = 'nonconformities.csv'
+
+
+@jobs.task(EXPORT_TASK)
+def export_nonconformities(job):
+    """Exporta las NC que cumplen los filtros de job.params['filters']."""
+    from .views import filter_nonconformities
+
+    nonconformities = filter_nonconformities(job.params.get('filters', {}))
+    jobs.report_progress(job, 0, nonconformities.count())
+    every = settings.NONCONFORMITY_EXPORT_PROGRESS_EVERY
+    with jobs.result_file(job, EXPORT_FILENAME, newline='', encoding='utf-8') as output:
+        # La primera línea es la cabecera: `done` cuenta las filas escritas
+        for done, line in enumerate(iter_csv(nonconformities)):
+            output.write(line)
+            if done and done % every == 0:
+                jobs.report_progress(job, done)
+    return EXPORT_FILENAME
@@ -1,3 +1,1300 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from core import jobs
+from core.models import Area, Job
+from . import benchmark, bulk, codes, counters, events, feed, importer, query_budget, search, urls
+from .dataset import DatasetGenerator
+from .forms import NonconformityFilterForm, NonconformityForm
+from .lookups import LookupCache, lookup_cache
+from .models import (
+    Category, CodeSequence, DeletedRecord, Nonconformity, NonconformityCounter, NonconformityLine, Severity, Status,
+)
+from .pagination import KeysetPaginator
+from .query_plans import find_full_scans, find_unordered_pages
+from .workflow import get_workflow
+from .views import NONCONFORMITY_ORDERING
+
+
+class NonconformityTestMixin:
+    """Datos de referencia comunes para los tests de la app."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('auditor', password='secret')
+        cls.severity = Severity.objects.create(name='Mayor')
+        cls.category = Category.objects.create(description='Proceso')
+        cls.open_status = Status.objects.create(
+            description='Abierta', is_initial=True, is_reopen_target=True
+        )
+        cls.closed_status = Status.objects.create(description='Cerrada', is_terminal=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    @classmethod
+    def create_nonconformity(cls, code, **kwargs):
+        kwargs.setdefault('description', f'Descripción de la no conformidad {code}')
+        kwargs.setdefault('severity', cls.severity)
+        kwargs.setdefault('category', cls.category)
+        kwargs.setdefault('status', cls.open_status)
+        kwargs.setdefault('user', cls.user)
+        return Nonconformity.objects.create(code=code, **kwargs)
+
+
+class KeysetPaginationTests(NonconformityTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        statuses = [cls.closed_status, None, cls.open_status]
+        for i in range(23):
+            cls.create_nonconformity(f'NC-{i:03d}', status=statuses[i % 3])
+
+    def expected_ids(self):
+        return list(
+            Nonconformity.objects.order_by(*NONCONFORMITY_ORDERING).values_list('id', flat=True)
+        )
+
+    def test_forward_and_backward_walks_cover_every_row_once(self):
+        paginator = KeysetPaginator(
+            Nonconformity.objects.all(), NONCONFORMITY_ORDERING, page_size=5
+        )
+        pages = [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(after=pages[-1].next_cursor))
+
+        forward_ids = [nc.id for page in pages for nc in page]
+        self.assertEqual(forward_ids, self.expected_ids())
+        self.assertFalse(pages[0].has_previous)
+
+        backward = [pages[-1]]
+        while backward[-1].has_previous:
+            backward.append(paginator.get_page(before=backward[-1].previous_cursor))
+        self.assertEqual(
+            [[nc.id for nc in page] for page in reversed(backward)],
+            [[nc.id for nc in page] for page in pages],
+        )
+
+    @override_settings(NONCONFORMITY_PAGE_SIZES=(10, 25, 50))
+    def test_list_view_keeps_filters_in_cursor_links(self):
+        other = Severity.objects.create(name='Menor')
+        self.create_nonconformity('NC-OTRA', severity=other)
+        url = reverse('nonconformities:nonconformity_list')
+        response = self.client.get(url, {'page_size': 10, 'severity': self.severity.pk})
+        seen = [nc['id'] for nc in response.context['page']]
+        query = QueryDict(response.context['next_querystring'])
+        self.assertEqual(query['severity'], str(self.severity.pk))
+        self.assertEqual(query['page_size'], '10')
+        self.assertTrue(query['after'])
+
+        # Siguiendo los enlaces se recorre solo el listado filtrado
+        while response.context['next_querystring']:
+            response = self.client.get(f"{url}?{response.context['next_querystring']}")
+            seen.extend(nc['id'] for nc in response.context['page'])
+        excluded = Nonconformity.objects.get(code='NC-OTRA').pk
+        self.assertEqual(seen, [pk for pk in self.expected_ids() if pk != excluded])
+
+        response = self.client.get(url, {'page_size': 7, 'severity': self.severity.pk})
+        # Tamaño no permitido: se usa el valor por defecto
+        self.assertEqual(response.context['page_size'], 50)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        url = reverse('nonconformities:nonconformity_list')
+        response = self.client.get(url, {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [nc['id'] for nc in response.context['page']], self.expected_ids()
+        )
+
+
+class RowProjectionQueryCountTests(NonconformityTestMixin, TestCase):
+    """El listado y la exportación no deben hacer consultas por fila."""
+
+    def query_count(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.create_nonconformity('NC-001')
+        self.query_count(url)  # Calienta la caché de tablas auxiliares
+        small = self.query_count(url)
+        for i in range(2, 30):
+            self.create_nonconformity(f'NC-{i:03d}', status=None if i % 4 else self.closed_status)
+        self.assertEqual(self.query_count(url), small)
+
+    def test_list_query_count_is_constant(self):
+        self.assertConstantQueries(reverse('nonconformities:nonconformity_list'))
+
+    def test_export_query_count_is_constant(self):
+        self.assertConstantQueries(reverse('nonconformities:export'))
+
+    def test_export_contains_joined_columns(self):
+        self.create_nonconformity('NC-001')
+        self.create_nonconformity('NC-002', severity=None, category=None, status=None)
+        response = self.client.get(reverse('nonconformities:export'))
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertIn('Mayor,Proceso,Abierta', rows[2])
+        self.assertTrue(rows[1].endswith(',,,'))
+
+    def test_streaming_export_applies_filters(self):
+        self.create_nonconformity('NC-001')
+        self.create_nonconformity('NC-002', status=self.closed_status)
+        response = self.client.get(reverse('nonconformities:export'), {'status': self.closed_status.pk})
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith('NC-002,'))
+
+
+class FullTextSearchTests(NonconformityTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.calibration = cls.create_nonconformity(
+            'NC-2025-001', description='Falla en la calibración del equipo de medición'
+        )
+        cls.document = cls.create_nonconformity(
+            'NC-2025-002', description='Documento obsoleto en el puesto de trabajo'
+        )
+
+    def listed_codes(self, **params):
+        response = self.client.get(reverse('nonconformities:nonconformity_list'), params)
+        return sorted(nc['code'] for nc in response.context['page'])
+
+    def test_search_is_accent_and_case_insensitive_with_prefixes(self):
+        self.assertEqual(self.listed_codes(description='CALIBRACION'), ['NC-2025-001'])
+        self.assertEqual(self.listed_codes(description='medic equip'), ['NC-2025-001'])
+        self.assertEqual(self.listed_codes(code='nc-2025-00'), ['NC-2025-001', 'NC-2025-002'])
+        self.assertEqual(self.listed_codes(code='2025-002'), ['NC-2025-002'])
+        # Prefijos de palabra, no subcadenas
+        self.assertEqual(self.listed_codes(code='025'), [])
+
+    def test_index_follows_saves_deletes_and_actions(self):
+        self.document.description = 'Registro de temperatura incompleto'
+        self.document.save()
+        self.assertEqual(self.listed_codes(description='obsoleto'), [])
+        self.assertEqual(self.listed_codes(description='temperatura'), ['NC-2025-002'])
+
+        NonconformityLine.objects.create(
+            nonconformity=self.calibration, action_description='Se sustituyó el termómetro'
+        )
+        # Las acciones solo se buscan con la búsqueda general
+        self.assertEqual(self.listed_codes(description='termometro'), [])
+        response = self.client.get(reverse('nonconformities:search'), {'q': 'termometro'})
+        self.assertEqual([result['code'] for result in response.json()['results']], ['NC-2025-001'])
+
+        self.calibration.delete()
+        self.assertEqual(self.listed_codes(code='NC'), ['NC-2025-002'])
+
+    def test_cascade_delete_does_not_reindex_per_action(self):
+        for i in range(5):
+            NonconformityLine.objects.create(nonconformity=self.calibration, action_description=f'Acción {i}')
+        line = NonconformityLine.objects.create(nonconformity=self.document, action_description='Acción suelta')
+        with mock.patch.object(search, 'index_nonconformities') as index:
+            line.delete()
+            index.assert_called_once_with([self.document.pk])
+            index.reset_mock()
+            self.calibration.delete()
+            index.assert_not_called()
+        self.assertEqual(self.listed_codes(code='NC'), ['NC-2025-002'])
+
+    def test_rebuild_command_restores_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM nonconformities_search')
+        self.assertEqual(self.listed_codes(description='documento'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.listed_codes(description='documento'), ['NC-2025-002'])
+
+    def test_ranked_search_endpoint(self):
+        response = self.client.get(reverse('nonconformities:search'), {'q': 'calibración'})
+        self.assertEqual(
+            [result['code'] for result in response.json()['results']], ['NC-2025-001']
+        )
+
+
+class IndexAwareFilteringTests(NonconformityTestMixin, TestCase):
+
+    def test_main_filter_combinations_use_indexes(self):
+        self.assertEqual(find_full_scans(), {})
+        self.assertEqual(find_unordered_pages(), {})
+        call_command('check_query_plans', verbosity=2, stdout=StringIO())
+
+    def test_unfiltered_list_is_reported_as_full_scan(self):
+        self.assertIn('all', find_full_scans({'all': {}}))
+
+    def test_pages_sorted_outside_the_index_are_reported(self):
+        # El índice por severidad no da el orden del listado
+        self.assertIn('severity (first)', find_unordered_pages({'severity': {'severity': '1'}}))
+
+    def test_creation_date_filter_is_a_half_open_day_range(self):
+        day_start = timezone.make_aware(datetime.datetime(2025, 1, 15))
+        for code, moment in [
+            ('NC-001', day_start - datetime.timedelta(microseconds=1)),
+            ('NC-002', day_start),
+            ('NC-003', day_start + datetime.timedelta(hours=23, minutes=59)),
+            ('NC-004', day_start + datetime.timedelta(days=1)),
+        ]:
+            nc = self.create_nonconformity(code)
+            Nonconformity.objects.filter(pk=nc.pk).update(creation_date=moment)
+
+        response = self.client.get(
+            reverse('nonconformities:nonconformity_list'), {'creation_date': '2025-01-15'}
+        )
+        self.assertEqual(
+            sorted(nc['code'] for nc in response.context['page']), ['NC-002', 'NC-003']
+        )
+
+        response = self.client.get(
+            reverse('nonconformities:nonconformity_list'), {'creation_date': '2025-02-30'}
+        )
+        self.assertEqual(len(response.context['page']), 4)
+
+
+class LookupCacheTests(NonconformityTestMixin, TestCase):
+
+    def test_dropdowns_cost_no_queries_once_warm(self):
+        form = NonconformityForm()
+        str(form['status'])  # Calienta la caché
+        with self.assertNumQueries(0):
+            rendered = str(NonconformityForm()['status']) + str(NonconformityFilterForm()['severity'])
+        self.assertIn('Cerrada', rendered)
+        self.assertIn('Mayor', rendered)
+
+    def test_form_validation_uses_cached_rows(self):
+        lookup_cache.all(Status)
+        form = NonconformityFilterForm({'status': self.closed_status.pk})
+        with self.assertNumQueries(0):
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['status'], self.closed_status)
+        self.assertFalse(NonconformityFilterForm({'status': 999}).is_valid())
+
+    @override_settings(NONCONFORMITY_LOOKUP_VERSION_TTL=0)
+    def test_saving_a_lookup_invalidates_every_process_cache(self):
+        other_process = LookupCache()
+        self.assertIn(self.open_status, other_process.all(Status))
+
+        Status.objects.create(description='En Progreso')
+        self.assertIn(
+            'En Progreso', [status.description for status in other_process.all(Status)]
+        )
+        self.assertIn(
+            'En Progreso', [status.description for status in lookup_cache.all(Status)]
+        )
+
+
+    @override_settings(NONCONFORMITY_LOOKUP_VERSION_TTL=60)
+    def test_other_processes_reread_the_version_after_the_ttl(self):
+        other_process = LookupCache()
+        other_process.all(Status)
+        Status.objects.create(description='En Progreso')
+        # El proceso que invalida la ve al instante; los demás, pasado el plazo
+        self.assertIn('En Progreso', [status.description for status in lookup_cache.all(Status)])
+        self.assertNotIn('En Progreso', [status.description for status in other_process.all(Status)])
+        later = time.monotonic() + 61
+        with mock.patch('nonconformities.lookups.time.monotonic', return_value=later):
+            self.assertIn('En Progreso', [status.description for status in other_process.all(Status)])
+
+    def test_tests_do_not_share_the_server_cache(self):
+        self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+
+class StatusWorkflowTests(NonconformityTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Estados con nombres que no coinciden con "abierta"/"cerrada"
+        cls.in_review = Status.objects.create(description='En revisión')
+        cls.done = Status.objects.create(description='Finalizada', is_terminal=True)
+        cls.open_status.allowed_next.set([cls.in_review])
+        cls.in_review.allowed_next.set([cls.done, cls.open_status])
+
+    def change_status(self, nc, status):
+        return self.client.post(
+            reverse('nonconformities:change_status', args=[nc.pk]),
+            {'status': status.pk},
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+
+    def test_transitions_follow_configured_roles(self):
+        nc = self.create_nonconformity('NC-001')
+        self.assertEqual(self.change_status(nc, self.in_review).status_code, 200)
+        response = self.change_status(nc, self.done)
+        self.assertEqual(response.status_code, 200)
+        nc.refresh_from_db()
+        self.assertEqual(nc.status, self.done)
+        self.assertIsNotNone(nc.closure_date)
+
+    def test_disallowed_transition_is_rejected(self):
+        nc = self.create_nonconformity('NC-001')
+        response = self.change_status(nc, self.done)
+        self.assertEqual(response.status_code, 400)
+        nc.refresh_from_db()
+        self.assertEqual(nc.status, self.open_status)
+
+    def test_transition_does_not_query_statuses(self):
+        nc = self.create_nonconformity('NC-001')
+        get_workflow()
+        with CaptureQueriesContext(connection) as ctx:
+            self.change_status(nc, self.in_review)
+        self.assertFalse([q for q in ctx.captured_queries if 'nonconformities_status' in q['sql']])
+
+    def test_close_and_reopen_use_workflow_roles(self):
+        self.in_review.allowed_next.add(self.closed_status)
+        nc = self.create_nonconformity('NC-001', status=self.in_review)
+        self.client.post(
+            reverse('nonconformities:close_nonconformity', args=[nc.pk]), {'confirm': 'on'}
+        )
+        nc.refresh_from_db()
+        self.assertEqual(nc.status, self.closed_status)
+        self.assertIsNotNone(nc.closure_date)
+
+        self.client.post(reverse('nonconformities:reopen_nonconformity', args=[nc.pk]))
+        nc.refresh_from_db()
+        self.assertEqual(nc.status, self.open_status)
+        self.assertIsNone(nc.closure_date)
+
+    def test_close_follows_the_configured_transitions(self):
+        # Abierta solo puede pasar a "En revisión"
+        nc = self.create_nonconformity('NC-001')
+        response = self.client.post(
+            reverse('nonconformities:close_nonconformity', args=[nc.pk]), {'confirm': 'on'}
+        )
+        self.assertRedirects(response, reverse('nonconformities:nonconformity_detail', args=[nc.pk]))
+        nc.refresh_from_db()
+        self.assertIsNone(nc.closure_date)
+        self.assertEqual(nc.status, self.open_status)
+
+        [result] = bulk.close([nc.pk], self.user)
+        self.assertEqual(result['result'], bulk.ERROR)
+        nc.refresh_from_db()
+        self.assertIsNone(nc.closure_date)
+
+    def edit(self, nc, status):
+        return self.client.post(reverse('nonconformities:update_nonconformity', args=[nc.pk]), {
+            'code': nc.code,
+            'description': nc.description,
+            'severity': self.severity.pk,
+            'category': self.category.pk,
+            'area': nc.area_id,
+            'status': status.pk,
+        })
+
+    def test_edit_follows_the_configured_transitions(self):
+        area = Area.objects.create(description='Producción', codification='PRD')
+        nc = self.create_nonconformity('NC-001', area=area)
+        response = self.edit(nc, self.done)
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context['form'], 'status', 'No se permite pasar de "Abierta" a "Finalizada"'
+        )
+        nc.refresh_from_db()
+        self.assertEqual(nc.status, self.open_status)
+        self.assertIsNone(nc.closure_date)
+
+        # Las transiciones permitidas fijan y limpian la fecha de cierre
+        self.edit(nc, self.in_review)
+        self.edit(nc, self.done)
+        nc.refresh_from_db()
+        self.assertEqual(nc.status, self.done)
+        self.assertIsNotNone(nc.closure_date)
+
+        self.edit(nc, self.open_status)
+        nc.refresh_from_db()
+        self.assertEqual(nc.status, self.open_status)
+        self.assertIsNone(nc.closure_date)
+
+
+class AggregateCounterTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.nc = self.create_nonconformity('NC-001')
+        self.create_nonconformity('NC-002', severity=None)
+        counters.rebuild()
+
+    def assertCountersMatch(self):
+        self.assertEqual(counters.find_mismatches(), {})
+
+    def test_views_keep_counters_in_sync(self):
+        self.client.post(
+            reverse('nonconformities:change_status', args=[self.nc.pk]),
+            {'status': self.closed_status.pk},
+        )
+        self.assertCountersMatch()
+        self.client.post(reverse('nonconformities:reopen_nonconformity', args=[self.nc.pk]))
+        self.assertCountersMatch()
+        self.client.post(
+            reverse('nonconformities:close_nonconformity', args=[self.nc.pk]), {'confirm': 'on'}
+        )
+        self.assertCountersMatch()
+
+        area = Area.objects.create(description='Producción', codification='PRD')
+        other = Category.objects.create(description='Producto')
+        self.client.post(reverse('nonconformities:update_nonconformity', args=[self.nc.pk]), {
+            'code': 'NC-001',
+            'description': 'Descripción modificada de la NC',
+            'severity': self.severity.pk,
+            'category': other.pk,
+            'area': area.pk,
+            'status': self.open_status.pk,
+        })
+        self.client.post(reverse('nonconformities:create_nonconformity'), {
+            'code': 'NC-003',
+            'description': 'Nueva no conformidad desde el formulario',
+            'severity': self.severity.pk,
+            'category': self.category.pk,
+            'area': area.pk,
+            'status': self.open_status.pk,
+        })
+        self.assertEqual(Nonconformity.objects.count(), 3)
+        self.assertCountersMatch()
+
+    def test_edits_on_a_stale_instance_keep_counters_and_other_changes(self):
+        stale = Nonconformity.objects.get(pk=self.nc.pk)
+        # Otra petición la cierra después de que esta la haya cargado
+        bulk.close([self.nc.pk], self.user)
+        area = Area.objects.create(description='Producción', codification='PRD')
+        with mock.patch('nonconformities.views.get_object_or_404', return_value=stale):
+            self.client.post(reverse('nonconformities:update_nonconformity', args=[self.nc.pk]), {
+                'code': 'NC-001',
+                'description': stale.description,
+                'severity': self.severity.pk,
+                'category': self.category.pk,
+                'area': area.pk,
+                'status': self.open_status.pk,
+            })
+        self.nc.refresh_from_db()
+        self.assertEqual((self.nc.status, self.nc.area), (self.closed_status, area))
+        self.assertIsNotNone(self.nc.closure_date)
+        self.assertCountersMatch()
+
+        stale = Nonconformity.objects.get(pk=self.nc.pk)
+        bulk.change_status([self.nc.pk], self.open_status, self.user)
+        with mock.patch('nonconformities.views.get_object_or_404', return_value=stale):
+            self.client.post(reverse('nonconformities:reopen_nonconformity', args=[self.nc.pk]))
+        self.assertCountersMatch()
+
+    def test_deleting_a_lookup_moves_its_counters(self):
+        self.severity.delete()
+        self.assertCountersMatch()
+
+    def test_dashboard_reads_only_the_summary_table(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('nonconformities:dashboard'))
+        self.assertEqual(response.context['total'], 2)
+        self.assertFalse(
+            [q for q in ctx.captured_queries if 'nonconformities_nonconformity"' in q['sql']]
+        )
+
+    def test_reconcile_command_detects_and_repairs_drift(self):
+        NonconformityCounter.objects.update(count=F('count') + 5)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', '--check', stdout=StringIO())
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCountersMatch()
+
+
+class DetailPartialCacheTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.nc = self.create_nonconformity('NC-001')
+        self.url = reverse('nonconformities:nonconformity_detail_partial', args=[self.nc.pk])
+
+    def test_unchanged_partial_answers_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_action_line_changes_the_version(self):
+        etag = self.client.get(self.url)['ETag']
+        NonconformityLine.objects.create(
+            nonconformity=self.nc, action_description='Acción de seguimiento', user=self.user
+        )
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Acción de seguimiento')
+
+    def test_cached_render_only_checks_the_version(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'NC-001')
+        nc_queries = [q for q in ctx.captured_queries if 'nonconformities_' in q['sql']]
+        self.assertEqual(len(nc_queries), 1)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+
+
+class ConditionalListTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.nc = self.create_nonconformity('NC-001')
+        self.create_nonconformity('NC-002')
+        self.list_url = reverse('nonconformities:nonconformity_list')
+        self.export_url = reverse('nonconformities:export')
+
+    def test_repeated_poll_answers_not_modified(self):
+        for url in (self.list_url, self.export_url):
+            etag = self.client.get(url, {'status': self.open_status.pk})['ETag']
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(
+                    url, {'status': self.open_status.pk}, headers={'If-None-Match': etag}
+                )
+            self.assertEqual(response.status_code, 304)
+            nc_queries = [q for q in ctx.captured_queries if 'nonconformities_' in q['sql']]
+            self.assertEqual(len(nc_queries), 1)
+
+    def test_logging_in_again_does_not_reuse_the_old_csrf_token(self):
+        self.client.logout()
+        self.client.post(reverse('login'), {'username': 'auditor', 'password': 'secret'})
+        etag = self.client.get(self.list_url)['ETag']
+        self.assertEqual(self.client.get(self.list_url, headers={'If-None-Match': etag}).status_code, 304)
+
+        self.client.post(reverse('logout'))
+        self.client.post(reverse('login'), {'username': 'auditor', 'password': 'secret'})
+        response = self.client.get(self.list_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_filters_and_pages_have_their_own_etag(self):
+        etag = self.client.get(self.list_url)['ETag']
+        response = self.client.get(
+            self.list_url, {'page_size': 25}, headers={'If-None-Match': etag}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_and_delete_change_the_etag(self):
+        etag = self.client.get(self.export_url)['ETag']
+        self.nc.description = 'Descripción corregida'
+        self.nc.save()
+        response = self.client.get(self.export_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        Nonconformity.objects.filter(code='NC-002').delete()
+        response = self.client.get(self.export_url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+
+class RowsFragmentTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for number in range(1, 27):
+            self.create_nonconformity(f'NC-{number:03d}')
+        self.create_nonconformity('NC-CERRADA', status=self.closed_status)
+        self.url = reverse('nonconformities:nonconformity_rows')
+
+    def test_fragment_has_only_the_rows_and_the_cursor(self):
+        response = self.client.get(self.url, {'status': self.open_status.pk, 'page_size': 25})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['rows'].count('class="nonconformity-row"'), 25)
+        self.assertNotIn('NC-CERRADA', data['rows'])
+        self.assertNotIn('<select', data['rows'])
+        self.assertIsNotNone(data['next_cursor'])
+        self.assertIn('rel="next"', data['pagination'])
+
+        response = self.client.get(self.url, {
+            'status': self.open_status.pk, 'page_size': 25, 'after': data['next_cursor'],
+        })
+        self.assertIn('NC-026', response.json()['rows'])
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_unchanged_filters_answer_not_modified(self):
+        etag = self.client.get(self.url, {'code': 'NC-00'})['ETag']
+        response = self.client.get(self.url, {'code': 'NC-00'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_renders_the_same_rows(self):
+        response = self.client.get(reverse('nonconformities:nonconformity_list'), {'page_size': 25})
+        rows = self.client.get(self.url, {'page_size': 25}).json()['rows']
+        self.assertContains(response, 'id="nonconformity-rows"')
+        self.assertContains(response, f'data-rows-url="{self.url}"')
+        self.assertContains(response, rows, html=True)
+
+
+@override_settings(NONCONFORMITY_ACTION_PAGE_SIZE=10)
+class ActionHistoryTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.nc = self.create_nonconformity('NC-001')
+        self.lines = NonconformityLine.objects.bulk_create([
+            NonconformityLine(nonconformity=self.nc, action_description=f'Acción número {i:02d}', user=self.user)
+            for i in range(25)
+        ])
+
+    def descriptions(self, html):
+        return [int(number) for number in re.findall(r'Acción número (\d+)', html)]
+
+    def test_panel_shows_the_latest_page_and_older_pages_load_on_demand(self):
+        html = self.client.get(reverse('nonconformities:nonconformity_detail_partial', args=[self.nc.pk])).content.decode()
+        seen = self.descriptions(html)
+        self.assertEqual(seen, list(range(24, 14, -1)))
+
+        while 'older-actions' in html:
+            url = re.search(r'data-url="([^"]+)"', html).group(1).replace('&amp;', '&')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            html = response.content.decode()
+            seen += self.descriptions(html)
+        self.assertEqual(seen, list(range(24, -1, -1)))
+
+    def test_last_page_reads_the_index_from_the_end(self):
+        paginator = KeysetPaginator(
+            NonconformityLine.objects.filter(nonconformity=self.nc), ('date', 'id'), 10
+        )
+        page = paginator.get_last_page()
+        self.assertEqual([line.pk for line in page], [line.pk for line in self.lines[-10:]])
+        self.assertIsNone(page.next_cursor)
+        older = paginator.get_page(before=page.previous_cursor)
+        self.assertEqual([line.pk for line in older], [line.pk for line in self.lines[5:15]])
+        self.assertEqual(older.next_cursor, paginator.encode_cursor([older.object_list[-1].date, older.object_list[-1].pk]))
+
+    def test_unknown_nc_and_invalid_cursor(self):
+        url = reverse('nonconformities:nonconformity_actions', args=[self.nc.pk])
+        self.assertEqual(self.client.get(url, {'before': 'no-es-un-cursor'}).status_code, 400)
+        missing = reverse('nonconformities:nonconformity_actions', args=[self.nc.pk + 100])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class BulkStatusChangeTests(NonconformityTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.in_review = Status.objects.create(description='En revisión')
+        cls.open_status.allowed_next.set([cls.in_review, cls.closed_status])
+        cls.closed_status.allowed_next.set([cls.open_status])
+        cls.ncs = [cls.create_nonconformity(f'NC-{i:04d}') for i in range(600)]
+        counters.rebuild()
+
+    def post(self, data):
+        return self.client.post(
+            reverse('nonconformities:bulk_change_status'), data,
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+
+    def test_bulk_close_uses_a_handful_of_queries(self):
+        ids = [nc.pk for nc in self.ncs]
+        get_workflow()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post({
+                'action': 'close', 'confirm': 'on', 'ids': ids, 'closing_comment': 'Auditoría 2024',
+            })
+        self.assertEqual(response.json()['totals'], {'updated': 600, 'unchanged': 0, 'error': 0})
+        self.assertLess(len(ctx.captured_queries), 25)
+
+        self.assertFalse(
+            Nonconformity.objects.filter(closure_date__isnull=True).exists()
+        )
+        self.assertEqual(
+            Nonconformity.objects.filter(status=self.closed_status).count(), 600
+        )
+        self.assertEqual(
+            NonconformityLine.objects.filter(action_description__contains='Auditoría 2024').count(), 600
+        )
+        self.assertEqual(counters.find_mismatches(), {})
+
+    def test_results_are_reported_per_item(self):
+        closed = self.ncs[0]
+        self.post({'action': 'close', 'confirm': 'on', 'ids': [closed.pk]})
+        missing_id = max(nc.pk for nc in self.ncs) + 1
+
+        response = self.post({
+            'action': 'status', 'status': self.in_review.pk,
+            'ids': [closed.pk, self.ncs[1].pk, missing_id],
+        })
+        results = {r['id']: r['result'] for r in response.json()['results']}
+        self.assertEqual(results, {closed.pk: 'error', self.ncs[1].pk: 'updated', missing_id: 'error'})
+
+        # Volver a un estado no final limpia la fecha de cierre
+        self.post({'action': 'status', 'status': self.open_status.pk, 'ids': [closed.pk]})
+        closed.refresh_from_db()
+        self.assertEqual(closed.status, self.open_status)
+        self.assertIsNone(closed.closure_date)
+        self.assertEqual(counters.find_mismatches(), {})
+
+    def test_invalid_status_is_rejected(self):
+        response = self.post({'action': 'status', 'status': 999, 'ids': [self.ncs[0].pk]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_status_action(self):
+        admin_user = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(admin_user)
+        ids = [nc.pk for nc in self.ncs[:3]]
+        response = self.client.post(reverse('admin:nonconformities_nonconformity_changelist'), {
+            'action': f'set_status_{self.in_review.pk}',
+            '_selected_action': ids,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Nonconformity.objects.filter(status=self.in_review).count(), 3)
+
+
+class BulkImportTests(NonconformityTestMixin, TestCase):
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_nonconformities', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import_validates_per_batch(self):
+        self.create_nonconformity('NC-EXISTENTE')
+        path = self.write_file('.csv', (
+            'Código,Fecha Apertura,Descripción,Severidad,Clasificación,Estado\n'
+            'nc-100,15/03/2021,Fuga de aceite en la prensa,mayor,Proceso,Cerrada\n'
+            'NC-101,2021-03-16,Etiquetado incorrecto de lote,Mayor,Proceso,\n'
+            'NC-101,2021-03-16,Código repetido en el fichero,Mayor,Proceso,\n'
+            'nc-existente,2021-03-16,Código que ya existe en la base,Mayor,Proceso,\n'
+            'NC-102,2021-03-16,Corta,Mayor,Proceso,\n'
+            'NC-103,2021-03-16,Severidad que no existe en la tabla,Crítica,Proceso,\n'
+        ))
+        with CaptureQueriesContext(connection) as ctx:
+            out, err = self.run_import(path, '--batch-size', '10')
+
+        self.assertIn('2 creados, 4 con errores', out)
+        self.assertIn('registro 3: El código "NC-101" ya existe', err)
+        self.assertIn('registro 4: El código "NC-EXISTENTE" ya existe', err)
+        self.assertEqual(
+            len([q for q in ctx.captured_queries if 'WHERE "nonconformities_nonconformity"."code" IN' in q['sql']]), 1
+        )
+
+        closed = Nonconformity.objects.get(code='NC-100')
+        self.assertEqual(closed.creation_date.date(), datetime.date(2021, 3, 15))
+        self.assertEqual(closed.status, self.closed_status)
+        self.assertIsNotNone(closed.closure_date)
+        self.assertEqual(Nonconformity.objects.get(code='NC-101').status, self.open_status)
+
+        counters.rebuild()
+        self.assertEqual(counters.find_mismatches(), {})
+        if search.is_available():
+            self.assertEqual(search.search('prensa'), [closed.pk])
+
+    def test_jsonl_import_with_actions_and_resume(self):
+        records = [
+            {
+                'code': f'NC-{i:03d}', 'description': f'Descripción importada número {i}',
+                'severity': 'Mayor', 'category': 'Proceso',
+                'actions': [{'description': 'Revisión inicial', 'date': '2020-01-02T10:00:00', 'user': 'auditor'}],
+            }
+            for i in range(5)
+        ]
+        path = self.write_file('.jsonl', '\n'.join(json.dumps(record) for record in records))
+
+        out, _ = self.run_import(path, '--batch-size', '2', '--offset', '3')
+        self.assertIn('para reanudar: --offset 5', out)
+        self.assertEqual(
+            sorted(Nonconformity.objects.values_list('code', flat=True)), ['NC-003', 'NC-004']
+        )
+        line = NonconformityLine.objects.get(nonconformity__code='NC-003')
+        self.assertEqual(line.user, self.user)
+        self.assertEqual(line.date.year, 2020)
+
+        self.run_import(path, '--batch-size', '2')
+        self.assertEqual(Nonconformity.objects.count(), 5)
+        self.assertEqual(NonconformityLine.objects.count(), 5)
+
+    def test_concurrent_code_conflict_is_reported_per_batch(self):
+        self.create_nonconformity('NC-001')
+        path = self.write_file('.csv', (
+            'code,description,severity,category\n'
+            'NC-001,Creada a la vez por otro proceso,Mayor,Proceso\n'
+            'NC-002,Segunda no conformidad del lote,Mayor,Proceso\n'
+        ))
+        # Simula un alta simultánea que la comprobación no ha llegado a ver
+        with mock.patch.object(importer, '_existing_codes', return_value=set()):
+            out, err = self.run_import(path)
+        self.assertIn('0 creados, 2 con errores', out)
+        self.assertIn('registro 2: Lote no importado', err)
+        self.assertFalse(Nonconformity.objects.filter(code='NC-002').exists())
+
+    def test_only_unreadable_files_are_reported_as_read_errors(self):
+        path = self.write_file('.jsonl', '{"code": "NC-001"\n')
+        with self.assertRaisesRegex(CommandError, 'Error de lectura'):
+            self.run_import(path)
+
+        path = self.write_file('.jsonl', '{"code": "NC-001"}\n')
+        with mock.patch.object(importer, 'import_nonconformities', side_effect=ValueError('fallo interno')):
+            with self.assertRaisesRegex(ValueError, 'fallo interno'):
+                self.run_import(path)
+
+    def test_lines_import_requires_existing_code(self):
+        self.create_nonconformity('NC-001')
+        path = self.write_file('.csv', (
+            'code,action_description,date\n'
+            'NC-001,Sustitución del retén,2022-05-01\n'
+            'NC-999,Acción de una NC inexistente,2022-05-01\n'
+        ))
+        out, err = self.run_import(path, '--lines', '--user', 'auditor')
+        self.assertIn('1 creados, 1 con errores', out)
+        self.assertIn('NC-999', err)
+        line = NonconformityLine.objects.get()
+        self.assertEqual((line.user, line.date.date()), (self.user, datetime.date(2022, 5, 1)))
+
+
+class BenchmarkTests(TestCase):
+
+    def test_generator_is_reproducible_and_consistent(self):
+        created, lines = DatasetGenerator(seed=7, batch_size=40).generate(100)
+        self.assertEqual((created, Nonconformity.objects.count()), (100, 100))
+        self.assertEqual(lines, NonconformityLine.objects.count())
+        self.assertEqual(counters.find_mismatches(), {})
+        self.assertFalse(
+            Nonconformity.objects.filter(status__is_terminal=True, closure_date__isnull=True).exists()
+        )
+        first = list(Nonconformity.objects.order_by('pk').values_list('code', 'description')[:5])
+
+        # Una segunda tanda continúa la numeración sin duplicar auxiliares
+        DatasetGenerator(seed=7).generate(10)
+        self.assertEqual(Nonconformity.objects.count(), 110)
+        self.assertEqual(Status.objects.filter(is_initial=True).count(), 1)
+        self.assertEqual(Nonconformity.objects.order_by('-code').values_list('code', flat=True)[0], 'SYN-0000110')
+
+        Nonconformity.objects.all().delete()
+        DatasetGenerator(seed=7, batch_size=40).generate(100)
+        self.assertEqual(list(Nonconformity.objects.order_by('pk').values_list('code', 'description')[:5]), first)
+
+    def test_run_scenarios_reports_every_view(self):
+        DatasetGenerator(seed=1).generate(30)
+        self.client.force_login(User.objects.create_user('benchmark'))
+        scenarios = benchmark.build_scenarios(benchmark.collect_sample())
+        results = benchmark.run_scenarios(self.client, scenarios, repeat=2, aliases=['default'])
+
+        self.assertEqual(
+            set(results),
+            {scenario.name for scenario in scenarios},
+        )
+        self.assertIn('list[description]', results)
+        for name in ('detail_partial', 'export', 'add_action', 'change_status'):
+            self.assertGreater(results[name]['queries'], 0)
+            self.assertGreater(results[name]['peak_memory_kib'], 0)
+            self.assertLessEqual(results[name]['p50_ms'], results[name]['max_ms'])
+
+        report = {'results': {'30': results}}
+        rows = benchmark.compare(report, report)
+        self.assertTrue(rows)
+        self.assertTrue(all(change == 0 for *_, change in rows))
+
+
+# El flujo de eventos termina tras enviar lo pendiente
+@override_settings(NONCONFORMITY_EVENTS_STREAM_SECONDS=0, NONCONFORMITY_LIVE_UPDATES=True)
+class QueryBudgetTests(NonconformityTestMixin, TestCase):
+    """Comprueba query_budget.BUDGETS con dos tamaños de datos."""
+
+    # Número de NC de cada medición; las NC destino tienen size // 5 acciones
+    SIZES = (10, 120)
+
+    def grow_to(self, size, generator):
+        generator.generate(size - Nonconformity.objects.count())
+        lines = size // 5 - NonconformityLine.objects.filter(nonconformity=self.open_nc).count()
+        NonconformityLine.objects.bulk_create([
+            NonconformityLine(nonconformity=nc, action_description=f'Acción de seguimiento {i}', user=self.user)
+            for nc in (self.open_nc, self.closed_nc) for i in range(lines)
+        ])
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names - {budget.url_name for budget in query_budget.BUDGETS}, set())
+
+    def test_views_stay_within_budget(self):
+        self.open_nc = self.create_nonconformity('NC-ABIERTA', description='Fuga en la prensa principal')
+        self.closed_nc = self.create_nonconformity(
+            'NC-CERRADA', status=self.closed_status, closure_date=timezone.now()
+        )
+        generator = DatasetGenerator(seed=3, lines_mean=2)
+
+        logs = {budget.label: {} for budget in query_budget.BUDGETS}
+        for size in self.SIZES:
+            self.grow_to(size, generator)
+            context = {
+                'open': self.open_nc.pk,
+                'closed': self.closed_nc.pk,
+                'code': self.open_nc.code,
+                'status': self.open_status.pk,
+                'next_status': Status.objects.get(description='En análisis').pk,
+                'severity': self.severity.pk,
+                'category': self.category.pk,
+                'area': Area.objects.order_by('pk').values_list('pk', flat=True).first(),
+                'creation_date': self.open_nc.creation_date.date().isoformat(),
+                'ids': ','.join(str(pk) for pk in Nonconformity.objects.values_list('pk', flat=True)[:20]),
+            }
+            for budget in query_budget.BUDGETS:
+                # Cada petición parte de los mismos datos
+                with transaction.atomic():
+                    logs[budget.label][size] = query_budget.measure(self.client, budget, context)
+                    transaction.set_rollback(True)
+
+        failures = [query_budget.check(budget, logs[budget.label]) for budget in query_budget.BUDGETS]
+        failures = [failure for failure in failures if failure]
+        if failures:
+            self.fail('Presupuesto de consultas superado:\n' + '\n\n'.join(failures))
+
+
+class AsyncViewsTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.nc = self.create_nonconformity('NC-001')
+        self.create_nonconformity('NC-002', status=self.closed_status, closure_date=timezone.now())
+        NonconformityLine.objects.create(
+            nonconformity=self.nc, action_description='Acción registrada', user=self.user
+        )
+
+    async def get(self, name, *args, headers=None, **params):
+        with benchmark.serving_async_views(True):
+            url = reverse(f'nonconformities:{name}', args=args)
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func))
+            await self.async_client.aforce_login(self.user)
+            return await self.async_client.get(url, params, headers=headers)
+
+    async def test_export_matches_the_sync_export(self):
+        response = await self.get('export', status=self.open_status.pk)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+
+        def sync_export():
+            response = self.client.get(reverse('nonconformities:export'), {'status': self.open_status.pk})
+            return response['ETag'], b''.join(response.streaming_content)
+
+        self.assertEqual((response['ETag'], body), await sync_to_async(sync_export)())
+
+        response = await self.get(
+            'export', status=self.open_status.pk, headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_detail_partial_renders_and_revalidates(self):
+        response = await self.get('nonconformity_detail_partial', self.nc.pk)
+        self.assertContains(response, 'Acción registrada')
+        self.assertContains(response, 'Cerrada')
+
+        response = await self.get(
+            'nonconformity_detail_partial', self.nc.pk, headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.get('nonconformity_detail_partial', 0)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_list_pages_with_the_async_orm(self):
+        response = await self.get('nonconformity_list', page_size=25)
+        self.assertContains(response, 'NC-001')
+        self.assertContains(response, 'NC-002')
+
+        response = await self.get(
+            'nonconformity_list', page_size=25, headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(REQUEST_INSTRUMENTATION=True)
+    async def test_instrumentation_runs_in_async_mode(self):
+        response = await self.get('nonconformity_list')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;desc=', response['Server-Timing'])
+        self.assertNotIn('view;desc="Vista";dur=0.0,', response['Server-Timing'])
+
+
+@override_settings(NONCONFORMITY_EVENTS_STREAM_SECONDS=0, NONCONFORMITY_LIVE_UPDATES=True)
+class LiveEventsTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.nc = self.create_nonconformity('NC-001')
+        self.url = reverse('nonconformities:nonconformity_events')
+
+    def test_saves_publish_the_rendered_row_after_commit(self):
+        start = events.bus.sequence
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nc.status = self.closed_status
+            self.nc.save()
+        [event] = events.bus.after(start)
+        data = event.data()
+        self.assertEqual([row['id'] for row in data['rows']], [self.nc.pk])
+        self.assertEqual(data['rows'][0]['status'], self.closed_status.pk)
+        self.assertIn('NC-001', data['rows'][0]['row'])
+
+        start = events.bus.sequence
+        with self.captureOnCommitCallbacks(execute=True):
+            NonconformityLine.objects.create(
+                nonconformity=self.nc, action_description='Acción en vivo', user=self.user
+            )
+            Nonconformity.objects.get(pk=self.nc.pk).delete()
+        self.assertEqual(events.bus.after(start)[-1].data(), {'rows': [], 'deleted': [self.nc.pk]})
+
+    def test_list_subscribes_from_its_render_position_only_when_enabled(self):
+        response = self.client.get(reverse('nonconformities:nonconformity_list'))
+        self.assertContains(response, f'data-events-url="{self.url}?last_event_id={events.bus.last_id()}"')
+
+        with self.settings(NONCONFORMITY_LIVE_UPDATES=False):
+            response = self.client.get(reverse('nonconformities:nonconformity_list'))
+            self.assertNotContains(response, 'data-events-url')
+            # Una página abierta antes deja de reconectar
+            self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    def test_large_batches_and_lost_events_ask_for_a_reload(self):
+        bus = events.EventBus(size=2)
+        with self.settings(NONCONFORMITY_EVENTS_MAX_ROWS=2):
+            first = bus.publish_changes([1, 2, 3])
+        self.assertEqual(first.kind, events.RESET)
+        bus.publish_changes([1])
+        bus.publish_changes([2])
+        bus.publish_changes([3])
+        # El evento siguiente a `first` ya no está en el búfer
+        self.assertIsNone(bus.resume(first.id))
+        self.assertIsNone(bus.resume('otro-arranque-1'))
+        self.assertEqual(bus.resume(f'{bus.boot}-2'), 2)
+        self.assertEqual([event.ids for event in bus.after(2)], [(2,), (3,)])
+
+    def test_stream_resumes_from_last_event_id(self):
+        last_event_id = f'{events.bus.boot}-{events.bus.sequence}'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nc.description = 'Descripción cambiada en vivo'
+            self.nc.save()
+
+        response = self.client.get(self.url, headers={'Last-Event-ID': last_event_id})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: change', body)
+        self.assertIn('cambiada en vivo', body)
+
+        response = self.client.get(self.url, headers={'Last-Event-ID': 'otro-arranque-1'})
+        self.assertIn('event: reset', b''.join(response.streaming_content).decode())
+
+    async def test_async_stream_wakes_on_publish(self):
+        bus = events.EventBus()
+        started = time.monotonic()
+        threading.Timer(0.05, bus.publish, args=(events.RESET,)).start()
+        found = await bus.await_after(0, timeout=5)
+        self.assertEqual([event.kind for event in found], [events.RESET])
+        self.assertLess(time.monotonic() - started, 4)
+
+        with benchmark.serving_async_views(True):
+            await self.async_client.aforce_login(self.user)
+            response = await self.async_client.get(self.url, headers={'Last-Event-ID': 'otro-arranque-1'})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn('event: reset', body)
+
+
+class ExportJobTests(NonconformityTestMixin, TestCase):
+
+    def test_background_export_matches_the_streamed_export(self):
+        self.create_nonconformity('NC-001')
+        self.create_nonconformity('NC-002', status=self.closed_status)
+        query = {'status': self.open_status.pk}
+        with tempfile.TemporaryDirectory() as directory, self.settings(JOBS_RESULT_DIR=directory):
+            response = self.client.post(f"{reverse('nonconformities:export_job')}?status={self.open_status.pk}")
+            job = Job.objects.get()
+            self.assertRedirects(response, reverse('core:job_detail', args=[job.pk]))
+            self.assertEqual(job.params, {'filters': {'status': str(self.open_status.pk)}})
+
+            call_command('run_jobs', once=True, processes=0, stdout=StringIO())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.progress, job.total), (Job.DONE, 1, 1))
+            with open(jobs.result_path(job), encoding='utf-8', newline='') as result:
+                exported = result.read()
+
+        streamed = self.client.get(reverse('nonconformities:export'), query)
+        self.assertEqual(exported, b''.join(streamed.streaming_content).decode())
+        self.assertIn('NC-001', exported)
+        self.assertNotIn('NC-002', exported)
+
+
+class CodeAllocationTests(NonconformityTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.area = Area.objects.create(description='Producción', codification='PRD')
+
+    def post_nonconformity(self, code=''):
+        return self.client.post(reverse('nonconformities:create_nonconformity'), {
+            'code': code, 'description': 'Descripción de la no conformidad', 'area': self.area.pk,
+            'severity': self.severity.pk, 'category': self.category.pk, 'status': self.open_status.pk,
+        })
+
+    def test_blank_code_takes_the_next_number_of_its_area_and_year(self):
+        year = timezone.localdate().year
+        # La secuencia parte del mayor código existente
+        self.create_nonconformity(f'NC-PRD-{year}-007')
+        self.post_nonconformity()
+        self.post_nonconformity()
+        self.assertTrue(Nonconformity.objects.filter(code=f'NC-PRD-{year}-008').exists())
+        self.assertTrue(Nonconformity.objects.filter(code=f'NC-PRD-{year}-009').exists())
+        self.assertEqual(CodeSequence.objects.get(area_code='PRD', year=year).last_number, 9)
+
+    def test_manual_codes_advance_the_sequence_and_duplicates_are_form_errors(self):
+        year = timezone.localdate().year
+        self.post_nonconformity()
+        self.post_nonconformity(f'nc-prd-{year}-020')
+        self.assertEqual(CodeSequence.objects.get(area_code='PRD', year=year).last_number, 20)
+
+        response = self.post_nonconformity(f'NC-PRD-{year}-020')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ya existe', str(response.context['form'].errors['code']))
+        self.post_nonconformity()
+        self.assertTrue(Nonconformity.objects.filter(code=f'NC-PRD-{year}-021').exists())
+
+    def test_area_codifications_with_separators_are_observed(self):
+        year = timezone.localdate().year
+        self.area = Area.objects.create(description='Calidad', codification='QA-1_B')
+        self.post_nonconformity()
+        self.post_nonconformity(f'NC-QA-1_B-{year}-005')
+        self.assertEqual(CodeSequence.objects.get(area_code='QA-1_B', year=year).last_number, 5)
+        self.post_nonconformity()
+        self.assertTrue(Nonconformity.objects.filter(code=f'NC-QA-1_B-{year}-006').exists())
+        # Sin área: el año y el número no se confunden con una codificación
+        self.assertEqual(codes.CODE_RE.match(f'NC-{year}-001')['area'], None)
+
+    @override_settings(NONCONFORMITY_CODE_BLOCK_SIZE=3)
+    def test_blocks_are_reserved_once_and_used_after_commit(self):
+        self.addCleanup(codes.allocator.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                first = codes.allocator.allocate(self.area, 2025)
+        # Un código manual ocupa un número ya reservado en el bloque
+        self.create_nonconformity('NC-PRD-2025-002')
+        codes.observe(['NC-PRD-2025-002'])
+        # Sin escribir en la secuencia: solo se comprueba el código
+        with self.assertNumQueries(2):
+            following = codes.allocator.allocate(self.area, 2025)
+        self.assertEqual([first, following], ['NC-PRD-2025-001', 'NC-PRD-2025-003'])
+        self.assertEqual(CodeSequence.objects.get(area_code='PRD', year=2025).last_number, 3)
+
+        # Un bloque de una transacción deshecha no se reutiliza en este proceso
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.assertEqual(codes.allocator.allocate(self.area, 2025), 'NC-PRD-2025-004')
+                transaction.set_rollback(True)
+        self.assertEqual(codes.allocator.allocate(self.area, 2025), 'NC-PRD-2025-004')
+
+
+@override_settings(NONCONFORMITY_FEED_LAG_SECONDS=0)
+class ChangeFeedTests(NonconformityTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('nonconformities:change_feed')
+
+    def read_feed(self, cursor=None, limit=None):
+        """Registros y línea final de una página del endpoint."""
+        params = {key: value for key, value in (('cursor', cursor), ('limit', limit)) if value}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        return lines[:-1], lines[-1]
+
+    def test_upserts_and_tombstones_resume_from_the_cursor(self):
+        nc = self.create_nonconformity('NC-001')
+        line = NonconformityLine.objects.create(nonconformity=nc, action_description='Acción', user=self.user)
+        records, end = self.read_feed()
+        self.assertEqual(
+            [(record['type'], record['op'], record['id']) for record in records],
+            # La acción actualiza la NC: cada registro sale una vez, en su última versión
+            [('line', 'upsert', line.pk), ('nonconformity', 'upsert', nc.pk)],
+        )
+        self.assertEqual(records[0]['data']['action_description'], 'Acción')
+        self.assertFalse(end['has_more'])
+
+        # Desde el cursor solo llega lo nuevo, incluidas las bajas de la NC y sus acciones
+        other = self.create_nonconformity('NC-002')
+        pk, line_pk = nc.pk, line.pk
+        nc.delete()
+        records, end = self.read_feed(end['cursor'])
+        self.assertEqual(
+            [(record['type'], record['op'], record['id']) for record in records],
+            [('nonconformity', 'upsert', other.pk), ('line', 'delete', line_pk), ('nonconformity', 'delete', pk)],
+        )
+        self.assertEqual(self.read_feed(end['cursor'])[0], [])
+
+    def test_pages_are_bounded_and_cover_every_change_once(self):
+        ncs = [self.create_nonconformity(f'NC-{i:03d}') for i in range(5)]
+        # Misma fecha en todas: el id desempata
+        Nonconformity.objects.update(updated_at=timezone.now() - datetime.timedelta(minutes=1))
+        seen, cursor, pages = [], None, 0
+        while True:
+            records, end = self.read_feed(cursor, limit=2)
+            self.assertLessEqual(len(records), 2)
+            seen.extend(record['id'] for record in records)
+            cursor, pages = end['cursor'], pages + 1
+            if not end['has_more']:
+                break
+        self.assertEqual(seen, [nc.pk for nc in ncs])
+        self.assertEqual(pages, 3)
+
+    def test_recent_changes_wait_for_the_settle_lag(self):
+        self.create_nonconformity('NC-001')
+        with self.settings(NONCONFORMITY_FEED_LAG_SECONDS=60):
+            records, end = self.read_feed()
+        self.assertEqual(records, [])
+        # El cursor no avanza más allá de lo entregado
+        self.assertEqual(len(self.read_feed(end['cursor'])[0]), 1)
+
+    def test_invalid_and_expired_cursors_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'no-es-un-cursor'}).status_code, 400)
+        old = feed.cursor_since(timezone.now() - datetime.timedelta(days=365))
+        self.assertEqual(self.client.get(self.url, {'cursor': old}).status_code, 410)
+
+        DeletedRecord.objects.create(kind=DeletedRecord.LINE, object_id=1, deleted_at=timezone.now() - datetime.timedelta(days=365))
+        DeletedRecord.objects.create(kind=DeletedRecord.LINE, object_id=2)
+        self.assertEqual(feed.prune_tombstones(), 1)
+
+    def test_command_saves_the_cursor_in_the_state_file(self):
+        nc = self.create_nonconformity('NC-001')
+        with tempfile.TemporaryDirectory() as directory:
+            state = os.path.join(directory, 'cursor')
+            stdout = StringIO()
+            call_command('export_changes', state=state, limit=1, stdout=stdout, stderr=StringIO())
+            lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+            self.assertEqual([line['id'] for line in lines[:-1]], [nc.pk])
+            self.assertEqual(lines[-1]['type'], 'cursor')
+
+            pk = nc.pk
+            nc.delete()
+            stdout = StringIO()
+            call_command('export_changes', state=state, stdout=stdout, stderr=StringIO())
+            [tombstone, _] = [json.loads(line) for line in stdout.getvalue().splitlines()]
+            self.assertEqual((tombstone['op'], tombstone['id']), ('delete', pk))
@@ -1,22 +1,34 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'nonconformities'
 
+# Con ASGI, listado, exportación, panel de detalle y eventos son asíncronos (async_views.py)
+streaming_views = async_views if settings.NONCONFORMITY_ASYNC_VIEWS else views
+
 urlpatterns = [
-    path('', views.nonconformity_list, name='nonconformity_list'),
-    path('export/', views.export_nonconformities, name='export'),
+    path('', streaming_views.nonconformity_list, name='nonconformity_list'),
+    path('rows/', views.nonconformity_rows, name='nonconformity_rows'),
+    path('events/', streaming_views.nonconformity_events, name='nonconformity_events'),
+    path('export/', streaming_views.export_nonconformities, name='export'),
+    path('export/job/', views.export_job, name='export_job'),
+    path('feed/', views.change_feed, name='change_feed'),
+    path('search/', views.search_nonconformities, name='search'),
+    path('dashboard/', views.dashboard, name='dashboard'),
 
     # CRUD de No Conformidades
     path('create/', views.create_nonconformity, name='create_nonconformity'),
     path('<int:pk>/edit/', views.update_nonconformity, name='update_nonconformity'),
     path('detail/<int:pk>/', views.nonconformity_detail, name='nonconformity_detail'),
-    path('detail/partial/<int:pk>/', views.nonconformity_detail_partial, name='nonconformity_detail_partial'),
+    path('detail/partial/<int:pk>/', streaming_views.nonconformity_detail_partial, name='nonconformity_detail_partial'),
+    path('detail/partial/<int:pk>/actions/', views.nonconformity_actions, name='nonconformity_actions'),
 
     # Gestión de estado
     path('<int:pk>/change-status/', views.change_status, name='change_status'),
     path('<int:pk>/close/', views.close_nonconformity, name='close_nonconformity'),
     path('<int:pk>/reopen/', views.reopen_nonconformity, name='reopen_nonconformity'),
+    path('bulk/', views.bulk_change_status, name='bulk_change_status'),
 
     # Gestión de acciones
     path('<int:pk>/add-action/', views.add_action, name='add_action'),
@@ -1,100 +1,554 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition, require_POST
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
 from django.utils import timezone
-from .models import Nonconformity, NonconformityLine, Severity, Category, Status
+from django.utils.dateparse import parse_date
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme, urlencode
+from core import jobs
+from core.models import Area
+from .models import Category, Nonconformity, NonconformityCounter, NonconformityLine, Severity, Status
 from .forms import NonconformityStatusForm, NonconformityCloseForm, NonconformityLineForm, NonconformityForm
-import csv
+from . import bulk, codes, counters, events, feed, lookups, search, tasks
+from .exports import iter_csv
+from .pagination import InvalidCursor, KeysetPaginator
+from .workflow import get_workflow
+from datetime import datetime, time, timedelta
+import hashlib
+
+# Orden del listado; 'id' desempata para que el cursor sea estable. Son
+# columnas de la propia tabla, en el orden de nc_status_created_idx (en
+# SQLite el índice incluye el id): el índice da el orden y la búsqueda del
+# cursor, y cada página lee solo sus filas (ver query_plans.py)
+NONCONFORMITY_ORDERING = ('status_id', 'creation_date', 'id')
+
+# Orden del historial de acciones. El panel de detalle muestra la última
+# página (las más recientes) y pide las anteriores al desplazarse.
+ACTION_HISTORY_ORDERING = ('date', 'id')
+
+# Columnas que muestran el listado y la exportación. Las descripciones de
+# las tablas auxiliares se traen con JOIN en la misma consulta.
+NONCONFORMITY_ROW_FIELDS = ('id', 'code', 'creation_date', 'description')
+NONCONFORMITY_ROW_RELATED = {
+    'severity_name': F('severity__name'),
+    'category_description': F('category__description'),
+    'status_description': F('status__description'),
+}
+
+def get_day_range(value):
+    """
+    Convierte 'AAAA-MM-DD' en el intervalo [inicio, fin) de ese día en la
+    zona horaria actual. Devuelve None si la fecha no es válida.
+
+    Filtrar por rango (en lugar de creation_date__date) permite usar los
+    índices sobre creation_date.
+    """
+    try:
+        day = parse_date(value)
+    except ValueError:
+        return None
+    if day is None:
+        return None
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
 
 def get_filtered_nonconformities(request):
-    code = request.GET.get('code', '').strip()
-    creation_date = request.GET.get('creation_date', '').strip()
-    description = request.GET.get('description', '').strip()
-    severity_id = request.GET.get('severity', '').strip()
-    category_id = request.GET.get('category', '').strip()
-    status_id = request.GET.get('status', '').strip()
+    """
+    Devuelve las filas filtradas según los parámetros GET como diccionarios
+    con solo las columnas mostradas (NONCONFORMITY_ROW_FIELDS y
+    NONCONFORMITY_ROW_RELATED), en una única consulta.
+    """
+    return filter_nonconformities(request.GET)
+
+def filter_nonconformities(params):
+    """Igual que get_filtered_nonconformities, a partir de un diccionario de filtros."""
+    nonconformities = Nonconformity.objects.filter(**get_nonconformity_filters(params)).values(
+        *NONCONFORMITY_ROW_FIELDS, **NONCONFORMITY_ROW_RELATED
+    )
+    nonconformities = nonconformities.order_by(*NONCONFORMITY_ORDERING)
+
+    return nonconformities
+
+def get_nonconformity_filters(params):
+    """Argumentos de filter() correspondientes a los parámetros del listado."""
+    code = params.get('code', '').strip()
+    creation_date = params.get('creation_date', '').strip()
+    description = params.get('description', '').strip()
+    severity_id = params.get('severity', '').strip()
+    category_id = params.get('category', '').strip()
+    status_id = params.get('status', '').strip()
+    area_id = params.get('area', '').strip()
 
     filters = {}
 
-    if code:
-        filters['code__icontains'] = code
+    # Los textos se buscan en el índice FTS5 si está disponible: por palabras
+    # que empiezan por el texto, no por subcadena (ver search.py)
+    match_query = None
+    if search.is_available():
+        match_query = search.build_filter_query(code=code, description=description)
+
+    if match_query:
+        filters['id__in'] = search.matching_ids(match_query)
+    else:
+        if code:
+            filters['code__icontains'] = code
+        if description:
+            filters['description__icontains'] = description
     if creation_date:
-        filters['creation_date__date'] = creation_date
-    if description:
-        filters['description__icontains'] = description
+        day_range = get_day_range(creation_date)
+        if day_range:
+            filters['creation_date__gte'], filters['creation_date__lt'] = day_range
     if severity_id.isdigit():
         filters['severity_id'] = int(severity_id)
     if category_id.isdigit():
         filters['category_id'] = int(category_id)
     if status_id.isdigit():
         filters['status_id'] = int(status_id)
+    if area_id.isdigit():
+        filters['area_id'] = int(area_id)
 
-    nonconformities = Nonconformity.objects.filter(**filters)
-    nonconformities = nonconformities.order_by('status__description', 'creation_date')
+    return filters
 
-    return nonconformities
+def get_filter_set_version(params):
+    """
+    Versión del conjunto de NC que cumplen los filtros: fecha de la última
+    modificación y número de filas, en una sola consulta agregada sin
+    JOIN ni ORDER BY. El recuento detecta las bajas, que no mueven
+    max(updated_at).
+    """
+    stats = Nonconformity.objects.filter(**get_nonconformity_filters(params)).aggregate(
+        last_updated=Max('updated_at'),
+        total=Count('id'),
+    )
+    return format_filter_set_version(stats)
+
+def format_filter_set_version(stats):
+    last_updated = stats['last_updated'].timestamp() if stats['last_updated'] else 0
+    return f'{stats["total"]}-{last_updated:.6f}'
+
+def get_filtered_etag(request, *extra):
+    """
+    ETag de una respuesta que solo depende de los filtros GET, del
+    contenido filtrado y de las tablas auxiliares. `extra` añade lo que
+    además distinga la respuesta (p. ej. la vista o el usuario).
+    """
+    return make_filtered_etag(request, get_filter_set_version(request.GET), *extra)
+
+def make_filtered_etag(request, set_version, *extra):
+    """ETag de get_filtered_etag() con la versión del conjunto ya calculada."""
+    parts = [
+        *map(str, extra),
+        set_version,
+        lookups.lookup_cache.version(),
+        urlencode(sorted(request.GET.lists()), doseq=True),
+    ]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def get_page_size(request):
+    """Tamaño de página pedido en ?page_size=, limitado a los valores permitidos."""
+    page_size = request.GET.get('page_size', '').strip()
+    if page_size.isdigit() and int(page_size) in settings.NONCONFORMITY_PAGE_SIZES:
+        return int(page_size)
+    return settings.NONCONFORMITY_PAGE_SIZE
+
+def get_page_querystring(request, **params):
+    """Querystring con los filtros actuales y los parámetros de paginación indicados."""
+    query = request.GET.copy()
+    for key in ('after', 'before'):
+        query.pop(key, None)
+    for key, value in params.items():
+        query[key] = value
+    return query.urlencode()
+
+def paginate_nonconformities(request, nonconformities):
+    """Devuelve la página pedida por ?after= / ?before= del listado filtrado."""
+    paginator = KeysetPaginator(nonconformities, NONCONFORMITY_ORDERING, get_page_size(request))
+    try:
+        return paginator.get_page(
+            after=request.GET.get('after') or None,
+            before=request.GET.get('before') or None,
+        )
+    except InvalidCursor:
+        # Cursor manipulado o de otra versión: volver a la primera página
+        return paginator.get_page()
+
+def get_csrf_secret(request):
+    """
+    Secreto CSRF de la cookie: los formularios de la página llevan un token
+    derivado de él y el inicio de sesión lo renueva. Un 304 tras volver a
+    entrar reutilizaría formularios con el token anterior (403 al enviarlos).
+    """
+    # Sin cookie aún, get_token() crea el secreto que usará la página
+    get_token(request)
+    return request.META['CSRF_COOKIE']
+
+def get_list_etag(request):
+    """
+    ETag del listado. Incluye el usuario (la página muestra su sesión) y su
+    secreto CSRF, y no se emite si hay mensajes pendientes, que solo se
+    muestran una vez.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    return get_filtered_etag(request, 'list', request.user.pk, get_csrf_secret(request))
 
 @login_required
+@condition(etag_func=lambda request: get_list_etag(request))
 def nonconformity_list(request):
-    severities = Severity.objects.all()
-    categories = Category.objects.all()
-    statuses = Status.objects.all()
+    # Antes de leer las filas: un cambio posterior llega como evento
+    last_event_id = events.bus.last_id()
+    page = paginate_nonconformities(request, get_filtered_nonconformities(request))
+    return render_nonconformity_list(request, page, last_event_id)
 
-    nonconformities = get_filtered_nonconformities(request)
+def render_nonconformity_list(request, page, last_event_id):
+    """
+    Respuesta del listado para una página ya obtenida. `last_event_id` es
+    la posición del bus de eventos antes de leer las filas (ver events.py).
+    """
+    # Desplegables desde la caché de tablas auxiliares (sin consultas)
+    severities = lookups.severities()
+    categories = lookups.categories()
+    statuses = lookups.statuses()
 
     context = {
-        'nonconformities': nonconformities,
+        **get_page_context(request, page),
+        'page_sizes': settings.NONCONFORMITY_PAGE_SIZES,
         'severities': severities,
         'categories': categories,
         'statuses': statuses,
+        'live_updates': settings.NONCONFORMITY_LIVE_UPDATES,
+        'last_event_id': last_event_id,
+    }
+    response = render(request, 'nonconformities/nonconformity_list.html', context)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def get_page_context(request, page):
+    """Contexto de las filas y de los enlaces de paginación."""
+    return {
+        'nonconformities': page,
+        'page': page,
+        'page_size': page.page_size,
+        'next_querystring': get_page_querystring(request, after=page.next_cursor) if page.has_next else '',
+        'previous_querystring': get_page_querystring(request, before=page.previous_cursor) if page.has_previous else '',
     }
-    return render(request, 'nonconformities/nonconformity_list.html', context)
 
 @login_required
+@condition(etag_func=lambda request: get_filtered_etag(request, 'rows'))
+def nonconformity_rows(request):
+    """
+    Filas de la tabla y enlaces de paginación para los filtros actuales, en
+    JSON. scripts.js lo pide al filtrar o cambiar de página y sustituye
+    solo el cuerpo de la tabla: los desplegables y el resto de la página
+    no se vuelven a generar.
+    """
+    page = paginate_nonconformities(request, get_filtered_nonconformities(request))
+    context = get_page_context(request, page)
+    response = JsonResponse({
+        'rows': render_to_string('nonconformities/nonconformity_rows_partial.html', context),
+        'pagination': render_to_string('nonconformities/nonconformity_pagination_partial.html', context),
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+@condition(etag_func=lambda request: get_filtered_etag(request, 'export'))
 def export_nonconformities(request):
+    """
+    Exporta a CSV las NC que cumplen los filtros actuales.
+
+    La respuesta se envía en streaming: los primeros bytes salen de
+    inmediato y la memoria no depende del número de filas. Si el cliente
+    envía el ETag de una exportación anterior y nada ha cambiado, se
+    responde 304 sin volver a generar el CSV.
+    """
     nonconformities = get_filtered_nonconformities(request)
+    return export_response(iter_csv(nonconformities))
 
-    # Crear la respuesta HTTP con el contenido CSV
-    response = HttpResponse(content_type='text/csv')
+@login_required
+@require_POST
+def export_job(request):
+    """
+    Encola la exportación con los filtros actuales (en la querystring, como
+    en export_nonconformities) y lleva a la página del trabajo, que muestra
+    el avance y el enlace de descarga al terminar.
+    """
+    job = jobs.enqueue(tasks.EXPORT_TASK, {'filters': request.GET.dict()}, user=request.user)
+    return redirect('core:job_detail', pk=job.pk)
+
+def export_response(rows):
+    response = StreamingHttpResponse(rows, content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="nonconformities.csv"'
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    writer = csv.writer(response)
-    writer.writerow(['Código', 'Fecha Apertura', 'Descripción', 'Severidad', 'Clasificación', 'Estado'])
+@login_required
+def nonconformity_events(request):
+    """
+    Cambios del listado en vivo como Server-Sent Events (ver events.py).
+    Con WSGI cada conexión ocupa un hilo hasta
+    NONCONFORMITY_EVENTS_STREAM_SECONDS; con ASGI se usa la versión
+    asíncrona. Con NONCONFORMITY_LIVE_UPDATES desactivado responde 204,
+    que indica al navegador que no vuelva a conectar (una página abierta
+    antes de desactivarlo).
+    """
+    if not settings.NONCONFORMITY_LIVE_UPDATES:
+        return HttpResponse(status=204)
+    return events_response(events.stream(get_last_event_id(request)))
+
+def get_last_event_id(request):
+    # EventSource envía la cabecera al reconectar; el parámetro permite
+    # reanudar al abrir de nuevo la página
+    return request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+
+def events_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Que los proxies (nginx) no acumulen los eventos en un búfer
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    for nc in nonconformities:
-        writer.writerow([
-            nc.code,
-            nc.creation_date.strftime('%d/%m/%Y'),
-            nc.description,
-            nc.severity.name if nc.severity else '',
-            nc.category.description if nc.category else '',
-            nc.status.description if nc.status else '',
-        ])
+@login_required
+def change_feed(request):
+    """
+    Flujo de cambios para integraciones en JSON Lines (ver feed.py).
 
+    ?cursor= es el de la última línea de la página anterior (sin él se
+    empieza desde el principio) y ?limit= el número de registros, hasta
+    NONCONFORMITY_FEED_MAX_PAGE_SIZE. La página se lee con una consulta
+    por flujo y se envía en streaming.
+    """
+    limit = request.GET.get('limit', '').strip()
+    limit = min(int(limit), settings.NONCONFORMITY_FEED_MAX_PAGE_SIZE) if limit.isdigit() and int(limit) else None
+    try:
+        page = feed.read_page(request.GET.get('cursor') or None, limit)
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'message': 'Cursor no válido'}, status=400)
+    except feed.CursorExpired:
+        # Las bajas posteriores al cursor ya se han purgado
+        return JsonResponse({'success': False, 'message': 'Cursor caducado: sincronice desde el principio'}, status=410)
+
+    response = StreamingHttpResponse(page.iter_lines(), content_type='application/x-ndjson')
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
+@login_required
+def search_nonconformities(request):
+    """
+    Búsqueda por relevancia (bm25) en código, descripción y acciones.
+
+    Devuelve JSON con las mejores coincidencias para sugerencias rápidas.
+    """
+    term = request.GET.get('q', '').strip()
+    ids = search.search(term, limit=20) if term else []
+    rows = Nonconformity.objects.filter(id__in=ids).values('id', 'code', 'description')
+    by_id = {row['id']: row for row in rows} if ids else {}
+
+    results = [
+        {
+            'id': by_id[nc_id]['id'],
+            'code': by_id[nc_id]['code'],
+            'description': by_id[nc_id]['description'][:100],
+        }
+        for nc_id in ids if nc_id in by_id
+    ]
+    return JsonResponse({'results': results})
+
+@login_required
+def dashboard(request):
+    """
+    Panel con el número de NC por estado, área, severidad y clasificación.
+
+    Solo lee la tabla resumen NonconformityCounter; los nombres salen de la
+    caché de tablas auxiliares.
+    """
+    dimensions = (
+        ('status_key', 'Estado', lookups.lookup_cache.by_pk(Status)),
+        ('area_key', 'Área', lookups.lookup_cache.by_pk(Area)),
+        ('severity_key', 'Severidad', lookups.lookup_cache.by_pk(Severity)),
+        ('category_key', 'Clasificación', lookups.lookup_cache.by_pk(Category)),
+    )
+
+    rows = list(
+        NonconformityCounter.objects.filter(count__gt=0)
+        .values_list(*counters.KEY_FIELDS, 'count')
+    )
+
+    def label(names, key):
+        return str(names[key]) if key in names else 'Sin asignar'
+
+    breakdowns = []
+    for index, (field, title, names) in enumerate(dimensions):
+        totals = {}
+        for row in rows:
+            name = label(names, row[index])
+            totals[name] = totals.get(name, 0) + row[4]
+        breakdowns.append({
+            'title': title,
+            'totals': sorted(totals.items(), key=lambda item: (-item[1], item[0])),
+        })
+
+    combinations = sorted(
+        (
+            [label(names, row[index]) for index, (_, _, names) in enumerate(dimensions)] + [row[4]]
+            for row in rows
+        ),
+        key=lambda combination: combination[:4],
+    )
+
+    context = {
+        'total': sum(row[4] for row in rows),
+        'breakdowns': breakdowns,
+        'dimension_titles': [title for _, title, _ in dimensions],
+        'combinations': combinations,
+    }
+    return render(request, 'nonconformities/dashboard.html', context)
+
 @login_required
 def nonconformity_detail(request, pk):
     nonconformity = get_object_or_404(Nonconformity, pk=pk)
     return render(request, 'nonconformities/nonconformity_detail.html', {'nonconformity': nonconformity})
 
+def get_detail_partial_etag(request, pk):
+    """
+    ETag del panel de detalle: versión de la NC (updated_at) más la versión
+    de las tablas auxiliares, que también se muestran en el panel. Se
+    calcula con una consulta sobre la clave primaria y se memoriza en la
+    petición. Devuelve None si la NC no existe.
+    """
+    if not hasattr(request, '_detail_partial_etag'):
+        updated_at = (
+            Nonconformity.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        )
+        request._detail_partial_etag = format_detail_partial_etag(pk, updated_at)
+    return request._detail_partial_etag
+
+def format_detail_partial_etag(pk, updated_at):
+    return f'{pk}-{updated_at.timestamp():.6f}-{lookups.lookup_cache.version()}' if updated_at else None
+
 @login_required
+@condition(etag_func=get_detail_partial_etag)
 def nonconformity_detail_partial(request, pk):
-    nonconformity = get_object_or_404(Nonconformity, pk=pk)
-    # Obtener las líneas de acción relacionadas, ordenadas por fecha de registro
-    action_lines = NonconformityLine.objects.filter(nonconformity=nonconformity).order_by('date')
-
-    # Obtener todos los estados para el dropdown
-    statuses = Status.objects.all()
+    """
+    Panel de detalle que se carga al pulsar una fila.
 
+    El HTML no depende del usuario (el token CSRF lo añade scripts.js), así
+    que se guarda en caché bajo su ETag y se responde 304 si el cliente ya
+    tiene esa versión.
+    """
+    etag = get_detail_partial_etag(request, pk)
+    cache_key = f'nonconformities:detail_partial:{etag}'
+    html = cache.get(cache_key) if etag else None
+
+    if html is None:
+        nonconformity = get_object_or_404(
+            Nonconformity.objects.select_related('status', 'severity', 'area', 'category'), pk=pk
+        )
+        # Solo las acciones más recientes: el coste no depende del historial
+        action_page = get_action_paginator(pk).get_last_page()
+
+        # Estados a los que se puede pasar, desde la máquina de estados en caché
+        html = render_detail_partial(nonconformity, action_page, get_workflow())
+        cache.set(cache_key, html, settings.NONCONFORMITY_PARTIAL_CACHE_TIMEOUT)
+
+    return detail_partial_response(html)
+
+def get_action_paginator(pk):
+    return KeysetPaginator(
+        NonconformityLine.objects.filter(nonconformity_id=pk).select_related('user'),
+        ACTION_HISTORY_ORDERING,
+        settings.NONCONFORMITY_ACTION_PAGE_SIZE,
+    )
+
+def render_detail_partial(nonconformity, action_page, workflow):
     context = {
         'nonconformity': nonconformity,
-        'action_lines': action_lines,
-        'statuses': statuses,
+        'action_page': action_page,
+        'statuses': workflow.next_statuses(nonconformity.status_id),
+        'can_close': workflow.can_close(nonconformity.status_id),
     }
-    return render(request, 'nonconformities/nonconformity_detail_partial.html', context)
+    return render_to_string('nonconformities/nonconformity_detail_partial.html', context)
 
+def detail_partial_response(html):
+    response = HttpResponse(html)
+    # El navegador debe revalidar siempre con If-None-Match
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+@condition(etag_func=get_detail_partial_etag)
+def nonconformity_actions(request, pk):
+    """
+    Página del historial de acciones anterior a ?before=, como fragmento
+    HTML que sustituye al enlace "Cargar acciones anteriores" del panel.
+    Cada página es una consulta sobre el índice del historial, sin importar
+    lo antigua que sea. Tiene el mismo ETag que el panel: solo cambia
+    cuando cambia la NC o sus acciones.
+    """
+    if get_detail_partial_etag(request, pk) is None:
+        raise Http404('No existe la No Conformidad')
+    before = request.GET.get('before')
+    paginator = get_action_paginator(pk)
+    try:
+        action_page = paginator.get_page(before=before) if before else paginator.get_last_page()
+    except InvalidCursor:
+        return HttpResponse('Cursor no válido', status=400)
+    html = render_to_string(
+        'nonconformities/nonconformity_actions_partial.html',
+        {'action_page': action_page, 'nonconformity_id': pk},
+    )
+    return detail_partial_response(html)
+
+
+# Campos que escriben los cambios de estado, el cierre y la reapertura
+STATUS_UPDATE_FIELDS = ('status', 'closure_date', 'updated_at')
+
+def lock_nonconformity(nonconformity):
+    """
+    Relee el estado, el cierre y los campos del contador de la NC con la
+    fila bloqueada hasta el final de la transacción (como bulk._load_rows):
+    la instancia se cargó antes y otra petición puede haberla cambiado.
+    Devuelve la clave del contador actual.
+    """
+    nonconformity.refresh_from_db(
+        fields=['status', 'closure_date', 'area', 'severity', 'category'],
+        from_queryset=Nonconformity.objects.select_for_update(),
+    )
+    return counters.counter_key(nonconformity)
+
+def locked_counter_row(pk, *fields):
+    """
+    Campos del contador de la NC `pk` (más `fields`), leídos con la fila
+    bloqueada.
+    """
+    return (
+        Nonconformity.objects.select_for_update()
+        .values(*counters.SOURCE_FIELDS, *fields)
+        .get(pk=pk)
+    )
+
+def update_closure_date(nonconformity, old_status_id, workflow):
+    """
+    Fija closure_date al entrar en un estado final y la limpia al salir de
+    uno, como bulk.change_status.
+    """
+    if workflow.is_terminal(nonconformity.status_id):
+        if not nonconformity.closure_date:
+            nonconformity.closure_date = timezone.now()
+    elif workflow.is_terminal(old_status_id):
+        nonconformity.closure_date = None
 
 @login_required
 def change_status(request, pk):
@@ -109,30 +563,39 @@ def change_status(request, pk):
         new_status_id = request.POST.get('status')
 
         if new_status_id:
-            try:
-                new_status = Status.objects.get(id=new_status_id)
-                old_status = nonconformity.status
-
-                nonconformity.status = new_status
-
-                # Si el nuevo estado es "Cerrada" y no tiene closure_date, establecerla
-                if new_status.description.lower() in ['cerrada', 'cerrado', 'closed']:
-                    if not nonconformity.closure_date:
-                        nonconformity.closure_date = timezone.now()
-
-                # Si el estado deja de ser "Cerrada", limpiar closure_date
-                elif old_status and old_status.description.lower() in ['cerrada', 'cerrado', 'closed']:
-                    nonconformity.closure_date = None
-
-                nonconformity.save()
-
-                # Crear una línea de acción automática registrando el cambio
-                NonconformityLine.objects.create(
-                    nonconformity=nonconformity,
-                    action_description=f"Estado cambiado de '{old_status}' a '{new_status}'",
-                    user=request.user
-                )
+            workflow = get_workflow()
+            new_status = workflow.get(int(new_status_id)) if new_status_id.isdigit() else None
 
+            if new_status is None:
+                messages.error(request, 'Estado no válido')
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    return JsonResponse({'success': False, 'message': 'Estado no válido'}, status=400)
+                return redirect('nonconformities:nonconformity_detail', pk=pk)
+
+            with transaction.atomic():
+                old_key = lock_nonconformity(nonconformity)
+                old_status = workflow.get(nonconformity.status_id)
+                allowed = workflow.can_transition(nonconformity.status_id, new_status.pk)
+                if allowed:
+                    nonconformity.status = new_status
+                    update_closure_date(nonconformity, old_status and old_status.pk, workflow)
+                    nonconformity.save(update_fields=STATUS_UPDATE_FIELDS)
+
+                    # Crear una línea de acción automática registrando el cambio
+                    NonconformityLine.objects.create(
+                        nonconformity=nonconformity,
+                        action_description=f"Estado cambiado de '{old_status}' a '{new_status}'",
+                        user=request.user
+                    )
+
+                    counters.record_change(old_key, nonconformity)
+
+            if not allowed:
+                message = f'No se permite pasar de "{old_status}" a "{new_status}"'
+                messages.error(request, message)
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    return JsonResponse({'success': False, 'message': message}, status=400)
+            else:
                 messages.success(request, f'Estado actualizado a "{new_status}"')
 
                 # Si es AJAX, devolver JSON
@@ -143,11 +606,6 @@ def change_status(request, pk):
                         'new_status': new_status.description,
                         'closure_date': nonconformity.closure_date.strftime('%d/%m/%Y') if nonconformity.closure_date else None
                     })
-
-            except Status.DoesNotExist:
-                messages.error(request, 'Estado no válido')
-                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return JsonResponse({'success': False, 'message': 'Estado no válido'}, status=400)
         else:
             messages.error(request, 'Debe seleccionar un estado')
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -169,39 +627,51 @@ def close_nonconformity(request, pk):
         messages.warning(request, 'Esta no conformidad ya está cerrada.')
         return redirect('nonconformities:nonconformity_detail', pk=pk)
 
+    # El cierre respeta las transiciones configuradas
+    workflow = get_workflow()
+    if not workflow.can_close(nonconformity.status_id):
+        messages.error(
+            request,
+            f'No se permite cerrar una no conformidad en estado "{workflow.get(nonconformity.status_id)}".'
+        )
+        return redirect('nonconformities:nonconformity_detail', pk=pk)
+
     if request.method == 'POST':
         form = NonconformityCloseForm(request.POST)
 
         if form.is_valid():
-            # Establecer fecha de cierre
-            nonconformity.closure_date = timezone.now()
-
-            # Buscar estado "Cerrada" y asignarlo
-            try:
-                closed_status = Status.objects.filter(
-                    description__icontains='cerrad'
-                ).first()
-
+            with transaction.atomic():
+                old_key = lock_nonconformity(nonconformity)
+                # Otra petición puede haberla cerrado o cambiado de estado
+                if nonconformity.closure_date or not workflow.can_close(nonconformity.status_id):
+                    messages.warning(request, 'La no conformidad ha cambiado y ya no se puede cerrar.')
+                    return redirect('nonconformities:nonconformity_detail', pk=pk)
+
+                # Establecer fecha de cierre
+                nonconformity.closure_date = timezone.now()
+
+                # Asignar el estado final configurado en el flujo
+                closed_status = workflow.closing
                 if closed_status:
                     nonconformity.status = closed_status
                 else:
-                    messages.warning(request, 'No se encontró el estado "Cerrada". Actualice manualmente.')
-            except:
-                pass
+                    messages.warning(request, 'No hay ningún estado final configurado. Actualice manualmente.')
+
+                nonconformity.save(update_fields=STATUS_UPDATE_FIELDS)
 
-            nonconformity.save()
+                # Registrar acción de cierre
+                closing_comment = form.cleaned_data.get('closing_comment', '')
+                action_text = 'No conformidad cerrada.'
+                if closing_comment:
+                    action_text += f' Comentario: {closing_comment}'
 
-            # Registrar acción de cierre
-            closing_comment = form.cleaned_data.get('closing_comment', '')
-            action_text = 'No conformidad cerrada.'
-            if closing_comment:
-                action_text += f' Comentario: {closing_comment}'
+                NonconformityLine.objects.create(
+                    nonconformity=nonconformity,
+                    action_description=action_text,
+                    user=request.user
+                )
 
-            NonconformityLine.objects.create(
-                nonconformity=nonconformity,
-                action_description=action_text,
-                user=request.user
-            )
+                counters.record_change(old_key, nonconformity)
 
             messages.success(request, f'No conformidad {nonconformity.code} cerrada exitosamente.')
             return redirect('nonconformities:nonconformity_detail', pk=pk)
@@ -223,37 +693,96 @@ def reopen_nonconformity(request, pk):
     nonconformity = get_object_or_404(Nonconformity, pk=pk)
 
     if request.method == 'POST':
-        if not nonconformity.closure_date:
-            messages.warning(request, 'Esta no conformidad no está cerrada.')
-        else:
-            # Limpiar fecha de cierre
-            nonconformity.closure_date = None
-
-            # Cambiar a estado "Abierta"
-            try:
-                open_status = Status.objects.filter(
-                    description__icontains='abierta'
-                ).first()
-
+        with transaction.atomic():
+            old_key = lock_nonconformity(nonconformity)
+            reopened = bool(nonconformity.closure_date)
+            if reopened:
+                # Limpiar fecha de cierre
+                nonconformity.closure_date = None
+
+                # Cambiar al estado de reapertura configurado en el flujo
+                open_status = get_workflow().reopen_target
                 if open_status:
                     nonconformity.status = open_status
-            except:
-                pass
 
-            nonconformity.save()
+                nonconformity.save(update_fields=STATUS_UPDATE_FIELDS)
 
-            # Registrar acción
-            NonconformityLine.objects.create(
-                nonconformity=nonconformity,
-                action_description='No conformidad reabierta.',
-                user=request.user
-            )
+                # Registrar acción
+                NonconformityLine.objects.create(
+                    nonconformity=nonconformity,
+                    action_description='No conformidad reabierta.',
+                    user=request.user
+                )
 
+                counters.record_change(old_key, nonconformity)
+
+        if reopened:
             messages.success(request, f'No conformidad {nonconformity.code} reabierta.')
+        else:
+            messages.warning(request, 'Esta no conformidad no está cerrada.')
 
     return redirect('nonconformities:nonconformity_detail', pk=pk)
 
 
+@login_required
+@require_POST
+def bulk_change_status(request):
+    """
+    Cambia el estado o cierra varias NC a la vez (?action=status|close).
+
+    Todas se procesan en una sola transacción con un UPDATE y un
+    bulk_create (ver bulk.py). Con AJAX devuelve el resultado de cada NC;
+    si no, un resumen en mensajes y vuelta al listado.
+    """
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    ids = bulk.parse_ids(request.POST.getlist('ids'))
+    action = request.POST.get('action', 'status')
+
+    error = None
+    if not ids:
+        error = 'Debe seleccionar al menos una no conformidad'
+    elif action == 'close':
+        form = NonconformityCloseForm(request.POST)
+        if form.is_valid():
+            results = bulk.close(ids, request.user, form.cleaned_data.get('closing_comment', ''))
+        else:
+            error = next(iter(form.errors.values()))[0]
+    elif action == 'status':
+        status_id = request.POST.get('status', '')
+        new_status = get_workflow().get(int(status_id)) if status_id.isdigit() else None
+        if new_status is None:
+            error = 'Estado no válido'
+        else:
+            results = bulk.change_status(ids, new_status, request.user)
+    else:
+        error = 'Acción no válida'
+
+    if error:
+        if is_ajax:
+            return JsonResponse({'success': False, 'message': error}, status=400)
+        messages.error(request, error)
+    else:
+        totals = bulk.summarize(results)
+        message = (
+            f"{totals[bulk.UPDATED]} actualizadas, {totals[bulk.UNCHANGED]} sin cambios, "
+            f"{totals[bulk.ERROR]} con errores"
+        )
+        if is_ajax:
+            return JsonResponse({'success': True, 'message': message, 'totals': totals, 'results': results})
+        if totals[bulk.ERROR]:
+            messages.warning(request, message)
+            for result in results:
+                if result['result'] == bulk.ERROR:
+                    messages.error(request, f"{result['code'] or result['id']}: {result['message']}")
+        else:
+            messages.success(request, message)
+
+    next_url = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse('nonconformities:nonconformity_list')
+    return redirect(next_url)
+
+
 @login_required
 def add_action(request, pk):
     """
@@ -311,7 +840,8 @@ def create_nonconformity(request):
     Crea una nueva No Conformidad desde el frontend.
 
     Formulario completo con validaciones:
-    - Código único
+    - Código único (restricción nc_code_unique); vacío, se asigna el
+      siguiente de su área y año (codes.py)
     - Campos requeridos
     - Usuario creador automático
     """
@@ -325,34 +855,41 @@ def create_nonconformity(request):
             # Asignar el usuario creador
             nonconformity.user = request.user
 
-            # Si no tiene estado, asignar "Abierta" por defecto
-            if not nonconformity.status:
-                try:
-                    default_status = Status.objects.filter(
-                        description__icontains='abierta'
-                    ).first()
-                    if default_status:
-                        nonconformity.status = default_status
-                except:
-                    pass
-
-            # Guardar la NC
-            nonconformity.save()
-
-            # Crear línea de acción automática de creación
-            NonconformityLine.objects.create(
-                nonconformity=nonconformity,
-                action_description=f'No conformidad creada por {request.user.username}',
-                user=request.user
-            )
-
-            messages.success(
-                request,
-                f'No conformidad {nonconformity.code} creada exitosamente.'
-            )
-
-            # Redirigir al detalle de la NC recién creada
-            return redirect('nonconformities:nonconformity_detail', pk=nonconformity.pk)
+            # Si no tiene estado, asignar el estado inicial del flujo
+            if not nonconformity.status_id:
+                nonconformity.status = get_workflow().initial
+
+            try:
+                with transaction.atomic():
+                    if nonconformity.code:
+                        # Un código manual con el formato automático adelanta su secuencia
+                        codes.observe([nonconformity.code])
+                    else:
+                        nonconformity.code = codes.allocator.allocate(nonconformity.area)
+
+                    # Guardar la NC
+                    nonconformity.save()
+
+                    # Crear línea de acción automática de creación
+                    NonconformityLine.objects.create(
+                        nonconformity=nonconformity,
+                        action_description=f'No conformidad creada por {request.user.username}',
+                        user=request.user
+                    )
+
+                    counters.record_created(nonconformity)
+            except IntegrityError as exc:
+                if not codes.is_code_conflict(exc):
+                    raise
+                form.add_code_conflict_error()
+            else:
+                messages.success(
+                    request,
+                    f'No conformidad {nonconformity.code} creada exitosamente.'
+                )
+
+                # Redirigir al detalle de la NC recién creada
+                return redirect('nonconformities:nonconformity_detail', pk=nonconformity.pk)
     else:
         form = NonconformityForm()
 
@@ -371,6 +908,9 @@ def update_nonconformity(request, pk):
     - Usuario creador
     - Fecha de creación
     - Closure_date (se gestiona con el botón "Cerrar")
+
+    Un cambio de estado sigue el flujo igual que change_status: se rechazan
+    las transiciones no permitidas y closure_date se fija o se limpia.
     """
     nonconformity = get_object_or_404(Nonconformity, pk=pk)
 
@@ -378,22 +918,54 @@ def update_nonconformity(request, pk):
         form = NonconformityForm(request.POST, instance=nonconformity)
 
         if form.is_valid():
-            # Guardar los cambios
-            updated_nc = form.save()
-
-            # Registrar la edición en el historial
-            NonconformityLine.objects.create(
-                nonconformity=updated_nc,
-                action_description=f'No conformidad editada por {request.user.username}',
-                user=request.user
-            )
-
-            messages.success(
-                request,
-                f'No conformidad {updated_nc.code} actualizada exitosamente.'
-            )
-
-            return redirect('nonconformities:nonconformity_detail', pk=pk)
+            try:
+                with transaction.atomic():
+                    # La clave del contador y el estado de partida se leen de la
+                    # fila bloqueada, no de la instancia (la validación la
+                    # modifica y puede estar desfasada)
+                    locked = locked_counter_row(pk, 'closure_date')
+                    updated_nc = form.save(commit=False)
+                    update_fields = [*form.changed_data, 'updated_at']
+
+                    if 'status' in form.changed_data:
+                        workflow = get_workflow()
+                        if not workflow.can_transition(locked['status_id'], updated_nc.status_id):
+                            old_status = workflow.get(locked['status_id'])
+                            form.add_error(
+                                'status', f'No se permite pasar de "{old_status}" a "{updated_nc.status}"'
+                            )
+                        else:
+                            updated_nc.closure_date = locked['closure_date']
+                            update_closure_date(updated_nc, locked['status_id'], workflow)
+                            update_fields.append('closure_date')
+
+                    if not form.errors:
+                        if 'code' in form.changed_data:
+                            codes.observe([form.cleaned_data['code']])
+
+                        # Guardar solo los campos editados, sin pisar cambios simultáneos
+                        updated_nc.save(update_fields=update_fields)
+
+                        # Registrar la edición en el historial
+                        NonconformityLine.objects.create(
+                            nonconformity=updated_nc,
+                            action_description=f'No conformidad editada por {request.user.username}',
+                            user=request.user
+                        )
+
+                        counters.record_change(counters.counter_key(locked), locked_counter_row(pk))
+            except IntegrityError as exc:
+                if not codes.is_code_conflict(exc):
+                    raise
+                form.add_code_conflict_error()
+            else:
+                if not form.errors:
+                    messages.success(
+                        request,
+                        f'No conformidad {updated_nc.code} actualizada exitosamente.'
+                    )
+
+                    return redirect('nonconformities:nonconformity_detail', pk=pk)
     else:
         form = NonconformityForm(instance=nonconformity)
 
@@ -0,0 +1,70 @@
+"""
+Máquina de estados de las No Conformidades.
+
+Se construye una sola vez por versión de la caché de tablas auxiliares a
+partir de los papeles declarados en `Status` (inicial, final, destino al
+reabrir) y de sus transiciones permitidas, de modo que los cambios de
+estado no necesitan consultas ni comparaciones de texto.
+"""
+from .lookups import lookup_cache
+from .models import Status
+
+
+class Workflow:
+    """Estados y transiciones permitidas, resueltos en memoria."""
+
+    def __init__(self, statuses, transitions):
+        self.statuses = {status.pk: status for status in statuses}
+        self.initial = next((s for s in statuses if s.is_initial), None)
+        self.reopen_target = next((s for s in statuses if s.is_reopen_target), None)
+        self.terminal_ids = frozenset(s.pk for s in statuses if s.is_terminal)
+        # Primer estado final: el que usa la acción "Cerrar NC"
+        self.closing = next((s for s in statuses if s.is_terminal), None)
+        self.transitions = {
+            from_id: frozenset(to_ids) for from_id, to_ids in transitions.items()
+        }
+
+    def get(self, status_id):
+        return self.statuses.get(status_id)
+
+    def is_terminal(self, status_id):
+        return status_id in self.terminal_ids
+
+    def can_transition(self, from_id, to_id):
+        """
+        Un estado sin transiciones configuradas permite ir a cualquier otro;
+        una NC sin estado puede pasar a cualquiera.
+        """
+        if to_id not in self.statuses:
+            return False
+        if from_id is None or from_id == to_id or from_id not in self.transitions:
+            return True
+        return to_id in self.transitions[from_id]
+
+    def can_close(self, from_id):
+        """
+        ¿Se puede cerrar una NC en `from_id`? Cerrar es pasar al estado de
+        cierre y respeta las mismas transiciones; sin estado final
+        configurado solo se fija la fecha de cierre y siempre se permite.
+        """
+        return self.closing is None or self.can_transition(from_id, self.closing.pk)
+
+    def next_statuses(self, from_id):
+        """Estados elegibles desde `from_id` (incluido el actual), por pk."""
+        return [
+            status for status in self.statuses.values()
+            if self.can_transition(from_id, status.pk)
+        ]
+
+
+def _build_workflow():
+    transitions = {}
+    through = Status.allowed_next.through.objects.values_list('from_status_id', 'to_status_id')
+    for from_id, to_id in through:
+        transitions.setdefault(from_id, set()).add(to_id)
+    return Workflow(lookup_cache.all(Status), transitions)
+
+
+def get_workflow():
+    """Máquina de estados vigente (se reconstruye al invalidar la caché)."""
+    return lookup_cache.derived('workflow', _build_workflow)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quality.settings')
+# Vistas asíncronas para el listado, la exportación y el panel de detalle
+os.environ.setdefault('NONCONFORMITY_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
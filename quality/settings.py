@@ -51,6 +51,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.RequestProfilingMiddleware',
+    # Debe ir la última (ver core/middleware.py)
+    'core.middleware.RequestInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'quality.urls'
@@ -82,28 +85,83 @@ WSGI_APPLICATION = 'quality.wsgi.application'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 #
 # SQLite optimizado para producción (10 lectores + 4 escritores concurrentes)
-# - WAL mode: permite lecturas/escrituras simultáneas sin bloqueos
+# - Conexiones persistentes (CONN_MAX_AGE) con comprobación de salud: los
+#   PRAGMAs se aplican una vez por conexión y no en cada petición
+# - transaction_mode IMMEDIATE: las transacciones toman el bloqueo de
+#   escritura al empezar, así un escritor espera su turno (timeout) en lugar
+#   de fallar al intentar promocionar un bloqueo de lectura
 # - Timeout 20s: evita errores "database is locked"
-# - Cache 64MB: acelera consultas frecuentes
+# - PRAGMAs en SQLITE_PRAGMAS, aplicados al abrir cada conexión (core/db.py)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-        'timeout': 20,
-        # NOTA: init_command no es válido para SQLite en Django
-        # Los PRAGMAs de SQLite deben configurarse usando señales o middleware
-        # 'OPTIONS': {
-        #     'init_command': (
-        #         "PRAGMA journal_mode=WAL; "
-        #         "PRAGMA busy_timeout=20000; "
-        #         "PRAGMA synchronous=NORMAL; "
-        #         "PRAGMA cache_size=-64000; "
-        #         "PRAGMA temp_store=MEMORY;"
-        #     ),
-        # },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Mismo fichero abierto en solo lectura para las consultas de lectura
+    # (ver core/routers.py). query_only impide cualquier escritura aunque
+    # algo la intente; journal_mode lo fija la conexión principal.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{BASE_DIR / "db.sqlite3"}?mode=ro',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'PRAGMAS': {
+            'journal_mode': None,
+            'query_only': 'ON',
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Perfil de PRAGMAs de cada conexión SQLite. Un alias de DATABASES puede
+# añadir o anular valores con su clave 'PRAGMAS'; None omite el PRAGMA.
+# - WAL: los lectores no bloquean al escritor ni al revés
+# - synchronous NORMAL: seguro con WAL y sin fsync en cada transacción
+# - Cache 64MB y mmap 256MB: acelera consultas frecuentes
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 20000,
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+# Caché
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# Caché en disco compartida por todos los procesos del servidor: guarda la
+# versión de las tablas auxiliares (ver nonconformities/lookups.py) para que
+# su invalidación llegue a todos los workers sin consultar la base de datos.
+# Los tests usan una caché en memoria propia (quality/test_runner.py) para
+# no pisar la del servidor.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
     }
 }
 
+# Segundos durante los que un proceso reutiliza la versión de las tablas
+# auxiliares sin volver a leerla de disco
+NONCONFORMITY_LOOKUP_VERSION_TTL = 1
+
+TEST_RUNNER = 'quality.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -158,6 +216,109 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Paginación por cursor del listado de No Conformidades
+NONCONFORMITY_PAGE_SIZE = 50
+NONCONFORMITY_PAGE_SIZES = (25, 50, 100, 200)
+
+# Filas leídas del cursor por bloque en la exportación CSV en streaming
+NONCONFORMITY_EXPORT_CHUNK_SIZE = 2000
+
+# Registros por lote (y por transacción) en la importación masiva
+NONCONFORMITY_IMPORT_BATCH_SIZE = 1000
+
+# Segundos que se conserva en caché cada versión del panel de detalle
+NONCONFORMITY_PARTIAL_CACHE_TIMEOUT = 60 * 60
+
+# Códigos automáticos de NC (nonconformities/codes.py): cifras del número
+# y números que reserva cada proceso de una vez (1: sin bloques, numeración
+# correlativa; más reduce la contención entre procesos pero deja huecos)
+NONCONFORMITY_CODE_DIGITS = 3
+NONCONFORMITY_CODE_BLOCK_SIZE = 1
+
+# Acciones por página en el historial del panel de detalle
+NONCONFORMITY_ACTION_PAGE_SIZE = 20
+
+# Incluir las descripciones de las acciones en el índice de búsqueda FTS5
+# (solo las usa la búsqueda general; el filtro del listado mira la descripción)
+NONCONFORMITY_SEARCH_INCLUDE_ACTIONS = True
+
+# Cambios en vivo del listado por Server-Sent Events (nonconformities/events.py):
+# eventos que se conservan para los clientes que se reconectan, NC a partir
+# de las que se pide recargar las filas en lugar de enviarlas, segundos
+# entre comentarios de mantenimiento, duración máxima de cada conexión
+# (con WSGI ocupa un hilo) y espera del navegador antes de reconectar
+NONCONFORMITY_EVENTS_BUFFER = 500
+NONCONFORMITY_EVENTS_MAX_ROWS = 100
+NONCONFORMITY_EVENTS_KEEPALIVE = 15
+NONCONFORMITY_EVENTS_STREAM_SECONDS = 300
+NONCONFORMITY_EVENTS_RETRY_MS = 3000
+
+# Flujo de cambios en JSON Lines (nonconformities/feed.py): registros por
+# página por defecto y máximo, antigüedad mínima de un cambio para
+# entregarlo (una transacción larga puede confirmar cambios con fechas
+# anteriores a otros ya leídos) y días que se conservan las bajas
+NONCONFORMITY_FEED_PAGE_SIZE = 500
+NONCONFORMITY_FEED_MAX_PAGE_SIZE = 5000
+NONCONFORMITY_FEED_LAG_SECONDS = 5
+NONCONFORMITY_FEED_TOMBSTONE_DAYS = 30
+
+# Servir listado, exportación y panel de detalle con las vistas asíncronas
+# (nonconformities/async_views.py). quality/asgi.py lo activa; con WSGI se
+# usan las vistas síncronas.
+NONCONFORMITY_ASYNC_VIEWS = os.environ.get('NONCONFORMITY_ASYNC_VIEWS') == '1'
+
+# Cambios en vivo en el listado (nonconformities/events.py). Con WSGI cada
+# página abierta ocuparía un hilo con su conexión, así que por defecto solo
+# se activan con las vistas asíncronas; sin ellos el listado no se suscribe
+NONCONFORMITY_LIVE_UPDATES = os.environ.get(
+    'NONCONFORMITY_LIVE_UPDATES', '1' if NONCONFORMITY_ASYNC_VIEWS else '0'
+) == '1'
+
+# Medición de peticiones (core/middleware.py): cabecera Server-Timing, log
+# de peticiones lentas y percentiles por URL en /core/metrics/ (staff).
+# Desactivada no tiene ningún coste.
+REQUEST_INSTRUMENTATION = False
+# Milisegundos a partir de los que una petición se registra como lenta
+REQUEST_INSTRUMENTATION_SLOW_MS = 500
+# Consultas más lentas que se incluyen en el log de una petición lenta
+REQUEST_INSTRUMENTATION_TOP_QUERIES = 5
+# Peticiones por URL sobre las que se calculan los percentiles
+REQUEST_INSTRUMENTATION_WINDOW = 500
+
+# Perfilado bajo demanda para usuarios staff con ?_profile=1 o la cabecera
+# X-Profile (core/profiling.py); los perfiles se listan en /core/profiles/
+REQUEST_PROFILING = True
+# Directorio de los ficheros .prof y cuántos se conservan
+REQUEST_PROFILING_DIR = BASE_DIR / 'profiles'
+REQUEST_PROFILING_MAX_FILES = 50
+# Perfiladores que se pueden pedir por nombre (?_profile=sample)
+REQUEST_PROFILING_PROFILERS = {
+    'cprofile': 'core.profiling.CProfileProfiler',
+    'sample': 'core.profiling.SamplingProfiler',
+}
+# Segundos entre muestras del perfilador estadístico
+REQUEST_PROFILING_SAMPLE_INTERVAL = 0.005
+
+# Ficheros generados por la aplicación (resultados de trabajos)
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Cola de trabajos en segundo plano sobre la base de datos (core/jobs.py),
+# ejecutada con el comando run_jobs: procesos por defecto, segundos entre
+# consultas a la cola vacía, segundos de reserva de un trabajo en curso sin
+# noticias de su proceso (después otro lo retoma), intentos, espera antes
+# del primer reintento (se duplica en cada uno), directorio de los ficheros
+# de resultado y días que se conservan los trabajos acabados
+JOBS_PROCESSES = 2
+JOBS_POLL_INTERVAL = 1
+JOBS_VISIBILITY_TIMEOUT = 300
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_DELAY = 30
+JOBS_RESULT_DIR = MEDIA_ROOT / 'jobs'
+JOBS_KEEP_DAYS = 7
+
+# Filas entre cada aviso de avance de la exportación en segundo plano
+NONCONFORMITY_EXPORT_PROGRESS_EVERY = 5000
+
 # Configuración de autenticación
 LOGIN_URL = 'accounts:login'  # Nombre de la ruta de inicio de sesión
 LOGIN_REDIRECT_URL = 'nonconformities:nonconformity_list'  # Redirección después de iniciar sesión
@@ -25,4 +25,5 @@ urlpatterns = [
     path('accounts/', include('accounts.urls', namespace='accounts')),
     path('accounts/', include('django.contrib.auth.urls')),  # Incluye las URLs de autenticación
     path('nonconformities/', include('nonconformities.urls', namespace='nonconformities')),
+    path('core/', include('core.urls', namespace='core')),
 ]
@@ -1,45 +1,432 @@
 // Esperar a que el DOM esté cargado
 document.addEventListener('DOMContentLoaded', function() {
-    // Agregar event listener a las filas de la tabla
-    document.querySelectorAll('.nonconformity-row').forEach(function(row) {
-        row.addEventListener('click', function() {
-            var nonconformityId = this.getAttribute('data-id');
+    // Un único listener en el cuerpo de la tabla: sigue funcionando cuando
+    // las filas se sustituyen al filtrar
+    var rowsBody = document.getElementById('nonconformity-rows');
+    if (rowsBody) {
+        rowsBody.addEventListener('click', function(event) {
+            // Marcar la casilla de selección no abre el detalle
+            if (event.target.classList.contains('bulk-select')) {
+                return;
+            }
+            var row = event.target.closest('.nonconformity-row');
+            if (!row) {
+                return;
+            }
+            var nonconformityId = row.getAttribute('data-id');
             // Llamar a la función para cargar los detalles
             loadNonconformityDetail(nonconformityId);
             // Actualizar la selección en la tabla
-            updateSelectedRow(this);
+            updateSelectedRow(row);
         });
+    }
+
+    initFilterForm();
+    initBulkActions();
+    initLiveUpdates();
+});
+
+// Milisegundos sin escribir antes de filtrar por código o descripción
+var FILTER_DEBOUNCE_MS = 300;
+
+// Vuelve a pedir las filas con los filtros actuales (ver initFilterForm)
+var reloadRows = function() {
+    window.location.reload();
+};
+
+// Vuelve a pedir la página de filas que se está viendo (ver initFilterForm)
+var refreshRows = function() {
+    window.location.reload();
+};
+
+// Filtrado y paginación sin recargar la página: se piden solo las filas
+// y los enlaces de paginación (vista nonconformity_rows) y se sustituyen
+// en la tabla. Una petición nueva cancela la anterior si no ha terminado.
+function initFilterForm() {
+    var filterForm = document.getElementById('filter-form');
+    if (!filterForm) {
+        return;
+    }
+    var rowsUrl = filterForm.getAttribute('data-rows-url');
+    var timer = null;
+    var controller = null;
+
+    function filterQuery() {
+        // FormData solo incluye los campos del formulario de filtrado (las
+        // casillas de la tabla pertenecen al de acciones masivas)
+        var params = new URLSearchParams();
+        new FormData(filterForm).forEach(function(value, key) {
+            if (value !== '') {
+                params.append(key, value);
+            }
+        });
+        return params.toString();
+    }
+
+    function loadRows(query, fallbackUrl) {
+        clearTimeout(timer);
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+
+        fetch(rowsUrl + '?' + query, {
+            signal: controller.signal,
+            headers: {'X-Requested-With': 'XMLHttpRequest'}
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            return response.json();
+        })
+        .then(data => {
+            document.getElementById('nonconformity-rows').innerHTML = data.rows;
+            document.getElementById('pagination-links').innerHTML = data.pagination;
+            // La dirección, la exportación y la vuelta tras una acción
+            // masiva conservan los filtros actuales
+            history.replaceState(null, '', '?' + query);
+            document.getElementById('export-link').search = query;
+            var exportJobForm = document.getElementById('export-job-form');
+            exportJobForm.action = exportJobForm.action.split('?')[0] + '?' + query;
+            document.getElementById('bulk-next').value = window.location.pathname + window.location.search;
+            refreshBulkActions();
+        })
+        .catch(error => {
+            if (error.name === 'AbortError') {
+                return;
+            }
+            // Sin el fragmento, cargar la página completa
+            window.location.href = fallbackUrl || '?' + query;
+        });
+    }
+
+    function filterNow() {
+        loadRows(filterQuery());
+    }
+    reloadRows = filterNow;
+    refreshRows = function() {
+        loadRows(window.location.search.slice(1));
+    };
+
+    filterForm.addEventListener('input', function(event) {
+        if (event.target.form !== filterForm || event.target.type !== 'text') {
+            return;
+        }
+        // Texto: esperar a que se deje de escribir
+        clearTimeout(timer);
+        timer = setTimeout(filterNow, FILTER_DEBOUNCE_MS);
     });
 
-    // Agregar event listener al formulario de filtrado
+    filterForm.addEventListener('change', function(event) {
+        // Las casillas de selección están dentro de la tabla pero
+        // pertenecen al formulario de acciones masivas; el texto ya se
+        // filtra con el evento input
+        if (event.target.form !== filterForm || event.target.type === 'text') {
+            return;
+        }
+        filterNow();
+    });
+
+    filterForm.addEventListener('keydown', function(event) {
+        if (event.key === 'Enter' && event.target.form === filterForm) {
+            // Enter filtra al momento, sin enviar el formulario
+            event.preventDefault();
+            filterNow();
+        }
+    });
+
+    document.getElementById('pagination-links').addEventListener('click', function(event) {
+        var link = event.target.closest('a');
+        if (!link) {
+            return;
+        }
+        event.preventDefault();
+        loadRows(link.search.slice(1), link.href);
+    });
+}
+
+// Cambios en vivo (vista nonconformity_events, Server-Sent Events): el
+// servidor envía las filas de las NC que han cambiado y aquí se sustituyen
+// solo esas filas y el panel de detalle si es el de una de ellas. La
+// dirección lleva ?last_event_id= con la posición al generar la página y, al
+// reconectar, EventSource envía Last-Event-ID: no se pierde ningún cambio.
+// Solo hay data-events-url si el servidor tiene activados los cambios en vivo.
+function initLiveUpdates() {
     var filterForm = document.getElementById('filter-form');
-    if (filterForm) {
-        filterForm.addEventListener('change', function() {
-            filterForm.submit();
+    var eventsUrl = filterForm && filterForm.getAttribute('data-events-url');
+    if (!eventsUrl || !window.EventSource) {
+        return;
+    }
+    var rowsBody = document.getElementById('nonconformity-rows');
+    var source = new EventSource(eventsUrl);
+
+    function findRow(nonconformityId) {
+        return rowsBody.querySelector('.nonconformity-row[data-id="' + nonconformityId + '"]');
+    }
+
+    source.addEventListener('change', function(event) {
+        var data = JSON.parse(event.data);
+        if (hasServerOnlyFilters()) {
+            // No se puede saber aquí si las filas cumplen los filtros:
+            // se vuelve a pedir la página actual
+            data.rows.forEach(function(change) {
+                if (String(change.id) === openDetailId) {
+                    loadNonconformityDetail(openDetailId);
+                }
+            });
+            refreshRows();
+            return;
+        }
+        var notShown = false;
+        data.rows.forEach(function(change) {
+            var row = findRow(change.id);
+            if (row) {
+                if (matchesFilters(change)) {
+                    replaceRow(row, change.row);
+                } else {
+                    row.remove();
+                }
+            } else if (matchesFilters(change)) {
+                // Nueva o que ahora cumple los filtros: su posición depende
+                // del orden del listado, se ofrece recargar las filas
+                notShown = true;
+            }
+            if (String(change.id) === openDetailId) {
+                loadNonconformityDetail(openDetailId);
+            }
         });
+        data.deleted.forEach(function(nonconformityId) {
+            var row = findRow(nonconformityId);
+            if (row) {
+                row.remove();
+            }
+        });
+        if (notShown) {
+            showRowsNotice();
+        }
+        refreshBulkActions();
+    });
+
+    // Demasiados cambios, o eventos perdidos: recargar las filas
+    source.addEventListener('reset', showRowsNotice);
+
+    document.getElementById('rows-notice').addEventListener('click', function() {
+        this.hidden = true;
+        reloadRows();
+    });
+}
+
+// Filtros que solo se pueden aplicar en el servidor (código, descripción y
+// fecha de apertura)
+function hasServerOnlyFilters() {
+    var params = new URLSearchParams(window.location.search);
+    return ['code', 'description', 'creation_date'].some(function(name) {
+        return params.get(name);
+    });
+}
+
+// Solo se pueden comprobar en el cliente los filtros por identificador
+function matchesFilters(change) {
+    var params = new URLSearchParams(window.location.search);
+    return ['status', 'severity', 'category', 'area'].every(function(name) {
+        var value = params.get(name);
+        return !value || value === String(change[name]);
+    });
+}
+
+function replaceRow(row, html) {
+    var template = document.createElement('template');
+    template.innerHTML = html;
+    var updated = template.content.firstElementChild;
+    // Conservar la selección para acciones masivas y la fila marcada
+    var checkbox = row.querySelector('.bulk-select');
+    if (checkbox && checkbox.checked) {
+        updated.querySelector('.bulk-select').checked = true;
     }
-});
+    if (row.classList.contains('selected')) {
+        updated.classList.add('selected');
+    }
+    row.replaceWith(updated);
+}
+
+function showRowsNotice() {
+    document.getElementById('rows-notice').hidden = false;
+}
+
+// Acciones masivas: habilitar el botón según la selección y mostrar solo
+// los campos de la acción elegida
+function initBulkActions() {
+    var bulkForm = document.getElementById('bulk-form');
+    if (!bulkForm) {
+        return;
+    }
+    var selectAll = document.getElementById('bulk-select-all');
+
+    selectAll.addEventListener('change', function() {
+        document.querySelectorAll('.bulk-select').forEach(function(checkbox) {
+            checkbox.checked = selectAll.checked;
+        });
+        refreshBulkActions();
+    });
+    // Delegado: las casillas se sustituyen junto con las filas al filtrar
+    document.addEventListener('change', function(event) {
+        if (event.target.classList.contains('bulk-select')) {
+            refreshBulkActions();
+        }
+    });
+    document.getElementById('bulk-action').addEventListener('change', refreshBulkActions);
+    refreshBulkActions();
+}
+
+function refreshBulkActions() {
+    var submit = document.getElementById('bulk-submit');
+    if (!submit) {
+        return;
+    }
+    var checkboxes = document.querySelectorAll('.bulk-select');
+    var action = document.getElementById('bulk-action');
+    var selected = Array.prototype.filter.call(checkboxes, function(checkbox) {
+        return checkbox.checked;
+    }).length;
+    submit.disabled = selected === 0;
+    submit.textContent = selected ? 'Aplicar (' + selected + ')' : 'Aplicar';
+    document.getElementById('bulk-select-all').checked = selected > 0 && selected === checkboxes.length;
+    document.getElementById('bulk-status').style.display = action.value === 'status' ? '' : 'none';
+    document.getElementById('bulk-close-fields').style.display = action.value === 'close' ? '' : 'none';
+}
+
+// Caché LRU de paneles de detalle: id -> {etag, html}. Map conserva el
+// orden de inserción, así que la primera clave es la menos usada.
+var DETAIL_CACHE_SIZE = 20;
+var detailCache = new Map();
+
+// NC cuyo panel de detalle se ha abierto por última vez
+var openDetailId = null;
+
+function rememberDetail(nonconformityId, etag, html) {
+    detailCache.delete(nonconformityId);
+    detailCache.set(nonconformityId, {etag: etag, html: html});
+    if (detailCache.size > DETAIL_CACHE_SIZE) {
+        detailCache.delete(detailCache.keys().next().value);
+    }
+}
+
+function getCookie(name) {
+    var match = document.cookie.match(new RegExp('(?:^|; )' + name + '=([^;]*)'));
+    return match ? decodeURIComponent(match[1]) : null;
+}
+
+// El panel se sirve desde caché para todos los usuarios, sin token CSRF:
+// se añade aquí a cada formulario POST a partir de la cookie
+function addCsrfTokens(container) {
+    var token = getCookie('csrftoken');
+    if (!token) {
+        return;
+    }
+    container.querySelectorAll('form[method="post"]').forEach(function(form) {
+        if (!form.querySelector('input[name="csrfmiddlewaretoken"]')) {
+            var input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = 'csrfmiddlewaretoken';
+            input.value = token;
+            form.appendChild(input);
+        }
+    });
+}
 
 function loadNonconformityDetail(nonconformityId) {
-    fetch('/nonconformities/detail/partial/' + nonconformityId + '/')
-    .then(response => response.text())
+    openDetailId = String(nonconformityId);
+    var cached = detailCache.get(nonconformityId);
+    var headers = {};
+    if (cached) {
+        // Revalidar: si no ha cambiado, el servidor responde 304 sin cuerpo
+        headers['If-None-Match'] = cached.etag;
+    }
+
+    fetch('/nonconformities/detail/partial/' + nonconformityId + '/', {
+        headers: headers,
+        cache: 'no-store'
+    })
+    .then(response => {
+        if (response.status === 304 && cached) {
+            rememberDetail(nonconformityId, cached.etag, cached.html);
+            return cached.html;
+        }
+        return response.text().then(function(html) {
+            var etag = response.headers.get('ETag');
+            if (response.ok && etag) {
+                rememberDetail(nonconformityId, etag, html);
+            }
+            return html;
+        });
+    })
     .then(data => {
         var isSmallScreen = window.matchMedia("(max-width: 767px)").matches;
+        var container;
         if (isSmallScreen) {
             // Pantalla pequeña: mostrar modal
             var modal = document.getElementById('detail-modal');
-            var modalContent = document.getElementById('modal-content');
-            modalContent.innerHTML = data;
+            container = document.getElementById('modal-content');
+            container.innerHTML = data;
             modal.style.display = 'block';
             document.body.style.overflow = 'hidden'; // Evitar scroll en el fondo
         } else {
             // Pantalla grande: cargar detalle en el panel lateral
-            var panel = document.getElementById('detail-panel');
-            panel.innerHTML = data;
+            container = document.getElementById('detail-panel');
+            container.innerHTML = data;
         }
+        addCsrfTokens(container);
+        initOlderActions(container);
     });
 }
 
+// Historial de acciones del panel: al llegar al final de la lista (o al
+// pulsar el botón) se pide la página anterior a la vista
+// nonconformity_actions, que sustituye al propio elemento con las acciones
+// y, si quedan más, con un nuevo elemento para seguir cargando.
+function initOlderActions(container) {
+    var older = container.querySelector('.older-actions');
+    if (!older) {
+        return;
+    }
+    var button = older.querySelector('button');
+    var observer = null;
+
+    function loadOlder() {
+        if (observer) {
+            observer.disconnect();
+        }
+        button.disabled = true;
+        fetch(older.getAttribute('data-url'))
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('HTTP ' + response.status);
+            }
+            return response.text();
+        })
+        .then(html => {
+            older.outerHTML = html;
+            initOlderActions(container);
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            // Se puede reintentar con el botón
+            button.disabled = false;
+        });
+    }
+
+    button.addEventListener('click', loadOlder);
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(function(entries) {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadOlder();
+            }
+        });
+        observer.observe(older);
+    }
+}
+
 function updateSelectedRow(selectedRow) {
     // Remover la clase 'selected' de cualquier fila previamente seleccionada
     var previouslySelected = document.querySelector('.nonconformity-row.selected');
@@ -80,31 +467,3 @@ document.addEventListener('keydown', function(event) {
     }
 });
 
-
-// Esperar a que el DOM esté cargado
-document.addEventListener('DOMContentLoaded', function() {
-    // Agregar event listener a las filas de la tabla
-    document.querySelectorAll('.nonconformity-row').forEach(function(row) {
-        row.addEventListener('click', function() {
-            var nonconformityId = this.getAttribute('data-id');
-            loadNonconformityDetail(nonconformityId);
-            updateSelectedRow(this);
-        });
-    });
-
-    // Agregar event listener al formulario de filtrado
-    var filterForm = document.getElementById('filter-form');
-    if (filterForm) {
-        // Agregar event listener a los inputs y selects dentro del formulario
-        filterForm.querySelectorAll('input, select').forEach(function(input) {
-            input.addEventListener('keydown', function(event) {
-                if (event.key === 'Enter') {
-                    event.preventDefault(); // Prevenir el comportamiento por defecto
-                    filterForm.submit();
-                }
-            });
-        });
-    }
-});
-
-// ... Resto del código existente ...